@@ -14,7 +14,7 @@ document.addEventListener('DOMContentLoaded', function(){
       if(!data || !data.length){ logsDiv.innerHTML = '<em>No logs found</em>'; return; }
       const html = data.map(item => {
         return `<div style="margin-bottom:12px">
-                  <div><strong>${escapeHtml(item.timestamp || '')} — ${escapeHtml(item.model || '')}</strong></div>
+                  <div><strong>${escapeHtml(item.timestamp || '')} — ${escapeHtml(item.model || '')}</strong>${item.tokens_before != null ? ` <span class="small">(${item.tokens_before} → ${item.tokens_after} tokens)</span>` : ''}</div>
                   <div class="small">input: ${escapeHtml((item.input_snippet||'').slice(0,200))}</div>
                   <pre>${escapeHtml(JSON.stringify(item.parsed || item.raw_response || {}, null, 2))}</pre>
                 </div>`;
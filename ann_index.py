@@ -0,0 +1,284 @@
+import os
+import json
+import argparse
+from time import time
+from datetime import datetime
+
+import numpy as np
+
+import index_store
+
+# Dense retrieval over LSA embeddings of the TF-IDF index (see similarity.py,
+# SIMILARITY_MODE=ann). Bump FORMAT_VERSION when the artifact layout changes.
+FORMAT_VERSION = 2
+ANN_DIR = os.path.join(os.path.dirname(index_store.INDEX_DIR), f"lsa-v{FORMAT_VERSION}")
+
+# Tunables (override via environment)
+ANN_DIM = int(os.environ.get("ANN_DIM", "128"))                   # embedding size
+ANN_LISTS = int(os.environ.get("ANN_LISTS", "0"))                 # IVF lists; 0 = 4 * sqrt(rows)
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))              # lists scanned per query: recall vs speed
+ANN_RERANK = int(os.environ.get("ANN_RERANK", "50"))              # candidates re-scored exactly
+ANN_TRAIN_ROWS = int(os.environ.get("ANN_TRAIN_ROWS", "100000"))  # sample for SVD and k-means
+ANN_MAX_FEATURES = int(os.environ.get("ANN_MAX_FEATURES", "100000"))
+ANN_MIN_ROWS = 1000     # below this brute force is already fast
+
+BLOCK_ROWS = 20000
+KMEANS_ITERATIONS = 12
+
+
+def _remap(X, col_map, n_cols):
+    """
+    Keep only the mapped columns of CSR X, renumbered to 0..n_cols-1.
+    """
+    from scipy.sparse import csr_matrix
+    cols = col_map[X.indices]
+    keep = cols >= 0
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))[keep]
+    indptr = np.zeros(X.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=X.shape[0]), out=indptr[1:])
+    return csr_matrix((X.data[keep], cols[keep], indptr), shape=(X.shape[0], n_cols))
+
+
+def _normalize_rows(E):
+    norms = np.linalg.norm(E, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return E / norms
+
+
+def _nearest(E, centroids):
+    """
+    Index of the most similar centroid for each row, in blocks.
+    """
+    out = np.empty(E.shape[0], dtype=np.int32)
+    for start in range(0, E.shape[0], BLOCK_ROWS):
+        out[start:start + BLOCK_ROWS] = np.argmax(E[start:start + BLOCK_ROWS] @ centroids.T, axis=1)
+    return out
+
+
+def _sparse_dots(rows, q_indices, q_data):
+    """
+    Dot product of each CSR row with one sparse query given as sorted
+    (indices, data); avoids transposing a query with 2**20 columns.
+    """
+    if len(q_indices) == 0 or rows.nnz == 0:
+        return np.zeros(rows.shape[0], dtype=np.float32)
+    pos = np.minimum(np.searchsorted(q_indices, rows.indices), len(q_indices) - 1)
+    hits = np.where(q_indices[pos] == rows.indices, rows.data * q_data[pos], 0)
+    row_of = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+    return np.bincount(row_of, weights=hits, minlength=rows.shape[0])
+
+
+def _spherical_kmeans(E, n_lists, rng, iterations=KMEANS_ITERATIONS):
+    """
+    Lloyd's iterations on unit vectors (cosine). Empty lists are re-seeded
+    with random points.
+    """
+    centroids = E[rng.choice(E.shape[0], n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(E, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, E)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = E[rng.choice(E.shape[0], int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+class AnnIndex:
+    """
+    IVF index over l2-normalised LSA embeddings. search() scans the nprobe
+    lists closest to each query, keeps the best `rerank` candidates by
+    embedding cosine and re-scores those exactly against the sparse TF-IDF
+    rows, so returned similarities are the same numbers exact mode reports.
+    """
+
+    def __init__(self, components, col_map, centroids, list_offsets, list_ids, vectors, meta):
+        self.components = components            # (active features x dim)
+        self.col_map = col_map                  # hashed feature -> components row, -1 if unused
+        self.centroids = centroids              # (lists x dim)
+        self.list_offsets = list_offsets        # (lists + 1); list l is rows [off[l], off[l+1])
+        self.list_ids = list_ids                # original row id for each position
+        self.vectors = vectors                  # embeddings in list order (mmap)
+        self.meta = meta
+
+    def embed(self, X):
+        E = _remap(X, self.col_map, self.components.shape[0]) @ self.components
+        return _normalize_rows(np.asarray(E, dtype=np.float32))
+
+    def search(self, queries, matrix, top_k, nprobe=None, rerank=None):
+        """
+        queries: l2-normalised TF-IDF rows (same transform as `matrix`).
+        Returns (indices, scores) per query, best first, like _top_k_batch.
+        """
+        nprobe = min(nprobe or ANN_NPROBE, len(self.centroids))
+        rerank = max(rerank or ANN_RERANK, top_k)
+        queries = queries.tocsr()
+        queries.sort_indices()
+        E = self.embed(queries)
+        probes = np.argpartition(-(E @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        out_idx, out_sims = [], []
+        for qi in range(E.shape[0]):
+            spans = [np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in probes[qi]]
+            positions = np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+            if positions.size == 0:
+                out_idx.append([])
+                out_sims.append([])
+                continue
+            approx = self.vectors[positions] @ E[qi]
+            if positions.size > rerank:
+                keep = np.argpartition(-approx, rerank - 1)[:rerank]
+                positions = positions[keep]
+            candidates = np.sort(np.asarray(self.list_ids[positions], dtype=np.int64))
+            # Exact cosine on the sparse rows of the candidates only
+            q_row = slice(queries.indptr[qi], queries.indptr[qi + 1])
+            exact = _sparse_dots(matrix[candidates], queries.indices[q_row], queries.data[q_row])
+            order = np.argsort(-exact, kind='stable')[:top_k]
+            out_idx.append(candidates[order].tolist())
+            out_sims.append(exact[order].tolist())
+        return out_idx, out_sims
+
+
+def _source_marker(tfidf_meta):
+    return {k: tfidf_meta.get(k) for k in ('built_at', 'shape', 'nnz')}
+
+
+def build(matrix, tfidf_meta, ann_dir=ANN_DIR, dim=ANN_DIM, n_lists=ANN_LISTS,
+          train_rows=ANN_TRAIN_ROWS, max_features=ANN_MAX_FEATURES, seed=0):
+    """
+    Fit LSA (TruncatedSVD) and IVF centroids on a row sample of the TF-IDF
+    matrix, embed all rows in blocks and write the artifact (built in a new
+    generation directory and published atomically, see index_store.publish).
+    Returns the meta dict, or None when the corpus is too small to benefit.
+    """
+    n_rows, n_features = matrix.shape
+    if n_rows < ANN_MIN_ROWS:
+        print(f"ANN index skipped: {n_rows} rows (< {ANN_MIN_ROWS}), exact search is fast enough")
+        return None
+    started = time()
+    rng = np.random.default_rng(seed)
+
+    # Only the most frequent features get an LSA column; keeps components small.
+    df = np.bincount(np.asarray(matrix.indices), minlength=n_features)
+    feature_ids = np.flatnonzero(df)
+    if len(feature_ids) > max_features:
+        feature_ids = np.sort(feature_ids[np.argsort(-df[feature_ids], kind='stable')[:max_features]])
+    feature_ids = feature_ids.astype(np.int32)
+    col_map = np.full(n_features, -1, dtype=np.int32)
+    col_map[feature_ids] = np.arange(len(feature_ids), dtype=np.int32)
+
+    sample = np.sort(rng.choice(n_rows, min(train_rows, n_rows), replace=False))
+    X_sample = _remap(matrix[sample], col_map, len(feature_ids))
+    dim = max(2, min(dim, len(feature_ids) - 1, len(sample) - 1))
+    from sklearn.decomposition import TruncatedSVD
+    svd = TruncatedSVD(n_components=dim, algorithm='randomized', n_iter=5, random_state=seed)
+    E_sample = _normalize_rows(svd.fit_transform(X_sample).astype(np.float32))
+    components = svd.components_.T.astype(np.float32)
+    print(f"LSA: {dim} dims over {len(feature_ids)} features, "
+          f"explained variance {svd.explained_variance_ratio_.sum():.3f} ({time() - started:.1f}s)")
+
+    n_lists = n_lists or int(4 * np.sqrt(n_rows))
+    n_lists = max(1, min(n_lists, len(sample) // 4))
+    centroids = _spherical_kmeans(E_sample, n_lists, rng)
+
+    def embed_block(start):
+        block = _remap(matrix[start:start + BLOCK_ROWS], col_map, len(feature_ids))
+        return _normalize_rows(np.asarray(block @ components, dtype=np.float32))
+
+    # Assign every row to a list, then embed the rows again and write each one
+    # straight to its slot in list order: no n_rows x dim array is ever held.
+    assign = np.empty(n_rows, dtype=np.int32)
+    for start in range(0, n_rows, BLOCK_ROWS):
+        E = embed_block(start)
+        assign[start:start + len(E)] = _nearest(E, centroids)
+    order = np.argsort(assign, kind='stable')
+    list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assign, minlength=n_lists), out=list_offsets[1:])
+    slot = np.empty(n_rows, dtype=np.int64)
+    slot[order] = np.arange(n_rows)
+    del assign
+
+    gen_dir = index_store.new_generation(ann_dir)
+    np.save(os.path.join(gen_dir, 'components.npy'), components)
+    np.save(os.path.join(gen_dir, 'col_map.npy'), col_map)
+    np.save(os.path.join(gen_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(gen_dir, 'list_offsets.npy'), list_offsets)
+    order.astype(np.int64).tofile(os.path.join(gen_dir, 'list_ids.bin'))
+    del order
+    vectors = np.memmap(os.path.join(gen_dir, 'vectors.bin'), dtype=np.float32, mode='w+', shape=(n_rows, dim))
+    for start in range(0, n_rows, BLOCK_ROWS):
+        E = embed_block(start)
+        vectors[slot[start:start + len(E)]] = E
+    vectors.flush()
+    del vectors
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'built_at': datetime.now().isoformat(),
+        'source': _source_marker(tfidf_meta),
+        'rows': n_rows,
+        'n_features': n_features,
+        'dim': dim,
+        'lists': n_lists,
+        'explained_variance': float(svd.explained_variance_ratio_.sum())
+    }
+    with open(os.path.join(gen_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    index_store.publish(gen_dir, ann_dir)
+    print(f"Saved ANN index ({n_rows} rows, {n_lists} lists) to {ann_dir} in {time() - started:.1f}s")
+    return meta
+
+
+def read_meta(ann_dir=ANN_DIR):
+    try:
+        with open(os.path.join(ann_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def is_fresh(meta, tfidf_meta):
+    """
+    True when the artifact was built from this exact TF-IDF artifact.
+    """
+    return bool(meta) and meta.get('format_version') == FORMAT_VERSION \
+        and meta.get('source') == _source_marker(tfidf_meta)
+
+
+def load(ann_dir=ANN_DIR):
+    """
+    Every array is memory-mapped, so workers forked after a preload (or
+    loading the same artifact) share the pages instead of holding copies.
+    """
+    # Resolved once, so a build published meanwhile cannot mix two generations.
+    ann_dir = os.path.realpath(ann_dir)
+    meta = read_meta(ann_dir)
+    if meta is None:
+        raise FileNotFoundError(f"No ANN artifact in {ann_dir}")
+    vectors = np.memmap(os.path.join(ann_dir, 'vectors.bin'), dtype=np.float32, mode='r',
+                        shape=(meta['rows'], meta['dim']))
+    list_ids = np.memmap(os.path.join(ann_dir, 'list_ids.bin'), dtype=np.int64, mode='r')
+    return AnnIndex(
+        np.load(os.path.join(ann_dir, 'components.npy'), mmap_mode='r'),
+        np.load(os.path.join(ann_dir, 'col_map.npy'), mmap_mode='r'),
+        np.load(os.path.join(ann_dir, 'centroids.npy'), mmap_mode='r'),
+        np.load(os.path.join(ann_dir, 'list_offsets.npy'), mmap_mode='r'),
+        list_ids,
+        vectors,
+        meta
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the LSA/IVF index from the TF-IDF index artifact.")
+    parser.add_argument('--index-dir', default=index_store.INDEX_DIR, help="TF-IDF artifact to read")
+    parser.add_argument('--out', default=ANN_DIR)
+    parser.add_argument('--dim', type=int, default=ANN_DIM)
+    parser.add_argument('--lists', type=int, default=ANN_LISTS, help="IVF lists (0 = 4 * sqrt(rows))")
+    parser.add_argument('--force', action='store_true', help="rebuild even if the artifact is fresh")
+    args = parser.parse_args()
+    _, tfidf_matrix, _, tfidf_meta = index_store.load_index(args.index_dir)
+    if not args.force and is_fresh(read_meta(args.out), tfidf_meta):
+        print("ANN index is up to date:", args.out)
+    else:
+        build(tfidf_matrix, tfidf_meta, args.out, dim=args.dim, n_lists=args.lists)
@@ -1,17 +1,28 @@
 import os
+import threading
+import importlib
 from datetime import datetime
 from functools import wraps
-from time import time
-from flask import Flask, request, jsonify, render_template, send_file, Response
+from time import time, monotonic, perf_counter
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, TimeoutError as FuturesTimeout
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context, g
 from flask_cors import CORS
-from similarity import find_similar_tickets, recommend_articles
-import pandas as pd
-import PyPDF2
+from similarity import (find_similar_tickets, recommend_articles, add_kb_article,
+                        find_similar_tickets_batch, recommend_articles_batch, ingest_ticket)
 import json
 import html
 
-from llm_classifier import classify_text
-from similarity import find_similar_tickets
+from llm_classifier import classify_text, classify_rules_batch, _rule_based
+from append_log import AppendLog
+import storage
+import metrics
+import text_extract
+import index_store
+import dedup
+import memory_report
+import similarity
+import local_classifier
+import kb_jobs
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 # or simply: app = Flask(__name__)
@@ -21,9 +32,46 @@ CORS(app)
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
-FEEDBACK_CSV = os.path.join(DATA_DIR, "feedback.csv")
+
+# Buffered writers: each batch becomes one SQLite transaction
+_feedback_log = AppendLog(sink=storage.add_feedback)
+_gap_log = AppendLog(sink=storage.add_content_gaps)
 
 ALLOWED_EXTENSIONS = {'txt', 'csv', 'pdf'}
+MAX_BATCH_TICKETS = int(os.environ.get("MAX_BATCH_TICKETS", "1000"))
+ROWS_CHUNK_SIZE = int(os.environ.get("ROWS_CHUNK_SIZE", "500"))
+
+# Columns used as ticket text in per-row CSV mode (same names prepare_dataset looks for)
+ROW_SUBJECT_COLUMNS = ['subject', 'title', 'title_text', 'ticket_subject']
+ROW_BODY_COLUMNS = ['text', 'body', 'description', 'ticket_body']
+
+# Per-request latency budget for the concurrent /analyze stages (seconds)
+ANALYZE_BUDGET_SECONDS = float(os.environ.get("ANALYZE_BUDGET_SECONDS", "10"))
+# Deadline for all LLM classifications of one /analyze_batch request (use_llm)
+BATCH_LLM_BUDGET_SECONDS = float(os.environ.get("BATCH_LLM_BUDGET_SECONDS", "30"))
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", "16"))
+_stage_executor = None
+_stage_executor_pid = None
+
+# Hot-path instrumentation (see metrics.py; METRICS_ENABLED=0 disables)
+STAGE_HELP = "Wall time of each /analyze stage in seconds"
+_STAGE_SECONDS = metrics.histogram('stage_seconds', STAGE_HELP)
+_REQUEST_SECONDS = metrics.histogram('http_request_seconds', "HTTP request latency in seconds by endpoint")
+_PARTIAL_STAGES = metrics.counter('analyze_partial_stages_total', "Stages that missed the /analyze latency budget")
+_CONTENT_GAPS = metrics.counter('content_gaps_total', "Tickets logged as content gaps (no KB article)")
+
+# "lazy": each worker loads the indexes on its first request. "preload": load
+# them, the dedup history and the local model at import, which under gunicorn's
+# preload_app (gunicorn.conf.py) is once in the master, so all workers share
+# those pages. "warm": load them
+# (and import pandas, scikit-learn, ...) in a background thread once the port
+# is bound, see warm_up(); until then requests load whatever they need.
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "lazy").lower()
+# Imported lazily by the modules that use them; warm_up() pulls them in early.
+WARM_UP_MODULES = ['pandas', 'scipy.sparse', 'sklearn.feature_extraction.text', 'sklearn.linear_model',
+                   'pyarrow.parquet', 'PyPDF2', 'requests']
+_warm_state = {'pid': None, 'done': False, 'seconds': None, 'error': None}
+_warm_lock = threading.Lock()
 
 # Admin credentials (override via environment)
 ADMIN_USER = os.environ.get("ADMIN_USER", "admin")
@@ -48,116 +96,483 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def generate_kb_article_from_text(text):
-    prompt = f"""
-    You are a support knowledge-base writer.
-    Write a clear support article to solve this issue:
-
-    Issue:
-    {text}
-
-    Respond in JSON with fields:
-    - title
-    - content (full detailed solution)
-    """
-
     try:
-        result = classify_text(prompt)  # using your existing LLM wrapper
-        return {
-            "title": result.get("title", "Support Article"),
-            "content": result.get("content", "")
-        }
-    except:
+        return kb_jobs.generate_article(text)
+    except Exception as e:
+        print("KB article generation failed:", e)
         return None
 
 def extract_text(file):
     ext = file.filename.rsplit('.', 1)[1].lower()
-    file.stream.seek(0)
-    if ext == 'txt':
-        return file.read().decode('utf-8', errors='ignore')
-    elif ext == 'csv':
-        try:
-            df_local = pd.read_csv(file)
-            return " ".join(df_local.astype(str).values.flatten())
-        except Exception:
-            file.stream.seek(0)
-            return file.read().decode('utf-8', errors='ignore')
-    elif ext == 'pdf':
-        try:
-            reader = PyPDF2.PdfReader(file)
-            texts = []
-            for page in reader.pages:
-                t = page.extract_text()
-                if t:
-                    texts.append(t)
-            return " ".join(texts)
-        except Exception:
-            file.stream.seek(0)
-            return file.read().decode('utf-8', errors='ignore')
-    return None
+    with metrics.timer('stage_seconds', STAGE_HELP, stage=f'extract_{ext}'):
+        return text_extract.extract_text(file, ext)
+
+def _log_content_gap(text):
+    _CONTENT_GAPS.inc()
+    _gap_log.append({
+        "timestamp": datetime.now().isoformat(),
+        "ticket_excerpt": text[:200]
+    })
+
+def _get_stage_executor():
+    # Created lazily and per pid: threads do not survive a gunicorn fork.
+    global _stage_executor, _stage_executor_pid
+    if _stage_executor is None or _stage_executor_pid != os.getpid():
+        _stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+        _stage_executor_pid = os.getpid()
+    return _stage_executor
+
+def _timed(fn, stage):
+    start = monotonic()
+    try:
+        result = fn()
+    except Exception as e:
+        result = e
+    elapsed = monotonic() - start
+    _STAGE_SECONDS.observe(elapsed, stage=stage)
+    return result, round(elapsed * 1000, 1)
+
+def _time_left(deadline):
+    """
+    Seconds until the monotonic `deadline` (0 once it has passed).
+    """
+    return max(0.0, deadline - monotonic())
+
+def _run_stages(stages, budget):
+    """
+    Run {name: callable} concurrently and wait at most `budget` seconds.
+    Returns (results, timings_ms, partial): results of stages that finished
+    (an exception object if one raised), their wall times, and the names of
+    stages that missed the budget (left running in the background, so stages
+    that can block should bound themselves by the same budget).
+    """
+    started = monotonic()
+    executor = _get_stage_executor()
+    futures = {name: executor.submit(_timed, fn, name) for name, fn in stages.items()}
+    wait(futures.values(), timeout=budget)
+    results, timings, partial = {}, {}, []
+    for name, future in futures.items():
+        if future.done():
+            results[name], timings[name] = future.result()
+        else:
+            partial.append(name)
+            _PARTIAL_STAGES.inc(stage=name)
+            timings[name] = round((monotonic() - started) * 1000, 1)
+    return results, timings, partial
+
+def _classify_batch_llm(texts, budget):
+    """
+    classify_text for every non-empty text, concurrently on the stage pool
+    (llm_pool still bounds and rate-limits the LLM calls). Texts whose
+    classification misses the `budget` get the rule-based result.
+    """
+    deadline = monotonic() + budget
+    executor = _get_stage_executor()
+    futures = [executor.submit(lambda t=t: classify_text(t, deadline_seconds=_time_left(deadline))) if t else None
+               for t in texts]
+    wait([f for f in futures if f is not None], timeout=budget)
+    classifications = []
+    for text, future in zip(texts, futures):
+        if future is None:
+            classifications.append({})
+        elif future.done() and future.exception() is None:
+            classifications.append(future.result())
+        else:
+            future.cancel()
+            _PARTIAL_STAGES.inc(stage='batch_classify')
+            classifications.append(dict(_rule_based(text), fallback='rule_based'))
+    return classifications
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        _REQUEST_SECONDS.observe(perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                                 status=response.status_code)
+    return response
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/analyze', methods=['POST'])
-def analyze_file():
+@app.route('/healthz')
+def healthz():
+    # Cheap liveness check: no index, model or heavy import is touched
+    return jsonify({'status': 'ok', 'startup_mode': STARTUP_MODE,
+                    'warm': {k: v for k, v in _warm_state.items() if k != 'pid'}})
+
+def _uploaded_file():
+    """
+    Validate the upload of /analyze, /analyze/stream and /analyze_rows.
+    Returns (file, None) or (None, error_response).
+    """
     if 'file' not in request.files:
-        return jsonify({'error': 'No file uploaded'}), 400
+        return None, (jsonify({'error': 'No file uploaded'}), 400)
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return None, (jsonify({'error': 'No file selected'}), 400)
     if not allowed_file(file.filename):
-        return jsonify({'error': 'Unsupported file type'}), 400
+        return None, (jsonify({'error': 'Unsupported file type'}), 400)
+    return file, None
 
+def _recent_duplicate(combined_text, timings):
+    """
+    Near-duplicate check shared by /analyze and /analyze/stream. Returns
+    (signature, duplicate, response): response is the stored analysis of a
+    recent near-copy, updated for this upload, or None when the ticket still
+    has to be analyzed. Pass signature and duplicate on to _finish_analysis().
+    """
+    dedup_start = monotonic()
+    signature, duplicate = dedup.lookup(combined_text)
+    timings['dedup'] = round((monotonic() - dedup_start) * 1000, 3)
+    if not duplicate or duplicate['source'] != 'recent':
+        return signature, duplicate, None
+    stored = duplicate['analysis']
+    response = dict(stored)
+    response.update({
+        'uploaded_ticket': combined_text[:1000],
+        'analyzed_at': datetime.now().isoformat(),
+        'partial': [],
+        'timings_ms': timings,
+        'dedup': {'hit': True, 'similarity': duplicate['similarity'],
+                  'original_analyzed_at': stored.get('analyzed_at')}
+    })
+    if len(response.get('recommended_articles') or []) == 0:
+        _log_content_gap(combined_text)
+    return signature, duplicate, response
+
+def _analysis_response(combined_text, llm_result, similar, articles, partial, timings):
+    """
+    The /analyze response body for a fresh analysis (also what dedup stores).
+    """
+    # ✅ Final structured response
+    response = {
+        'uploaded_ticket': combined_text[:1000],
+        'analyzed_at': datetime.now().isoformat(),
+        'llm_result': llm_result,
+        'similar_tickets': similar,
+        'recommended_articles': articles,
+        'partial': partial,
+        'timings_ms': timings
+    }
+
+    # ✅ Add convenience top-level fields
+    if isinstance(llm_result, dict):
+        for k in ['category', 'tags', 'suggested_priority', 'solution', 'confidence']:
+            if k in llm_result:
+                response[k] = llm_result[k]
+    return response
+
+def _finish_analysis(combined_text, signature, duplicate, response):
+    """
+    After a fresh analysis: make the ticket searchable under its final
+    category, keep complete analyses for later near-duplicates and point
+    at a matching history ticket, if any.
+    """
+    # Searchable by later tickets once the background indexer picks it up
+    ingest_ticket(combined_text, response.get('category', ''))
+
+    # Only complete analyses are reused for later near-duplicates
+    llm_result = response['llm_result']
+    if not response['partial'] and isinstance(llm_result, dict) and 'error' not in llm_result:
+        dedup.remember(signature, dict(response))
+    if duplicate:
+        # A near-copy of a historical ticket: no stored analysis, just point at it
+        response['dedup'] = {'hit': False, 'history_ticket_id': duplicate['id'],
+                             'similarity': duplicate['similarity']}
+    return response
+
+@app.route('/analyze', methods=['POST'])
+def analyze_file():
+    file, error = _uploaded_file()
+    if error:
+        return error
+
+    started = monotonic()
     text = extract_text(file)
     if not text or not text.strip():
         return jsonify({'error': 'Could not read text from file'}), 400
 
     combined_text = text.strip()
-    llm_result = {}
-    try:
-        llm_result = classify_text(combined_text)
-    except Exception as e:
-        llm_result = {'error': f'LLM error: {str(e)}'}
+    timings = {'extract': round((monotonic() - started) * 1000, 1)}
+
+    # Near-duplicate of a recent ticket: answer with its stored analysis
+    signature, duplicate, response = _recent_duplicate(combined_text, timings)
+    if response is not None:
+        return jsonify(response)
+
+    # Independent stages run concurrently; whatever misses the budget is partial.
+    # The LLM call gets only what is left of the budget, so it never outlives it.
+    deadline = monotonic() + ANALYZE_BUDGET_SECONDS
+    results, stage_timings, partial = _run_stages({
+        'classify': lambda: classify_text(combined_text, deadline_seconds=_time_left(deadline)),
+        'similar': lambda: find_similar_tickets(combined_text, top_k=3),
+        'articles': lambda: recommend_articles(combined_text, top_k=3),
+    }, ANALYZE_BUDGET_SECONDS)
+    timings.update(stage_timings)
+
+    llm_result = results.get('classify', {})
+    if 'classify' in partial:
+        llm_result = dict(_rule_based(combined_text), fallback='rule_based')
+    elif isinstance(llm_result, Exception):
+        llm_result = {'error': f'LLM error: {str(llm_result)}'}
 
     # add similarity if available and not already provided by llm_result
-    similar = []
-    if not isinstance(llm_result, dict) or 'similar_tickets' not in llm_result:
-        similar = find_similar_tickets(combined_text, top_k=3)
-    else:
+    if isinstance(llm_result, dict) and 'similar_tickets' in llm_result:
         similar = llm_result.get('similar_tickets', [])
+    else:
+        similar = results.get('similar', [])
+        if isinstance(similar, Exception):
+            similar = []
 
     # ✅ Always recommend articles (must not be inside if/else)
-    articles = recommend_articles(combined_text, top_k=3)
-
-    # ✅ Content Gap Logging
-    GAP_LOG = os.path.join(DATA_DIR, "content_gaps.csv")
-    if len(articles) == 0:
-        gap_entry = pd.DataFrame([{
-            "timestamp": datetime.now().isoformat(),
-            "ticket_excerpt": combined_text[:200]
-        }])
-        if not os.path.exists(GAP_LOG):
-            gap_entry.to_csv(GAP_LOG, index=False)
+    articles = results.get('articles', [])
+    if isinstance(articles, Exception):
+        articles = []
+
+    # ✅ Content Gap Logging (only when the KB lookup actually ran)
+    if 'articles' not in partial and len(articles) == 0:
+        _log_content_gap(combined_text)
+
+    response = _analysis_response(combined_text, llm_result, similar, articles, partial, timings)
+    return jsonify(_finish_analysis(combined_text, signature, duplicate, response))
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Server-Sent Events variant of /analyze. Events, each as soon as it is ready:
+    extracting (progress while a long file is read) -> extracted -> rule_based
+    -> similar_tickets / recommended_articles / llm_result (in completion order)
+    -> done (timings + stages that missed the budget, and the dedup note).
+    A recent near-duplicate skips rule_based and replays its stored
+    llm_result, similar_tickets and recommended_articles instead.
+    """
+    file, error = _uploaded_file()
+    if error:
+        return error
+
+    started = monotonic()
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    pieces = text_extract.iter_text(file, ext)
+    # Read up to the first non-blank piece here so unreadable files still get a 400
+    head = []
+    for piece in pieces:
+        head.append(piece)
+        if piece.strip():
+            break
+    if not "".join(head).strip():
+        pieces.close()
+        return jsonify({'error': 'Could not read text from file'}), 400
+
+    def generate():
+        # The rest of a long document streams in while the client already shows progress
+        parts = list(head)
+        chars = sum(len(p) for p in parts)
+        for piece in pieces:
+            parts.append(piece)
+            chars += len(piece)
+            yield _sse('extracting', {'chars': chars})
+        combined_text = "".join(parts).strip()
+        extract_seconds = monotonic() - started
+        _STAGE_SECONDS.observe(extract_seconds, stage=f'extract_{ext}')
+        timings = {'extract': round(extract_seconds * 1000, 1)}
+
+        signature, duplicate, stored = _recent_duplicate(combined_text, timings)
+        if stored is not None:
+            yield _sse('extracted', {
+                'uploaded_ticket': combined_text[:1000],
+                'chars': len(combined_text),
+                'analyzed_at': stored['analyzed_at']
+            })
+            for name in ('llm_result', 'similar_tickets', 'recommended_articles'):
+                yield _sse(name, stored[name])
+            yield _sse('done', {'partial': [], 'timings_ms': timings, 'dedup': stored['dedup']})
+            return
+
+        deadline = started + ANALYZE_BUDGET_SECONDS
+        executor = _get_stage_executor()
+        # Submit the slow stages first so they overlap with everything below
+        futures = {
+            executor.submit(_timed, lambda: classify_text(combined_text, deadline_seconds=_time_left(deadline)),
+                            'classify'): 'llm_result',
+            executor.submit(_timed, lambda: find_similar_tickets(combined_text, top_k=3), 'similar'): 'similar_tickets',
+            executor.submit(_timed, lambda: recommend_articles(combined_text, top_k=3), 'articles'): 'recommended_articles',
+        }
+        yield _sse('extracted', {
+            'uploaded_ticket': combined_text[:1000],
+            'chars': len(combined_text),
+            'analyzed_at': datetime.now().isoformat()
+        })
+
+        rule_start = monotonic()
+        rule_result = _rule_based(combined_text)
+        timings['rule_based'] = round((monotonic() - rule_start) * 1000, 1)
+        yield _sse('rule_based', rule_result)
+
+        partial = []
+        results = {}
+        try:
+            for future in as_completed(futures, timeout=_time_left(deadline)):
+                name = futures[future]
+                result, timings[name] = future.result()
+                if isinstance(result, Exception):
+                    result = {'error': f'LLM error: {str(result)}'} if name == 'llm_result' else []
+                if name == 'recommended_articles' and len(result) == 0:
+                    _log_content_gap(combined_text)
+                results[name] = result
+                yield _sse(name, result)
+        except FuturesTimeout:
+            for future, name in futures.items():
+                if not future.done():
+                    partial.append(name)
+                    _PARTIAL_STAGES.inc(stage=name)
+                    timings[name] = round((monotonic() - started) * 1000, 1)
+                    if name == 'llm_result':
+                        results[name] = dict(rule_result, fallback='rule_based')
+                    else:
+                        results[name] = []
+                    yield _sse(name, results[name])
+        response = _analysis_response(combined_text, results['llm_result'], results['similar_tickets'],
+                                      results['recommended_articles'], partial, timings)
+        response = _finish_analysis(combined_text, signature, duplicate, response)
+        done = {'partial': partial, 'timings_ms': timings}
+        if 'dedup' in response:
+            done['dedup'] = response['dedup']
+        yield _sse('done', done)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze many tickets in one request.
+    Body: a JSON array of tickets, or {"tickets": [...], "top_k": 3, "use_llm": false}.
+    Each ticket is a string or an object with "text" (and optional "id").
+    Classification is rule-based unless use_llm is set (then the tickets are
+    classified concurrently within BATCH_LLM_BUDGET_SECONDS); similarity and
+    KB recommendations are computed for the whole batch at once.
+    """
+    payload = request.get_json(silent=True)
+    options = payload if isinstance(payload, dict) else {}
+    tickets = options.get('tickets') if isinstance(payload, dict) else payload
+    if not isinstance(tickets, list) or not tickets:
+        return jsonify({'error': 'Expected a non-empty JSON array of tickets'}), 400
+    if len(tickets) > MAX_BATCH_TICKETS:
+        return jsonify({'error': f'Too many tickets (max {MAX_BATCH_TICKETS} per request)'}), 400
+
+    ids, texts = [], []
+    for pos, t in enumerate(tickets):
+        if isinstance(t, dict):
+            ids.append(t.get('id', pos))
+            texts.append(str(t.get('text') or '').strip())
         else:
-            gap_entry.to_csv(GAP_LOG, mode='a', header=False, index=False)
+            ids.append(pos)
+            texts.append(str(t or '').strip())
 
-    # ✅ Final structured response
-    response = {
-        'uploaded_ticket': combined_text[:1000],
+    try:
+        top_k = max(1, min(int(options.get('top_k', 3)), 50))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    use_llm = bool(options.get('use_llm', False))
+
+    similar = find_similar_tickets_batch(texts, top_k=top_k)
+    articles = recommend_articles_batch(texts, top_k=top_k)
+    if use_llm:
+        classifications = _classify_batch_llm(texts, BATCH_LLM_BUDGET_SECONDS)
+    else:
+        import pandas as pd
+        classifications = classify_rules_batch(pd.Series(texts)).to_dict(orient='records')
+
+    results = []
+    for ticket_id, text, classification, sim, arts in zip(ids, texts, classifications, similar, articles):
+        if not text:
+            results.append({'id': ticket_id, 'error': 'Empty ticket text'})
+            continue
+        if len(arts) == 0:
+            _log_content_gap(text)
+        row = {'id': ticket_id}
+        row.update(classification)
+        row['similar_tickets'] = sim
+        row['recommended_articles'] = arts
+        results.append(row)
+
+    return jsonify({
         'analyzed_at': datetime.now().isoformat(),
-        'llm_result': llm_result,
-        'similar_tickets': similar,
-        'recommended_articles': articles
-    }
+        'count': len(results),
+        'results': results
+    })
 
-    # ✅ Add convenience top-level fields
-    if isinstance(llm_result, dict):
-        for k in ['category', 'tags', 'suggested_priority', 'solution', 'confidence']:
-            if k in llm_result:
-                response[k] = llm_result[k]
+def _row_texts(chunk):
+    """
+    One ticket text per CSV row: subject + body when those columns exist,
+    otherwise every column joined.
+    """
+    lowered = {c.lower(): c for c in chunk.columns}
+    subj = next((lowered[c] for c in ROW_SUBJECT_COLUMNS if c in lowered), None)
+    body = next((lowered[c] for c in ROW_BODY_COLUMNS if c in lowered), None)
+    cols = [c for c in (subj, body) if c] or list(chunk.columns)
+    texts = chunk[cols[0]].fillna('')
+    for c in cols[1:]:
+        texts = texts.str.cat(chunk[c].fillna(''), sep=' ')
+    return texts.str.strip()
+
+@app.route('/analyze_rows', methods=['POST'])
+def analyze_rows():
+    """
+    Per-row mode for CSV uploads: every row is its own ticket.
+    The file is read in ROWS_CHUNK_SIZE chunks and each chunk goes through
+    rule-based classification, similarity and KB recommendation in bulk.
+    Results are streamed back as NDJSON, one line per row, so memory stays
+    flat regardless of upload size.
+    """
+    file, error = _uploaded_file()
+    if error:
+        return error
+    if not file.filename.lower().endswith('.csv'):
+        return jsonify({'error': 'Per-row mode needs a CSV file'}), 400
+    try:
+        top_k = max(1, min(int(request.form.get('top_k', 3)), 50))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k must be an integer'}), 400
 
-    return jsonify(response)
+    def generate():
+        import pandas as pd
+        row_no = 0
+        try:
+            file.stream.seek(0)
+            for chunk in pd.read_csv(file.stream, dtype=str, chunksize=ROWS_CHUNK_SIZE,
+                                     encoding_errors='ignore'):
+                texts = _row_texts(chunk)
+                classifications = classify_rules_batch(texts).to_dict(orient='records')
+                texts = texts.tolist()
+                similar = find_similar_tickets_batch(texts, top_k=top_k)
+                articles = recommend_articles_batch(texts, top_k=top_k)
+                lines = []
+                for text, classification, sim, arts in zip(texts, classifications, similar, articles):
+                    row = {'row': row_no}
+                    row_no += 1
+                    if not text:
+                        row['error'] = 'Empty ticket text'
+                    else:
+                        row.update(classification)
+                        row['similar_tickets'] = sim
+                        row['recommended_articles'] = arts
+                        if len(arts) == 0:
+                            _log_content_gap(text)
+                    lines.append(json.dumps(row, ensure_ascii=False))
+                yield "\n".join(lines) + "\n"
+        except Exception as e:
+            yield json.dumps({'row': row_no, 'error': f'Could not read CSV: {str(e)}'}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/feedback', methods=['POST'])
 def receive_feedback():
@@ -173,11 +588,8 @@ def receive_feedback():
         'final_priority': payload.get('final_priority',''),
         'agent_note': payload.get('agent_note','')
     }
-    df_row = pd.DataFrame([row])
-    if not os.path.exists(FEEDBACK_CSV):
-        df_row.to_csv(FEEDBACK_CSV, index=False)
-    else:
-        df_row.to_csv(FEEDBACK_CSV, index=False, header=False, mode='a')
+    _feedback_log.append(row)
+    ingest_ticket(row['original_text'], row['final_category'], source='feedback')
     return jsonify({'status':'ok'})
 
 # Admin Home (Dashboard)
@@ -187,23 +599,47 @@ def receive_feedback():
 def admin_ui():
     return render_template('admin.html')
 
+GAPS_PAGE_SIZE = 50
+
 @app.route("/admin/gaps")
 @requires_auth
 def view_gaps():
-    GAP_LOG = os.path.join(DATA_DIR, "content_gaps.csv")
-    if not os.path.exists(GAP_LOG):
+    # Gaps grouped into clusters of (near-)duplicates, largest first, one page at a time
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', GAPS_PAGE_SIZE, type=int), 1), 500)
+    clusters, total_clusters, total_gaps = kb_jobs.gap_clusters((page - 1) * per_page, per_page)
+    kb_jobs.ensure_runner()
+    if request.args.get('format') == 'json':
+        return jsonify({'page': page, 'per_page': per_page, 'clusters': clusters,
+                        'total_clusters': total_clusters, 'total_gaps': total_gaps})
+    if not total_gaps:
         return "<h3>No content gaps recorded yet.</h3>"
 
-    import pandas as pd
-    df = pd.read_csv(GAP_LOG)
-
-    # Add Generate KB button column
-    df['action'] = df['ticket_excerpt'].apply(
-    lambda t: f"<button onclick=\"generateKB('{html.escape(str(t))}')\">Generate KB</button>"
-     )
-    
-    # Convert table to HTML and allow buttons to render
-    table_html = df.to_html(classes="table table-striped", index=False, escape=False)
+    rows = []
+    for c in clusters:
+        if c['status'] == 'added':
+            action = f"KB article {html.escape(c['article_id'] or '')}"
+        elif c['status'] in ('pending', 'generated'):
+            action = "Queued"
+        else:
+            action = (f"<button data-key=\"{html.escape(c['key'])}\" "
+                      "onclick=\"generateKB([this.dataset.key])\">Generate KB</button>")
+            if c['status'] == 'failed':
+                action = "Failed &middot; " + action
+        rows.append(
+            f"<tr><td>{c['count']}</td><td>{c['variants']}</td><td>{html.escape(c['excerpt'])}</td>"
+            f"<td>{html.escape(c['first_seen'][:19])}</td><td>{html.escape(c['last_seen'][:19])}</td>"
+            f"<td>{action}</td></tr>"
+        )
+    pages = max((total_clusters + per_page - 1) // per_page, 1)
+    nav = []
+    if page > 1:
+        nav.append(f"<a href=\"?page={page - 1}&per_page={per_page}\">&larr; Previous</a>")
+    nav.append(f"Page {page} of {pages}")
+    if page < pages:
+        nav.append(f"<a href=\"?page={page + 1}&per_page={per_page}\">Next &rarr;</a>")
+    jobs = storage.kb_jobs(limit=1)
+    running = jobs[0]['id'] if jobs and jobs[0]['status'] in ('queued', 'running') else None
 
     return f"""
     <html>
@@ -218,38 +654,86 @@ def view_gaps():
     </head>
     <body>
         <h2>📌 Content Gaps (Tickets With No Matching KB Articles)</h2>
-        {table_html}
+        <p>{total_gaps} gaps in {total_clusters} clusters.
+           <button onclick="generateKB(null)">Generate KB for all open clusters</button>
+           <span id="job-status"></span></p>
+        <table class="table table-striped">
+            <thead><tr><th>Gaps</th><th>Distinct</th><th>Example</th><th>First seen</th><th>Last seen</th><th>Action</th></tr></thead>
+            <tbody>{"".join(rows)}</tbody>
+        </table>
+        <p>{" &middot; ".join(nav)}</p>
         <br><br>
         <a href="/admin">⬅ Back to Admin Dashboard</a>
 
-        <!-- ✅ JS to trigger KB generation -->
+        <!-- ✅ JS to queue KB generation and follow the job -->
         <script>
-        function generateKB(text) {{
-          fetch('/admin/generate_kb', {{
+        function generateKB(clusters) {{
+          fetch('/admin/kb_jobs', {{
             method: 'POST',
             headers: {{'Content-Type':'application/json'}},
-            body: JSON.stringify({{ticket_excerpt: text}})
+            body: JSON.stringify(clusters ? {{clusters: clusters}} : {{}})
           }})
           .then(res => res.json())
           .then(data => {{
-            alert(data.message || data.error);
-            location.reload();
+            if (data.job_id) {{ watchJob(data.job_id); }} else {{ alert(data.message || data.error); }}
+          }});
+        }}
+        function watchJob(id) {{
+          fetch('/admin/kb_jobs/' + id)
+          .then(res => res.json())
+          .then(job => {{
+            document.getElementById('job-status').textContent =
+              `Job ${{job.id}}: ${{job.status}}, ${{Math.round(job.progress * 100)}}% ` +
+              `(${{job.items - job.pending}}/${{job.items}}, ${{job.failed}} failed)`;
+            if (job.status === 'queued' || job.status === 'running') {{
+              setTimeout(() => watchJob(id), 2000);
+            }} else {{
+              location.reload();
+            }}
           }});
         }}
+        {f"watchJob({running});" if running else ""}
         </script>
 
     </body>
     </html>
     """
 
+@app.route("/admin/kb_jobs", methods=['POST'])
+@requires_auth
+def create_kb_job():
+    # Queue KB article generation for the given gap clusters (default: all open ones)
+    body = request.get_json(silent=True) or {}
+    clusters = body.get('clusters')
+    if clusters is not None and (not isinstance(clusters, list) or not all(isinstance(k, str) for k in clusters)):
+        return jsonify({'error': 'clusters must be a list of cluster keys'}), 400
+    try:
+        limit = max(1, min(int(body.get('limit', kb_jobs.KB_JOB_MAX_ITEMS)), kb_jobs.KB_JOB_MAX_ITEMS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+    job_id, items = kb_jobs.enqueue(clusters, limit)
+    if job_id is None:
+        return jsonify({"message": "No open content gap clusters to generate articles for"}), 200
+    return jsonify({"job_id": job_id, "items": items}), 202
+
+@app.route("/admin/kb_jobs")
+@requires_auth
+def list_kb_jobs():
+    return jsonify(storage.kb_jobs(limit=request.args.get('limit', 20, type=int)))
+
+@app.route("/admin/kb_jobs/<int:job_id>")
+@requires_auth
+def kb_job_status(job_id):
+    kb_jobs.ensure_runner()
+    job = kb_jobs.job_status(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job)
 
 
 @app.route("/admin/generate_kb", methods=['POST'])
 @requires_auth
 def generate_kb():
-    GAP_LOG = os.path.join(DATA_DIR, "content_gaps.csv")
-    KB_PATH = os.path.join(DATA_DIR, "knowledge_base.csv")
-
     ticket_text = request.json.get("ticket_excerpt", "").strip()
     if not ticket_text:
         return jsonify({"error": "Missing ticket text"}), 400
@@ -258,61 +742,114 @@ def generate_kb():
     if not article:
         return jsonify({"error": "LLM failed"}), 500
 
-    # Append to KB
-    df_row = pd.DataFrame([{
+    # Append to KB (also refreshes the cached KB index in place)
+    add_kb_article({
         "article_id": f"KB{int(time())}",  # unique ID
         "title": article["title"],
         "content": article["content"],
         "link": "#"
-    }])
-
-    if not os.path.exists(KB_PATH):
-        df_row.to_csv(KB_PATH, index=False)
-    else:
-        df_row.to_csv(KB_PATH, mode="a", header=False, index=False)
+    })
 
     return jsonify({"message": "Article created successfully"}), 200
 
 
+@app.route('/admin/metrics')
+@requires_auth
+def admin_metrics():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/memory')
+@requires_auth
+def admin_memory():
+    # Per-process RSS/PSS/private memory of the gunicorn master and workers
+    return jsonify(memory_report.server_report())
+
+@app.route('/admin/classifier')
+@requires_auth
+def admin_classifier():
+    # Local model vs LLM: escalation rate and p50 latency saved (this worker)
+    return jsonify(local_classifier.report())
+
 @app.route('/admin/logs')
 @requires_auth
 def admin_logs():
-    logs_path = os.path.join(DATA_DIR, 'llm_logs.jsonl')
-    if not os.path.exists(logs_path):
-        return jsonify([])
-    out = []
-    with open(logs_path, 'r', encoding='utf-8') as fh:
-        for line in fh:
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                continue
-    return jsonify(out[-200:][::-1])
+    return jsonify(storage.recent_llm_logs(200))
 
 @app.route('/admin/feedback')
 @requires_auth
 def admin_feedback():
-    fb_path = os.path.join(DATA_DIR, 'feedback.csv')
-    if not os.path.exists(fb_path):
-        return jsonify([])
     try:
-        df_fb = pd.read_csv(fb_path)
-        # Replace NaN with None so JSON serialization produces valid JSON (no NaN tokens)
-        df_fb = df_fb.where(pd.notnull(df_fb), None)
-        records = df_fb.tail(200).to_dict(orient='records')
-        return jsonify(records)
+        return jsonify(storage.recent_feedback(200))
     except Exception:
         return jsonify([])
 
 @app.route('/admin/download/<path:fname>')
 @requires_auth
 def admin_download(fname):
+    # Data kept in the database is exported on the fly under its legacy file name
+    exported = storage.export(fname)
+    if exported is not None:
+        mimetype = 'application/x-ndjson' if fname.endswith('.jsonl') else 'text/csv'
+        return Response(exported, mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={fname}'})
     safe = fname.replace('..', '')
     path = os.path.join(DATA_DIR, safe)
     if os.path.exists(path):
         return send_file(path, as_attachment=True)
+    if safe == 'processed_tickets.csv' and os.path.exists(index_store.HIST_PATH):
+        # prepare_dataset now writes Parquet; convert it chunk by chunk for the legacy download
+        def generate():
+            header = True
+            for chunk in index_store.iter_chunks(index_store.HIST_PATH, text_only=False):
+                yield chunk.to_csv(index=False, header=header)
+                header = False
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={safe}'})
     return jsonify({'error': 'not found'}), 404
 
+def _warm_up():
+    start = perf_counter()
+    try:
+        for name in WARM_UP_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print("Warm-up: skipping", name, e)
+        similarity.preload()
+        # One pass over the hot path starts the per-process background work
+        # (ticket indexer, dedup history, local model) the first request would.
+        text = "warm up request: unable to log in to my account"
+        similarity.find_similar_tickets_batch([text], top_k=1)
+        dedup.lookup(text)
+        local_classifier.predict(text, _rule_based(text))
+        _warm_state['done'] = True
+    except Exception as e:
+        _warm_state['error'] = str(e)
+        print("Warm-up failed:", e)
+    _warm_state['seconds'] = round(perf_counter() - start, 3)
+    print(f"Warm-up finished in {_warm_state['seconds']}s (pid {os.getpid()})")
+
+def warm_up(background=True):
+    """
+    Import the heavy dependencies and load the indexes ahead of the first
+    request, once per process. With STARTUP_MODE=warm this is called after
+    the port is bound (gunicorn.conf.py post_worker_init, run_app.py), so
+    the server answers health checks while it runs.
+    """
+    with _warm_lock:
+        if _warm_state['pid'] == os.getpid():
+            return
+        _warm_state.update(pid=os.getpid(), done=False, seconds=None, error=None)
+    if background:
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    else:
+        _warm_up()
+
+if STARTUP_MODE == 'preload':
+    similarity.preload()
+    dedup.preload()
+    local_classifier.preload()
+
 if __name__ == '__main__':
     print("🚀 Server running on http://localhost:5000")
     app.run(debug=True)
\ No newline at end of file
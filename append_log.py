@@ -0,0 +1,159 @@
+import io
+import os
+import csv
+import json
+import atexit
+import threading
+import weakref
+from time import monotonic, sleep
+
+import metrics
+
+# File locking keeps rows from different gunicorn workers from interleaving.
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+FLUSH_INTERVAL = float(os.environ.get("APPEND_LOG_FLUSH_INTERVAL", "0.5"))   # seconds
+MAX_BATCH = int(os.environ.get("APPEND_LOG_MAX_BATCH", "256"))               # records
+WRITE_ATTEMPTS = int(os.environ.get("APPEND_LOG_WRITE_ATTEMPTS", "4"))        # per batch, then it is dropped
+RETRY_BACKOFF = float(os.environ.get("APPEND_LOG_RETRY_BACKOFF", "0.25"))     # seconds, doubled per retry
+
+_logs = weakref.WeakSet()
+
+_FLUSH_SECONDS = metrics.histogram('append_log_flush_seconds', "Time to write one append-log batch in seconds")
+_RECORDS = metrics.counter('append_log_records_total', "Records flushed by append logs")
+_DROPPED = metrics.counter('append_log_dropped_total', "Records dropped by append logs after every write attempt failed")
+
+
+class AppendLog:
+    """
+    Buffered append-only writer for a CSV (fieldnames given) or JSONL file,
+    or for any `sink` callable that stores a list of records in one go
+    (e.g. a batched database insert).
+
+    append() only queues the record; a background thread group-commits the
+    queue when it reaches max_batch records or flush_interval seconds,
+    writing the whole batch in one write() under an exclusive flock so
+    several processes can share the file. The CSV header is written by
+    whichever process first finds the file empty, under the same lock.
+    A failed write is retried up to WRITE_ATTEMPTS times with exponential
+    backoff before the batch is dropped (and counted in
+    append_log_dropped_total). Pending records are flushed at interpreter exit.
+    """
+
+    def __init__(self, path=None, fieldnames=None, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH,
+                 sink=None):
+        if path is None and sink is None:
+            raise ValueError("AppendLog needs a path or a sink")
+        self.path = path
+        self.sink = sink
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._closed = False
+        _logs.add(self)
+
+    def append(self, record):
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append(record)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def _ensure_thread(self):
+        # Threads do not survive fork (gunicorn preload), so start one per pid.
+        if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"append-log:{self.name}",
+                                            daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    @property
+    def name(self):
+        return os.path.basename(self.path) if self.path else getattr(self.sink, '__name__', 'sink')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._pending:
+                    self._cond.wait()
+                # Group commit: give the batch flush_interval (from its first record) to fill up.
+                deadline = monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.max_batch:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed and not self._pending:
+                    return
+            self.flush()
+
+    def flush(self):
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            delay = RETRY_BACKOFF
+            for attempt in range(1, WRITE_ATTEMPTS + 1):
+                try:
+                    with _FLUSH_SECONDS.time(log=self.name):
+                        self._write(batch)
+                    _RECORDS.inc(len(batch), log=self.name)
+                    return
+                except Exception as e:
+                    if attempt >= WRITE_ATTEMPTS:
+                        _DROPPED.inc(len(batch), log=self.name)
+                        print(f"Dropped {len(batch)} records for {self.name} after {attempt} attempts:", e)
+                        return
+                    print(f"Could not write {len(batch)} records to {self.name} (attempt {attempt}), "
+                          f"retrying in {delay:.2f}s:", e)
+                    sleep(delay)
+                    delay *= 2
+
+    def _format(self, batch, header):
+        if self.fieldnames is None:
+            return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=self.fieldnames, extrasaction='ignore', lineterminator='\n')
+        if header:
+            writer.writeheader()
+        writer.writerows(batch)
+        return buf.getvalue()
+
+    def _write(self, batch):
+        if self.sink is not None:
+            self.sink(batch)
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8', newline='') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                header = self.fieldnames is not None and os.fstat(f.fileno()).st_size == 0
+                f.write(self._format(batch, header))
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+
+def flush_all():
+    for log in list(_logs):
+        log.flush()
+
+
+atexit.register(flush_all)
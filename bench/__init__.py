@@ -0,0 +1,11 @@
+"""
+Benchmarks for the ticket analyzer; run from the repository root:
+
+    python -m bench.micro --rows 100000      # similarity / classifier / extraction hot paths
+    python -m bench.load --concurrency 16    # end-to-end POST /analyze
+    python -m bench.memory --workers 4       # per-worker memory, lazy vs preload
+    python -m bench.startup --repeat 5       # import time per module, time to first response
+    python -m bench.compare OLD.json NEW.json
+
+Synthetic data lives in bench/work/, results in bench/results/.
+"""
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import platform
+import subprocess
+from time import perf_counter
+from datetime import datetime
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+WORK_DIR = os.path.join(BENCH_DIR, "work")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+def _to_parquet(csv_path, parquet_path):
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    reader = pa_csv.open_csv(csv_path)
+    with pq.ParquetWriter(parquet_path + ".tmp", reader.schema, compression='zstd') as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+    os.replace(parquet_path + ".tmp", parquet_path)
+
+
+def setup_workdir(rows, seed=0, kb_articles=200, workdir=WORK_DIR, history_format='csv'):
+    """
+    Generate (or reuse) a synthetic corpus of `rows` tickets in `workdir`,
+    point the app's data files at it and load `kb_articles` articles into a
+    fresh database, so benchmarks never touch data/. Call it before
+    importing app or llm_classifier: env-driven settings are read at import.
+    """
+    from bench import corpus
+
+    os.makedirs(workdir, exist_ok=True)
+    hist_path = os.path.join(workdir, f"tickets-{rows}-{seed}.csv")
+    if not os.path.exists(hist_path):
+        start = perf_counter()
+        corpus.write_tickets(hist_path + ".tmp", rows, seed)
+        os.replace(hist_path + ".tmp", hist_path)
+        print(f"Generated {rows} synthetic tickets in {perf_counter() - start:.1f}s")
+    if history_format == 'parquet':
+        # Same rows in prepare_dataset's output format
+        csv_path, hist_path = hist_path, hist_path[:-len(".csv")] + ".parquet"
+        if not os.path.exists(hist_path):
+            _to_parquet(csv_path, hist_path)
+
+    db_path = os.path.join(workdir, "support.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.environ["SUPPORT_DB_PATH"] = db_path
+    # Cached LLM answers would turn every repeat into a cache hit.
+    os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+    # The stub has no quota; measure the code, not the production rate limit.
+    os.environ.setdefault("LLM_RATE_PER_SEC", "0")
+    # Load runs cycle through a fixed ticket set: without these every repeat
+    # would become a dedup hit and grow the index mid-run.
+    os.environ.setdefault("DEDUP_ENABLED", "0")
+    os.environ.setdefault("INDEX_INGEST", "0")
+    # classify_text benchmarks measure the LLM path; bench_local_classifier trains its own model.
+    os.environ.setdefault("LOCAL_MODEL_ENABLED", "0")
+    # Only the local stub is ever called (see start_llm_stub).
+    os.environ.pop("OPENAI_API_KEY", None)
+
+    import storage
+    import similarity
+    import index_store
+    storage.DB_PATH = db_path
+    # Legacy flat files in data/ must not be migrated into the bench database.
+    for attr in ('FEEDBACK_CSV', 'GAP_CSV', 'KB_CSV', 'LLM_LOG_JSONL'):
+        setattr(storage, attr, os.path.join(workdir, os.path.basename(getattr(storage, attr))))
+    storage.add_kb_articles(corpus.make_articles(kb_articles, seed))
+    similarity.HIST_PATH = hist_path
+    similarity.INDEX_DIR = os.path.join(workdir, f"index-{rows}-{seed}-{history_format}",
+                                        f"tfidf-v{index_store.FORMAT_VERSION}")
+    return hist_path
+
+
+def start_llm_stub(latency=0.0, jitter=0.0, error_rate=0.0):
+    """
+    Start stub_llm_server in-process and route classify_text to it.
+    Returns the server (server.config.requests counts calls).
+    """
+    import llm_pool
+    from stub_llm_server import start_stub_server
+    server, base_url = start_stub_server(latency=latency, jitter=jitter, error_rate=error_rate)
+    llm_pool.OPENAI_BASE_URL = base_url
+    os.environ["OPENAI_API_KEY"] = "bench"
+    return server
+
+
+def summarize(samples):
+    """
+    Latency stats in milliseconds for a list of durations in seconds.
+    """
+    if not samples:
+        return {'n': 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        'n': int(ms.size),
+        'mean_ms': round(float(ms.mean()), 3),
+        'min_ms': round(float(ms.min()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3)
+    }
+
+
+def measure(fn, repeat=20, warmup=2):
+    """
+    Call fn() `warmup` times untimed, then `repeat` times; returns summarize().
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        samples.append(perf_counter() - start)
+    return summarize(samples)
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                             capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return rev + ('-dirty' if dirty else '') if rev else None
+    except Exception:
+        return None
+
+
+def save_results(name, params, results, out=None):
+    """
+    Write one run as JSON (bench/results/<name>-<rev>-<time>.json by
+    default) so runs on different commits can be compared with
+    `python -m bench.compare`.
+    """
+    revision = git_revision()
+    payload = {
+        'benchmark': name,
+        'revision': revision,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': params,
+        'results': results
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        out = os.path.join(RESULTS_DIR, f"{name}-{revision or 'norev'}-{stamp}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    print("Results written to", out)
+    return out
@@ -0,0 +1,49 @@
+"""
+Compare two benchmark result files (e.g. the same run on two commits).
+
+    python -m bench.compare bench/results/micro-abc123-....json bench/results/micro-def456-....json
+
+Prints every p50/p95/p99/throughput figure present in both files with the
+relative change; negative latency deltas and positive throughput deltas are
+improvements.
+"""
+import json
+import argparse
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'throughput_rps', 'cold_build_s', 'rows_per_s')
+
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif key in METRICS and isinstance(value, (int, float)):
+            yield name, value
+
+
+def compare(base, new):
+    base_values = dict(_flatten(base['results']))
+    rows = []
+    for name, value in _flatten(new['results']):
+        if name in base_values:
+            old = base_values[name]
+            change = (value - old) / old * 100 if old else float('nan')
+            rows.append((name, old, value, change))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON results.")
+    parser.add_argument('base')
+    parser.add_argument('new')
+    args = parser.parse_args()
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    if base.get('benchmark') != new.get('benchmark'):
+        print(f"warning: comparing {base.get('benchmark')} with {new.get('benchmark')}")
+    print(f"{'metric':<52} {base.get('revision') or 'base':>14} {new.get('revision') or 'new':>14}   change")
+    for name, old, value, change in compare(base, new):
+        print(f"{name:<52} {old:>14.3f} {value:>14.3f}   {change:+7.1f}%")
@@ -0,0 +1,165 @@
+"""
+Synthetic ticket history, KB articles and upload files for benchmarks.
+
+    python -m bench.corpus --rows 100000 --out bench/work
+
+Everything is generated from a seeded RNG, so the same --rows/--seed give
+byte-identical files on every machine.
+"""
+import os
+import csv
+import random
+import argparse
+
+# Per-category vocabulary; phrases overlap with llm_classifier's keyword maps
+# so the rule-based path does real work.
+TOPICS = {
+    'Account': ['cannot login', 'password reset link expired', 'account locked', 'sign in loop',
+                'access denied on dashboard', 'two factor code not arriving', 'sign up email missing'],
+    'Billing': ['charged twice', 'invoice does not match', 'payment declined', 'billing address wrong',
+                'card expired', 'unexpected charge on statement', 'transaction pending for days'],
+    'Technical': ['app crashes on start', 'error 500 when saving', 'page not working', 'sync is broken',
+                  'stack trace in logs', 'timeout while uploading', 'bug in export to csv'],
+    'Refund': ['refund not received', 'cancel my subscription', 'return the device', 'want my money back',
+               'refund for duplicate order', 'cancel order before shipping'],
+    'Feature': ['feature request for dark mode', 'please add bulk edit', 'enhancement to reports',
+                'improvement suggestion for search', 'request api access'],
+    'General': ['question about opening hours', 'how to change language', 'where is the guide',
+                'documentation for the mobile app', 'general feedback about service']
+}
+PRODUCTS = ['mobile app', 'web portal', 'desktop client', 'router', 'smart watch', 'cloud backup',
+            'analytics dashboard', 'payment terminal']
+FILLER = ['since yesterday', 'after the latest update', 'for all users in our team', 'on every attempt',
+          'this is urgent', 'please help asap', 'it worked last week', 'customer is waiting',
+          'we tried restarting', 'see attached screenshot', 'order number', 'thanks in advance']
+
+KB_TEMPLATES = {
+    'Account': ('Account access: {p}', 'Steps to restore access to the {p}: reset password, clear sessions, '
+                'verify two factor settings and unlock the account.'),
+    'Billing': ('Billing questions for the {p}', 'How invoices, charges and payment methods work for the {p}; '
+                'fixing declined cards and duplicate charges.'),
+    'Technical': ('Troubleshooting the {p}', 'Collect logs, reproduce the error, update the {p} and '
+                  'reinstall if it keeps crashing or timing out.'),
+    'Refund': ('Refunds and cancellations: {p}', 'Eligibility, timelines and how to request a refund or cancel '
+               'an order for the {p}.'),
+    'Feature': ('Requesting features for the {p}', 'How to submit an enhancement request and track the roadmap '
+                'for the {p}.'),
+    'General': ('Getting started with the {p}', 'Guide and documentation links, language settings and '
+                'support hours for the {p}.')
+}
+
+
+def make_ticket(rng):
+    """
+    One (subject, body, category) triple.
+    """
+    category = rng.choice(list(TOPICS))
+    product = rng.choice(PRODUCTS)
+    issue = rng.choice(TOPICS[category])
+    extra = rng.sample(TOPICS[category], k=min(2, len(TOPICS[category])))
+    details = extra + rng.sample(FILLER, k=rng.randint(1, 3))
+    if rng.random() < 0.3:
+        details.append(f"ref {rng.randint(10**6, 10**8)}")
+    rng.shuffle(details)
+    body = ". ".join([f"{issue} on the {product}"] + details) + "."
+    return f"{issue.capitalize()} ({product})", body, category
+
+
+def _clean(s):
+    # Same shape as prepare_dataset.simple_clean, without importing `datasets`.
+    out = []
+    for token in s.lower().replace('.', ' ').replace('(', ' ').replace(')', ' ').split():
+        if not (token.isdigit() and len(token) >= 6):
+            out.append(token)
+    return " ".join(out)
+
+
+def write_tickets(path, rows, seed=0):
+    """
+    Write `rows` tickets in the processed_tickets.csv layout
+    (subject, text, text_clean, Category).
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['subject', 'text', 'text_clean', 'Category'])
+        for _ in range(rows):
+            subject, body, category = make_ticket(rng)
+            text = f"{subject} {body}"
+            writer.writerow([subject, text, _clean(text), category])
+    return path
+
+
+def make_articles(count, seed=0):
+    rng = random.Random(seed + 1)
+    articles = []
+    for i in range(count):
+        category = rng.choice(list(KB_TEMPLATES))
+        product = rng.choice(PRODUCTS)
+        title, content = KB_TEMPLATES[category]
+        articles.append({
+            'article_id': f"KB{1000 + i}",
+            'title': title.format(p=product),
+            'content': content.format(p=product),
+            'link': f"https://helpdesk.example.com/kb/{1000 + i}"
+        })
+    return articles
+
+
+def sample_tickets(count, seed=1):
+    """
+    Query tickets (plain text) drawn from the same distribution as the corpus.
+    """
+    rng = random.Random(seed + 7919)
+    return [" ".join(make_ticket(rng)[:2]) for _ in range(count)]
+
+
+def make_pdf(pages):
+    """
+    Minimal valid PDF whose pages each hold a few lines of ticket text
+    (Helvetica, no compression). `pages` is a list of lists of lines.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = ["BT /F1 10 Tf 40 800 Td 12 TL"]
+        for line in lines:
+            escaped = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            ops.append(f"({escaped}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops)
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode('latin-1')
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode('latin-1')
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    return bytes(out)
+
+
+def sample_pdf(page_count=5, lines_per_page=30, seed=2):
+    tickets = sample_tickets(page_count * lines_per_page, seed=seed)
+    return make_pdf([[t[:90] for t in tickets[i:i + lines_per_page]]
+                     for i in range(0, len(tickets), lines_per_page)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic ticket corpus for benchmarks.")
+    parser.add_argument('--rows', type=int, default=10000, help="historical tickets (10k to 1M)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(__file__), 'work'))
+    args = parser.parse_args()
+    path = write_tickets(os.path.join(args.out, 'processed_tickets.csv'), args.rows, args.seed)
+    print(f"Wrote {args.rows} tickets to {path}")
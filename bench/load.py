@@ -0,0 +1,151 @@
+"""
+End-to-end load driver for POST /analyze.
+
+    python -m bench.load --rows 100000 --concurrency 16 --duration 30
+    python -m bench.load --url http://127.0.0.1:8000 --concurrency 32 --requests 2000
+
+Without --url the app is served in-process (threaded werkzeug server) on a
+synthetic corpus (--llm routes classify_text to the stub LLM). With --url the
+target is used as-is, e.g. gunicorn started with OPENAI_BASE_URL pointing at
+`python stub_llm_server.py`. Reports throughput and p50/p95/p99 latency,
+plus the server-side stage timings, and writes JSON to bench/results/.
+"""
+import argparse
+import threading
+from time import perf_counter
+from collections import Counter
+
+from bench.common import setup_workdir, start_llm_stub, summarize, save_results
+
+
+def serve_app():
+    """
+    Serve app.app on a free local port in a daemon thread; returns (server, url).
+    """
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)   # no per-request access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_load(url, tickets, concurrency, total=None, duration=None, timeout=60):
+    """
+    Send tickets to url/analyze from `concurrency` threads until `total`
+    requests were sent or `duration` seconds passed.
+    """
+    import requests
+
+    lock = threading.Lock()
+    latencies, statuses, stage_ms = [], Counter(), {}
+    partial = [0]
+    sent = [0]
+    stop_at = perf_counter() + duration if duration else None
+
+    def next_ticket():
+        with lock:
+            if (total is not None and sent[0] >= total) or (stop_at is not None and perf_counter() >= stop_at):
+                return None
+            sent[0] += 1
+            return tickets[sent[0] % len(tickets)]
+
+    def worker():
+        session = requests.Session()
+        while True:
+            ticket = next_ticket()
+            if ticket is None:
+                return
+            start = perf_counter()
+            try:
+                resp = session.post(f"{url}/analyze", timeout=timeout,
+                                    files={'file': ('ticket.txt', ticket.encode('utf-8'), 'text/plain')})
+                status = resp.status_code
+                body = resp.json() if status == 200 else {}
+            except Exception as e:
+                status, body = type(e).__name__, {}
+            elapsed = perf_counter() - start
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+                    partial[0] += bool(body.get('partial'))
+                    for stage, ms in (body.get('timings_ms') or {}).items():
+                        stage_ms.setdefault(stage, []).append(ms / 1000)
+
+    started = perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = perf_counter() - started
+
+    return {
+        'requests': sum(statuses.values()),
+        'ok': len(latencies),
+        'statuses': {str(k): v for k, v in statuses.items()},
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency': summarize(latencies),
+        'partial_responses': partial[0],
+        'server_stages': {stage: summarize(v) for stage, v in sorted(stage_ms.items())}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test POST /analyze.")
+    parser.add_argument('--url', default=None, help="target base URL (default: serve the app in-process)")
+    parser.add_argument('--rows', type=int, default=10000, help="historical tickets for the in-process app")
+    parser.add_argument('--kb', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history-format', choices=['csv', 'parquet'], default='csv',
+                        help="ticket history file the index is built from")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=None, help="stop after this many requests")
+    parser.add_argument('--duration', type=float, default=20.0, help="stop after this many seconds")
+    parser.add_argument('--warmup', type=int, default=20, help="untimed requests first (index load etc.)")
+    parser.add_argument('--tickets', type=int, default=500, help="distinct ticket texts to cycle through")
+    parser.add_argument('--llm', action='store_true', help="classify via the stub LLM (in-process app only)")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="stub LLM delay (seconds)")
+    parser.add_argument('--llm-jitter', type=float, default=0.2)
+    parser.add_argument('--out', default=None, help="JSON output path")
+    args = parser.parse_args()
+    if args.requests:
+        args.duration = None
+
+    app_server = llm_server = None
+    url = args.url
+    if url is None:
+        setup_workdir(args.rows, args.seed, args.kb, history_format=args.history_format)
+        if args.llm:
+            llm_server = start_llm_stub(latency=args.llm_latency, jitter=args.llm_jitter)
+        app_server, url = serve_app()
+    url = url.rstrip('/')
+
+    from bench import corpus
+    tickets = corpus.sample_tickets(args.tickets, seed=args.seed + 1)
+    try:
+        if args.warmup:
+            run_load(url, tickets, min(args.concurrency, args.warmup), total=args.warmup)
+        print(f"Load: {args.concurrency} clients against {url}/analyze ...", flush=True)
+        results = run_load(url, tickets, args.concurrency, total=args.requests, duration=args.duration)
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        if llm_server is not None:
+            llm_server.shutdown()
+
+    lat = results['latency']
+    print(f"  {results['ok']}/{results['requests']} ok in {results['wall_s']}s"
+          f" -> {results['throughput_rps']} req/s; statuses {results['statuses']}")
+    if lat.get('n'):
+        print(f"  latency p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms")
+    for stage, stats in results['server_stages'].items():
+        print(f"    {stage:<22} p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms")
+    save_results('load', vars(args), results, args.out)
+
+
+if __name__ == '__main__':
+    main()
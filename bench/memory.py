@@ -0,0 +1,140 @@
+"""
+Memory per web worker with STARTUP_MODE=lazy vs preload.
+
+    python -m bench.memory --rows 200000 --workers 4
+
+Mimics gunicorn's process model without needing gunicorn: a master process
+forks --workers workers (after loading the indexes, the dedup history and
+the local model itself in preload mode, then gc.freeze() as gunicorn.conf.py
+does); each worker runs similarity, KB, dedup and local model queries so it
+touches all of them, then the master reads /proc smaps_rollup
+for the whole tree (memory_report.py). For a real server use GET
+/admin/memory or `python memory_report.py <master pid>`.
+"""
+import os
+import gc
+import json
+import signal
+import argparse
+from time import monotonic, sleep
+
+from bench.common import WORK_DIR, setup_workdir, save_results
+
+LOAD_WAIT_SECONDS = 300
+
+
+def _worker(queries, ready_w):
+    import dedup
+    import similarity
+    import local_classifier
+    from llm_classifier import _rule_based
+    similarity.INDEX_INGEST = False     # no background indexer in the measurement
+    similarity.find_similar_tickets_batch(queries, top_k=3)
+    similarity.recommend_articles_batch(queries, top_k=3)
+    for query in queries:
+        dedup.lookup(query)
+        local_classifier.predict(query, _rule_based(query))
+    # Lazy workers load the dedup history and the model in the background
+    deadline = monotonic() + LOAD_WAIT_SECONDS
+    while not (dedup._history_state['loaded'] and local_classifier._model is not None):
+        if monotonic() > deadline:
+            break
+        sleep(0.1)
+    os.write(ready_w, b'.')
+    signal.pause()
+
+
+def _master(mode, workers, queries, out_w):
+    import dedup
+    import similarity
+    import memory_report
+    import local_classifier
+    if mode == 'preload':
+        similarity.preload()
+        dedup.preload()
+        local_classifier.preload()
+    gc.freeze()
+    ready_r, ready_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            _worker(queries, ready_w)
+            os._exit(0)
+        pids.append(pid)
+    for _ in range(workers):
+        os.read(ready_r, 1)
+    result = memory_report.report(os.getpid())
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    os.write(out_w, json.dumps(result).encode('utf-8'))
+
+
+def measure_mode(mode, workers, queries):
+    """
+    Run one master + workers tree in a child process; returns its report.
+    """
+    out_r, out_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        try:
+            _master(mode, workers, queries, out_w)
+        finally:
+            os._exit(0)
+    os.close(out_w)
+    chunks = []
+    while True:
+        data = os.read(out_r, 65536)
+        if not data:
+            break
+        chunks.append(data)
+    os.close(out_r)
+    os.waitpid(pid, 0)
+    return json.loads(b"".join(chunks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare worker memory for lazy vs preloaded indexes.")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--kb', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=200, help="queries per worker")
+    parser.add_argument('--mode', choices=['lazy', 'preload', 'both'], default='both')
+    parser.add_argument('--out', default=None, help="JSON output path")
+    args = parser.parse_args()
+
+    # Measured here: everything a worker holds, dedup history and local model included
+    os.environ["DEDUP_ENABLED"] = "1"
+    os.environ["LOCAL_MODEL_ENABLED"] = "1"
+    setup_workdir(args.rows, args.seed, args.kb)
+    import similarity
+    import index_store
+    import local_classifier
+    from bench import corpus
+    queries = corpus.sample_tickets(args.queries, seed=args.seed + 1)
+    # Build the artifact up front: measured here is steady-state memory, not the build.
+    source = index_store.history_path(similarity.HIST_PATH, similarity.LEGACY_HIST_PATH)
+    if not index_store.is_fresh(index_store.read_meta(similarity.INDEX_DIR), source, None):
+        index_store.build_index(source, similarity.INDEX_DIR)
+    local_classifier.MODEL_PATH = os.path.join(WORK_DIR, f"local_classifier-{args.rows}-{args.seed}.pkl")
+    if not os.path.exists(local_classifier.MODEL_PATH):
+        local_classifier.save(local_classifier.train(source), local_classifier.MODEL_PATH)
+
+    results = {}
+    for mode in (['lazy', 'preload'] if args.mode == 'both' else [args.mode]):
+        report = measure_mode(mode, args.workers, queries)
+        results[mode] = report
+        print(f"{mode}: {args.workers} workers  total PSS {report['total_pss_mb']} MB"
+              f"  (RSS {report['total_rss_mb']} MB)  private per worker {report['private_per_worker_mb']} MB")
+        for p in report['processes']:
+            print(f"    {p['role']:<7} pid {p['pid']:<7} rss {p.get('rss_mb')} MB  pss {p.get('pss_mb')} MB"
+                  f"  private {p['private_mb']} MB")
+    save_results('memory', vars(args), results, args.out)
+
+
+if __name__ == '__main__':
+    main()
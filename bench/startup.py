@@ -0,0 +1,125 @@
+"""
+Cold-start cost of the web app: `import app` wall time, time to the first
+response, and import time per module from `python -X importtime`.
+
+    python -m bench.startup --repeat 5
+    python -m bench.startup --repeat 5 --rows 100000     # also time warm_up()
+
+Every repeat is a fresh interpreter. Per-module figures are cumulative (the
+module and everything it imported first), for the repo's own modules and the
+heavy third-party packages in HEAVY_MODULES; `heavy_loaded` lists those that
+`import app` pulled in at all, which should stay empty apart from numpy.
+"""
+import os
+import sys
+import json
+import glob
+import argparse
+import subprocess
+
+from bench.common import REPO_DIR, WORK_DIR, summarize, save_results
+
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'sklearn', 'pyarrow', 'PyPDF2', 'requests', 'flask']
+
+_IMPORT_APP = """
+import json
+from time import perf_counter
+start = perf_counter()
+import app
+imported = perf_counter()
+response = app.app.test_client().get('/healthz')
+print(json.dumps({'import_s': imported - start, 'first_response_s': perf_counter() - imported,
+                  'status': response.status_code}))
+"""
+
+_PREPARE = """
+from bench.common import setup_workdir
+setup_workdir({rows}, {seed}, {kb})
+import similarity, index_store
+source = index_store.history_path(similarity.HIST_PATH, similarity.LEGACY_HIST_PATH)
+if not index_store.is_fresh(index_store.read_meta(similarity.INDEX_DIR), source, None):
+    index_store.build_index(source, similarity.INDEX_DIR)
+print('{{}}')
+"""
+
+# Separate interpreter from _PREPARE, so the heavy imports are part of the measurement.
+_WARM_UP = """
+import json
+from time import perf_counter
+from bench.common import setup_workdir
+setup_workdir({rows}, {seed}, {kb})
+import app
+start = perf_counter()
+app.warm_up(background=False)
+print(json.dumps({{'warm_up_s': perf_counter() - start, 'state': app._warm_state}}))
+"""
+
+
+def _run(code, importtime=False):
+    env = dict(os.environ, SUPPORT_DB_PATH=os.path.join(WORK_DIR, "startup.sqlite3"), STARTUP_MODE='lazy')
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    proc = subprocess.run(cmd, cwd=REPO_DIR, env=env, capture_output=True, text=True, timeout=600)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def parse_importtime(stderr):
+    """
+    {module: (self_seconds, cumulative_seconds)} from -X importtime output.
+    """
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, self_us, cumulative_us, name = [p.strip() for p in line.replace('import time:', '|', 1).split('|')]
+        out[name] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and per-module import cost.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=0, help="also time warm_up() on a corpus of this size")
+    parser.add_argument('--kb', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--top', type=int, default=15, help="modules to print")
+    parser.add_argument('--out', default=None, help="JSON output path")
+    args = parser.parse_args()
+    os.makedirs(WORK_DIR, exist_ok=True)
+
+    tracked = sorted(os.path.basename(p)[:-3] for p in glob.glob(os.path.join(REPO_DIR, "*.py"))) + HEAVY_MODULES
+    import_s, first_s, modules, loaded = [], [], {}, set()
+    for _ in range(args.repeat):
+        timing, stderr = _run(_IMPORT_APP, importtime=True)
+        import_s.append(timing['import_s'])
+        first_s.append(timing['first_response_s'])
+        per_module = parse_importtime(stderr)
+        loaded |= {m for m in HEAVY_MODULES if m in per_module and m != 'flask'}
+        for name in tracked:
+            if name in per_module:
+                modules.setdefault(name, []).append(per_module[name][1])
+
+    results = {
+        'import_app': summarize(import_s),
+        'first_response': summarize(first_s),
+        'modules': {name: summarize(samples) for name, samples in modules.items()},
+        'heavy_loaded': sorted(loaded)
+    }
+    print(f"import app: p50 {results['import_app']['p50_ms']:.1f} ms   "
+          f"first /healthz after import: p50 {results['first_response']['p50_ms']:.1f} ms")
+    print(f"heavy packages imported by `import app`: {', '.join(results['heavy_loaded']) or 'none'}")
+    ranked = sorted(results['modules'].items(), key=lambda kv: -kv[1]['p50_ms'])
+    for name, stats in ranked[:args.top]:
+        print(f"    {name:<20} cumulative p50 {stats['p50_ms']:8.1f} ms")
+
+    if args.rows:
+        _run(_PREPARE.format(rows=args.rows, seed=args.seed, kb=args.kb))
+        timing, _ = _run(_WARM_UP.format(rows=args.rows, seed=args.seed, kb=args.kb))
+        results['warm_up'] = {'seconds': round(timing['warm_up_s'], 3), 'state': timing['state']}
+        print(f"warm_up() on {args.rows} rows: {timing['warm_up_s']:.2f}s  ({timing['state']})")
+    save_results('startup', vars(args), results, args.out)
+
+
+if __name__ == '__main__':
+    main()
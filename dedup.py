@@ -0,0 +1,257 @@
+import os
+import re
+import zlib
+import threading
+from time import time
+from collections import OrderedDict
+
+import numpy as np
+
+import index_store
+import metrics
+
+# Near-duplicate detection: MinHash signatures with LSH banding over recently
+# analyzed tickets (whose stored analysis /analyze can return as-is) and the
+# start of the ticket history (matches there are only annotated).
+
+# Tunables (override via environment)
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "1") != "0"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.85"))           # estimated Jaccard
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", "5000"))         # stored analyses (LRU)
+DEDUP_TTL = float(os.environ.get("DEDUP_TTL", str(24 * 3600)))               # seconds
+DEDUP_HISTORY_ROWS = int(os.environ.get("DEDUP_HISTORY_ROWS", "50000"))      # most recent; 0 disables
+DEDUP_MIN_TOKENS = 5    # shorter texts are too generic to call duplicates
+
+NUM_PERM = 128
+BANDS = 16              # 16 bands x 8 rows: candidates from ~0.7 Jaccard up
+SHINGLE_WORDS = 3
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+_LOOKUPS = metrics.counter('dedup_requests_total', "Near-duplicate lookups by result")
+
+
+def shingles(text):
+    """
+    Word 3-grams of the lowercased alphanumeric tokens, hashed to 32 bits
+    (crc32: stable across processes, unlike hash()).
+    """
+    tokens = _TOKEN.findall((text or "").lower())
+    if len(tokens) < DEDUP_MIN_TOKENS:
+        return None
+    grams = {" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def signature(text):
+    """
+    MinHash signature (NUM_PERM uint32 values), or None for short texts.
+    """
+    hashed = shingles(text)
+    if hashed is None:
+        return None
+    # a * h + b < 2**64 for 32-bit a, b, h, so nothing overflows before the mod.
+    perms = (np.outer(hashed, _PERM_A) + _PERM_B) % _MERSENNE
+    return perms.min(axis=0).astype(np.uint32)
+
+
+class MinHashLSH:
+    """
+    LSH index over MinHash signatures with LRU eviction: at most
+    max_entries keys; lookups and inserts refresh an entry, the least
+    recently used one is dropped first. Thread-safe.
+    """
+
+    def __init__(self, max_entries, threshold=DEDUP_THRESHOLD, bands=BANDS, ttl=None):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.ttl = ttl
+        self._entries = OrderedDict()      # key -> (signature, payload, created_at)
+        self._buckets = [dict() for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, sig):
+        return [sig[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(self.bands)]
+
+    def _remove(self, key):
+        sig, _, _ = self._entries.pop(key)
+        for bucket, band in zip(self._buckets, self._band_keys(sig)):
+            keys = bucket.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del bucket[band]
+
+    def insert(self, key, sig, payload):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (sig, payload, time())
+            for bucket, band in zip(self._buckets, self._band_keys(sig)):
+                bucket.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def query(self, sig):
+        """
+        Best match as (key, payload, estimated_jaccard), or None when no
+        entry clears the threshold.
+        """
+        now = time()
+        with self._lock:
+            candidates = set()
+            for bucket, band in zip(self._buckets, self._band_keys(sig)):
+                candidates.update(bucket.get(band, ()))
+            best, best_score = None, self.threshold
+            for key in candidates:
+                other, _, created_at = self._entries[key]
+                if self.ttl is not None and now - created_at > self.ttl:
+                    continue
+                score = float(np.count_nonzero(other == sig)) / NUM_PERM
+                # Ties go to the smallest key, not to whatever the set yields last
+                if score > best_score or (score == best_score and (best is None or key < best)):
+                    best, best_score = key, score
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return best, self._entries[best][1], best_score
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets = [dict() for _ in range(self.bands)]
+
+
+# ------------------ STORE ------------------ #
+
+_recent = MinHashLSH(DEDUP_MAX_ENTRIES, ttl=DEDUP_TTL)
+_history = MinHashLSH(max(DEDUP_HISTORY_ROWS, 1))
+_history_state = {'pid': None, 'loaded': False, 'shared': False}
+_history_lock = threading.Lock()
+_next_key = [0]
+
+
+def _load_history(source, limit_rows):
+    # The most recent limit_rows tickets, keyed by their row number in the
+    # whole history (the ids the similarity index uses too).
+    try:
+        skip = max(0, index_store.count_rows(source) - limit_rows)
+        row = 0
+        for chunk in index_store.iter_chunks(source):
+            if row + len(chunk) <= skip:
+                row += len(chunk)
+                continue
+            start = max(0, skip - row)
+            row += start
+            for text in index_store._snippet_texts(chunk).iloc[start:]:
+                sig = signature(text)
+                if sig is not None:
+                    _history.insert(row, sig, row)
+                row += 1
+        _history_state['loaded'] = True
+        print(f"Dedup: {len(_history)} history signatures from the last {row - skip} of {row} tickets")
+    except Exception as e:
+        print("Dedup: could not read ticket history:", e)
+
+
+def _history_source():
+    import similarity   # same history file (and row ids) as the similarity index
+    return index_store.history_path(similarity.HIST_PATH, similarity.LEGACY_HIST_PATH)
+
+
+def _ensure_history():
+    # Loaded once per process in a background thread, so no request waits on it;
+    # history matches simply start appearing once it is done. Workers forked
+    # after preload() keep the master's copy.
+    if DEDUP_HISTORY_ROWS <= 0 or _history_state['pid'] == os.getpid() or _history_state['shared']:
+        return
+    with _history_lock:
+        if _history_state['pid'] == os.getpid():
+            return
+        _history_state['pid'] = os.getpid()
+        _history_state['loaded'] = False
+        _history.clear()
+        source = _history_source()
+        if os.path.exists(source):
+            threading.Thread(target=_load_history, args=(source, DEDUP_HISTORY_ROWS),
+                             name="dedup-history", daemon=True).start()
+
+
+def preload():
+    """
+    Load the history signatures now, on this thread. Called at import with
+    STARTUP_MODE=preload, i.e. once in the gunicorn master: the forked
+    workers share its signature arrays instead of each reading the history.
+    """
+    if not DEDUP_ENABLED or DEDUP_HISTORY_ROWS <= 0:
+        return
+    with _history_lock:
+        _history_state['pid'] = os.getpid()
+        _history_state['loaded'] = False
+        _history.clear()
+        source = _history_source()
+        if os.path.exists(source):
+            _load_history(source, DEDUP_HISTORY_ROWS)
+        _history_state['shared'] = _history_state['loaded']
+
+
+def lookup(text):
+    """
+    Returns (sig, match): match is {'source': 'recent', 'analysis': ...} for
+    a stored analysis, {'source': 'history', 'id': row} for a history ticket,
+    or None. Pass sig on to remember().
+    """
+    if not DEDUP_ENABLED:
+        return None, None
+    sig = signature(text)
+    if sig is None:
+        _LOOKUPS.inc(result='skipped')
+        return None, None
+    hit = _recent.query(sig)
+    if hit is not None:
+        _LOOKUPS.inc(result='hit')
+        return sig, {'source': 'recent', 'analysis': hit[1], 'similarity': round(hit[2], 3)}
+    _ensure_history()
+    hit = _history.query(sig)
+    if hit is not None:
+        _LOOKUPS.inc(result='history')
+        return sig, {'source': 'history', 'id': int(hit[1]), 'similarity': round(hit[2], 3)}
+    _LOOKUPS.inc(result='miss')
+    return sig, None
+
+
+def remember(sig, analysis):
+    """
+    Store a finished analysis under its signature for later near-duplicates.
+    """
+    if sig is None or not DEDUP_ENABLED:
+        return
+    with _history_lock:
+        key = _next_key[0]
+        _next_key[0] += 1
+    _recent.insert(key, sig, analysis)
+
+
+def stats():
+    return {
+        'enabled': DEDUP_ENABLED,
+        'recent_entries': len(_recent),
+        'recent_evictions': _recent.evictions,
+        'history_entries': len(_history),
+        'history_loaded': _history_state['loaded']
+    }
+
+
+metrics.gauge('dedup_entries', "Signatures held by the near-duplicate index",
+              lambda: [({'index': 'recent'}, len(_recent)), ({'index': 'history'}, len(_history))])
@@ -0,0 +1,27 @@
+import os
+import gc
+
+# Picked up automatically by `gunicorn app:app` (see Procfile).
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+
+# STARTUP_MODE=preload imports the app (and loads the indexes, the dedup
+# history and the local model, see app.py) once in the master; workers are
+# forked from it and share those pages.
+preload_app = os.environ.get("STARTUP_MODE", "lazy").lower() == "preload"
+
+
+def post_worker_init(worker):
+    # STARTUP_MODE=warm: the app was imported without its heavy dependencies;
+    # load them and the indexes in the background now that the worker is up.
+    if os.environ.get("STARTUP_MODE", "lazy").lower() == "warm":
+        import app
+        app.warm_up()
+
+
+def pre_fork(server, worker):
+    # Move everything the master allocated into the permanent generation, so
+    # the workers' garbage collector never writes to (and copies) those pages.
+    gc.freeze()
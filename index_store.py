@@ -0,0 +1,399 @@
+import os
+import glob
+import json
+import shutil
+import argparse
+from time import time
+from datetime import datetime
+
+import numpy as np
+
+# pandas, scipy and scikit-learn are imported where they are used, so that
+# importing this module (and the web app) stays fast.
+
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, "data")
+HIST_PATH = os.path.join(DATA_DIR, "processed_tickets.parquet")
+# Written by older prepare_dataset runs; used when there is no Parquet file.
+LEGACY_HIST_PATH = os.path.join(DATA_DIR, "processed_tickets.csv")
+
+# Bump FORMAT_VERSION whenever the on-disk layout changes; old artifacts are
+# then ignored and rebuilt instead of being misread.
+FORMAT_VERSION = 2
+INDEX_DIR = os.path.join(DATA_DIR, "index", f"tfidf-v{FORMAT_VERSION}")
+
+SNIPPET_CHARS = 400
+CHUNK_ROWS = 20000
+TEXT_COLUMNS = ('text', 'text_clean')
+
+# Hashing keeps the feature space fixed, so the build never has to hold a
+# vocabulary (or the whole corpus) in memory.
+VECTORIZER_PARAMS = {
+    'n_features': 2 ** 20,
+    'ngram_range': (1, 2),
+    'stop_words': 'english',
+    'min_df': 2,          # drop singletons
+    'max_df': 0.95        # drop super-common terms
+}
+
+
+class HashedTfidf:
+    """
+    TF-IDF on top of a HashingVectorizer: the same transform() the index was
+    built with, reconstructed from n_features + the idf vector alone.
+    """
+
+    def __init__(self, idf, n_features=VECTORIZER_PARAMS['n_features'],
+                 ngram_range=VECTORIZER_PARAMS['ngram_range'],
+                 stop_words=VECTORIZER_PARAMS['stop_words']):
+        self.idf_ = idf
+        self.hasher = _hasher(n_features, ngram_range, stop_words)
+
+    def transform(self, texts):
+        from sklearn.preprocessing import normalize
+        X = self.hasher.transform(texts)
+        X.data *= self.idf_[X.indices]
+        X.eliminate_zeros()
+        return normalize(X, norm='l2', copy=False)
+
+
+def _hasher(n_features, ngram_range, stop_words):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=tuple(ngram_range),
+        stop_words=stop_words,
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32
+    )
+
+
+class SnippetStore:
+    """
+    Read-only list of ticket snippets backed by one utf-8 byte array plus
+    an offsets array, so it can be memory-mapped instead of held in a DataFrame.
+    """
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._blob[start:end]).decode('utf-8', errors='ignore')
+
+
+def source_fingerprint(source_path):
+    st = os.stat(source_path)
+    return {
+        'path': os.path.abspath(source_path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns
+    }
+
+
+def _ticket_texts(df):
+    if 'text_clean' in df.columns:
+        return df['text_clean'].fillna('').astype(str)
+    if 'text' in df.columns:
+        return df['text'].fillna('').astype(str)
+    return df.astype(str).apply(lambda r: " ".join(r.values), axis=1)
+
+
+def _snippet_texts(df):
+    if 'text' in df.columns:
+        return df['text'].fillna('').astype(str)
+    if 'text_clean' in df.columns:
+        return df['text_clean'].fillna('').astype(str)
+    return df.astype(str).apply(lambda r: " ".join(r.values), axis=1)
+
+
+def history_path(path=HIST_PATH, legacy_path=LEGACY_HIST_PATH):
+    """
+    The ticket history to index: the Parquet output of prepare_dataset, or
+    the legacy CSV when only that exists.
+    """
+    if os.path.exists(path) or not os.path.exists(legacy_path):
+        return path
+    return legacy_path
+
+
+def _iter_parquet(source_path, limit_rows, chunk_rows, text_only):
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(source_path)
+    text_cols = [c for c in TEXT_COLUMNS if c in pf.schema_arrow.names] if text_only else []
+    remaining = limit_rows
+    # Column projection: only the text columns are decoded at all.
+    for batch in pf.iter_batches(batch_size=chunk_rows, columns=text_cols or None):
+        chunk = batch.to_pandas()
+        if remaining is not None:
+            chunk = chunk.iloc[:remaining]
+            remaining -= len(chunk)
+        if len(chunk):
+            yield chunk
+        if remaining == 0:
+            return
+
+
+def iter_chunks(source_path=HIST_PATH, limit_rows=None, chunk_rows=CHUNK_ROWS, text_only=True):
+    """
+    Yield DataFrame chunks of the ticket history (Parquet or CSV), reading
+    only the text columns when they exist unless text_only=False.
+    """
+    if source_path.endswith('.parquet'):
+        yield from _iter_parquet(source_path, limit_rows, chunk_rows, text_only)
+        return
+    import pandas as pd
+    header = pd.read_csv(source_path, nrows=0).columns
+    text_cols = [c for c in TEXT_COLUMNS if c in header] if text_only else []
+    reader = pd.read_csv(
+        source_path,
+        usecols=text_cols or None,
+        dtype=str,
+        chunksize=chunk_rows,
+        nrows=limit_rows
+    )
+    for chunk in reader:
+        yield chunk
+
+
+def count_rows(source_path=HIST_PATH):
+    """
+    Rows in the ticket history: from the Parquet footer, or by reading the
+    CSV's text columns once.
+    """
+    if source_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(source_path).metadata.num_rows
+    return sum(len(chunk) for chunk in iter_chunks(source_path))
+
+
+def new_generation(path):
+    """
+    A fresh, empty sibling directory of `path` to build an artifact in;
+    publish() makes it current once complete.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    gen_dir = f"{path}.gen-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+    os.makedirs(gen_dir)
+    return gen_dir
+
+
+def publish(gen_dir, path):
+    """
+    Make `path` (a symlink) point at the finished artifact in gen_dir with a
+    single os.replace, so readers see either the old artifact or the new
+    one and never a missing directory. The generation just replaced is kept
+    for readers still opening its files; older completed ones are removed.
+    """
+    previous = os.path.realpath(path) if os.path.lexists(path) else None
+    if os.path.isdir(path) and not os.path.islink(path):
+        # Artifact written before versioned directories: move it aside once.
+        previous = os.path.realpath(f"{path}.gen-0-{os.getpid()}")
+        os.rename(path, previous)
+    link = f"{path}.link-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(gen_dir), link)
+    os.replace(link, path)
+    keep = {os.path.realpath(gen_dir), previous}
+    for old in glob.glob(f"{glob.escape(path)}.gen-*"):
+        # Generations without meta.json may still be in the middle of a build.
+        if os.path.realpath(old) not in keep and os.path.exists(os.path.join(old, 'meta.json')):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def remove(path):
+    """
+    Delete the artifact at `path` together with all of its generations.
+    """
+    if os.path.islink(path):
+        os.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    for old in glob.glob(f"{glob.escape(path)}.gen-*"):
+        shutil.rmtree(old, ignore_errors=True)
+
+
+class _Progress:
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.started = time()
+
+    def update(self, n):
+        self.rows += n
+        elapsed = max(time() - self.started, 1e-9)
+        print(f"{self.label}: {self.rows} rows ({self.rows / elapsed:,.0f} rows/s)")
+
+
+def build_index(source_path=HIST_PATH, index_dir=INDEX_DIR, limit_rows=None,
+                chunk_rows=CHUNK_ROWS, extra=None, extra_meta=None):
+    """
+    Stream the ticket history into an index artifact in two passes:
+    1. hash each chunk and accumulate document frequencies -> idf weights;
+    2. hash each chunk again, apply idf + l2 norm and append the CSR arrays
+       and snippets straight to disk.
+    Peak memory is one chunk plus a few n_features-sized vectors.
+    The artifact is written to a new generation directory and published with
+    an atomic symlink swap (see publish()), so readers never see a partial
+    or missing one.
+    extra: optional callable returning DataFrame chunks (a 'text' column)
+    indexed after the history rows, e.g. tickets ingested online; extra_meta
+    is merged into meta.json.
+    """
+    def chunks():
+        yield from iter_chunks(source_path, limit_rows, chunk_rows)
+        if extra is not None:
+            yield from extra()
+
+    params = VECTORIZER_PARAMS
+    n_features = params['n_features']
+    hasher = _hasher(n_features, params['ngram_range'], params['stop_words'])
+
+    df_counts = np.zeros(n_features, dtype=np.int64)
+    n_rows = 0
+    progress = _Progress("index pass 1/2 (document frequencies)")
+    for chunk in chunks():
+        X = hasher.transform(_ticket_texts(chunk))
+        df_counts += np.bincount(X.indices, minlength=n_features)
+        n_rows += X.shape[0]
+        progress.update(X.shape[0])
+
+    # Same smoothed idf as TfidfVectorizer; pruned features get weight 0.
+    idf = (np.log((1 + n_rows) / (1 + df_counts)) + 1).astype(np.float32)
+    idf[df_counts < params['min_df']] = 0
+    idf[df_counts > params['max_df'] * n_rows] = 0
+
+    # df_counts sums to the pre-pruning nnz, so it bounds the final nnz.
+    idx_dtype = np.int32 if df_counts.sum() < np.iinfo(np.int32).max else np.int64
+
+    gen_dir = new_generation(index_dir)
+
+    vectorizer = HashedTfidf(idf, n_features, params['ngram_range'], params['stop_words'])
+    nnz = 0
+    blob_len = 0
+    progress = _Progress("index pass 2/2 (tf-idf rows)")
+    files = {name: open(os.path.join(gen_dir, f"{name}.bin"), 'wb')
+             for name in ('data', 'indices', 'indptr', 'snippet_blob', 'snippet_offsets')}
+    try:
+        files['indptr'].write(np.zeros(1, dtype=idx_dtype).tobytes())
+        files['snippet_offsets'].write(np.zeros(1, dtype=np.int64).tobytes())
+        for chunk in chunks():
+            X = vectorizer.transform(_ticket_texts(chunk))
+            files['data'].write(X.data.astype(np.float32).tobytes())
+            files['indices'].write(X.indices.astype(idx_dtype).tobytes())
+            files['indptr'].write((X.indptr[1:] + nnz).astype(idx_dtype).tobytes())
+            nnz += X.nnz
+
+            encoded = [t[:SNIPPET_CHARS].encode('utf-8') for t in _snippet_texts(chunk)]
+            offsets = np.cumsum([len(b) for b in encoded], dtype=np.int64) + blob_len
+            files['snippet_blob'].write(b"".join(encoded))
+            files['snippet_offsets'].write(offsets.tobytes())
+            if len(offsets):
+                blob_len = int(offsets[-1])
+            progress.update(X.shape[0])
+    finally:
+        for f in files.values():
+            f.close()
+
+    np.save(os.path.join(gen_dir, 'idf.npy'), idf)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'built_at': datetime.now().isoformat(),
+        'source': source_fingerprint(source_path),
+        'limit_rows': limit_rows,
+        'shape': [n_rows, n_features],
+        'nnz': nnz,
+        'index_dtype': np.dtype(idx_dtype).name,
+        'vectorizer_params': params
+    }
+    meta.update(extra_meta or {})
+    with open(os.path.join(gen_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    publish(gen_dir, index_dir)
+    print(f"Saved TF-IDF index for {n_rows} tickets ({nnz} non-zeros) to {index_dir}")
+    return meta
+
+
+def read_meta(index_dir=INDEX_DIR):
+    try:
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def is_fresh(meta, source_path=HIST_PATH, limit_rows=None):
+    """
+    True when the artifact was built from the current source file with the
+    current format and settings.
+    """
+    if not meta or meta.get('format_version') != FORMAT_VERSION:
+        return False
+    if meta.get('limit_rows') != limit_rows:
+        return False
+    try:
+        current = source_fingerprint(source_path)
+    except OSError:
+        return False
+    built_from = meta.get('source', {})
+    return (built_from.get('size') == current['size']
+            and built_from.get('mtime_ns') == current['mtime_ns'])
+
+
+def _map(index_dir, name, dtype):
+    path = os.path.join(index_dir, f"{name}.bin")
+    if os.path.getsize(path) == 0:
+        # np.memmap refuses zero-length files
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def load_index(index_dir=INDEX_DIR):
+    """
+    Load an artifact written by build_index. The matrix and snippet arrays are
+    memory-mapped, so startup cost does not depend on corpus size.
+    Returns (vectorizer, matrix, snippets, meta).
+    """
+    # Resolved once, so a build published meanwhile cannot mix two generations.
+    index_dir = os.path.realpath(index_dir)
+    meta = read_meta(index_dir)
+    if meta is None:
+        raise FileNotFoundError(f"No index artifact in {index_dir}")
+
+    from scipy.sparse import csr_matrix
+    idx_dtype = np.dtype(meta['index_dtype'])
+    matrix = csr_matrix(
+        (_map(index_dir, 'data', np.float32),
+         _map(index_dir, 'indices', idx_dtype),
+         _map(index_dir, 'indptr', idx_dtype)),
+        shape=tuple(meta['shape']),
+        copy=False
+    )
+    params = meta['vectorizer_params']
+    vectorizer = HashedTfidf(
+        np.load(os.path.join(index_dir, 'idf.npy'), mmap_mode='r'),
+        params['n_features'], params['ngram_range'], params['stop_words']
+    )
+    snippets = SnippetStore(_map(index_dir, 'snippet_blob', np.uint8),
+                            _map(index_dir, 'snippet_offsets', np.int64))
+    return vectorizer, matrix, snippets, meta
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the historical-ticket TF-IDF index artifact.")
+    parser.add_argument('--source', default=history_path())
+    parser.add_argument('--limit-rows', type=int, default=None, help="index only the first N rows")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--force', action='store_true', help="rebuild even if the artifact is fresh")
+    args = parser.parse_args()
+    if not args.force and is_fresh(read_meta(), args.source, args.limit_rows):
+        print("Index artifact is up to date:", INDEX_DIR)
+    else:
+        build_index(args.source, limit_rows=args.limit_rows, chunk_rows=args.chunk_rows)
@@ -0,0 +1,267 @@
+import os
+import re
+import socket
+import hashlib
+import threading
+from time import time, sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import dedup
+import storage
+import similarity
+import metrics
+import prompt_compact
+from llm_cache import cache_key
+from llm_pool import chat_completion, LLMDeadlineExceeded
+from llm_classifier import _extract_json, _log_llm, _cache, _LLM_SECONDS, _LLM_FALLBACKS, _LLM_CACHE_HITS
+
+# Bulk KB article generation for content gaps. Gaps are grouped into clusters
+# (exact duplicates after normalization, then near-duplicates by MinHash), a
+# job queued in SQLite holds one item per cluster, and a background runner
+# generates the articles concurrently and adds them to the KB in one batch.
+# Jobs survive restarts: a running job whose owner stops heartbeating is
+# picked up again by the next runner, keeping the articles already generated.
+
+# Tunables (override via environment)
+KB_JOB_CONCURRENCY = int(os.environ.get("KB_JOB_CONCURRENCY", "4"))        # LLM calls in flight per job
+KB_JOB_POLL_SECONDS = float(os.environ.get("KB_JOB_POLL_SECONDS", "5"))
+KB_JOB_STALE_SECONDS = float(os.environ.get("KB_JOB_STALE_SECONDS", "300"))  # reclaim after no heartbeat
+KB_JOB_MAX_ITEMS = int(os.environ.get("KB_JOB_MAX_ITEMS", "500"))          # clusters per job
+KB_GAP_THRESHOLD = float(os.environ.get("KB_GAP_THRESHOLD", "0.7"))        # estimated Jaccard
+KB_MODEL = os.environ.get("KB_MODEL", "gpt-3.5-turbo")
+
+# Bump when the article prompt changes so cached articles are not reused
+# (keys are built from the original gap text, not the compacted prompt).
+KB_PROMPT_VERSION = "kb-v3"
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+_ARTICLES = metrics.counter('kb_articles_generated_total', "KB articles generated for content gaps by result")
+
+_runner_state = {'pid': None}
+_runner_lock = threading.Lock()
+
+
+# ------------------ GAP CLUSTERS ------------------ #
+
+# Gaps are only ever appended, so clusters are extended from the last id seen
+# instead of being recomputed on every page view. Each worker keeps its own
+# copy, built from the content_gaps table in id order; clustering is
+# deterministic, so every worker derives the same cluster keys and a key
+# shown by one worker can be queued through another.
+_clusters = {'last_id': 0, 'clusters': {}, 'by_text': {},
+             'lsh': dedup.MinHashLSH(10 ** 6, threshold=KB_GAP_THRESHOLD)}
+_clusters_lock = threading.Lock()
+
+
+def _normalize(text):
+    return " ".join(_TOKEN.findall((text or "").lower()))
+
+
+def _refresh_clusters():
+    with _clusters_lock:
+        state = _clusters
+        while True:
+            rows = storage.content_gaps_since(state['last_id'])
+            if not rows:
+                break
+            for row in rows:
+                state['last_id'] = row['id']
+                text = row['ticket_excerpt'] or ''
+                norm = _normalize(text)
+                if not norm:
+                    continue
+                key = state['by_text'].get(norm)
+                sig = None
+                if key is None:
+                    sig = dedup.signature(text)
+                    hit = state['lsh'].query(sig) if sig is not None else None
+                    key = hit[0] if hit is not None else None
+                if key is None:
+                    # The first gap of a cluster names it, so keys stay stable as gaps arrive.
+                    key = hashlib.sha1(norm.encode('utf-8')).hexdigest()[:16]
+                    state['clusters'][key] = {'key': key, 'excerpt': text, 'count': 0, 'variants': 0,
+                                              'first_seen': row['timestamp'], 'last_seen': row['timestamp']}
+                    if sig is not None:
+                        state['lsh'].insert(key, sig, None)
+                cluster = state['clusters'][key]
+                cluster['count'] += 1
+                cluster['last_seen'] = max(cluster['last_seen'], row['timestamp'])
+                if norm not in state['by_text']:
+                    state['by_text'][norm] = key
+                    cluster['variants'] += 1
+        return list(state['clusters'].values())
+
+
+def gap_clusters(offset=0, limit=50):
+    """
+    One page of content gap clusters, largest first, each with its gap
+    count, number of distinct excerpts, first/last seen and KB job status.
+    Returns (page, total_clusters, total_gaps).
+    """
+    clusters = sorted(_refresh_clusters(), key=lambda c: (-c['count'], c['first_seen']))
+    status = storage.gap_cluster_status()
+    page = []
+    for cluster in clusters[offset:offset + limit]:
+        row = dict(cluster)
+        row['status'], row['article_id'] = status.get(cluster['key'], (None, None))
+        page.append(row)
+    return page, len(clusters), sum(c['count'] for c in clusters)
+
+
+# ------------------ ARTICLE GENERATION ------------------ #
+
+def generate_article(text, model_name=KB_MODEL):
+    """
+    Ask the LLM for a support article solving `text`: {'title', 'content'}.
+    Answers are cached like classifications (keyed on the gap text, model
+    and KB_PROMPT_VERSION). Raises when no API key is configured, the call
+    fails or the answer cannot be parsed.
+    """
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    key = cache_key(text, model_name, KB_PROMPT_VERSION)
+    if _cache is not None:
+        cached = _cache.get(key)
+        _LLM_CACHE_HITS.inc(result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            return cached
+    prompt_text, tokens_before, tokens_after = prompt_compact.compact(text)
+    system_prompt = (
+        "You are a support knowledge-base writer. Return only a single JSON object (no extra text) "
+        "with these keys: title (string), content (string, a full detailed solution)."
+    )
+    user_prompt = f"Write a clear support article to solve this issue:\n\n'''{prompt_text}'''"
+    try:
+        with _LLM_SECONDS.time(model=model_name):
+            content = chat_completion(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                model_name,
+                api_key,
+                temperature=0.2,
+                max_tokens=800
+            )
+    except LLMDeadlineExceeded:
+        _LLM_FALLBACKS.inc(reason='deadline')
+        raise
+    except Exception:
+        _LLM_FALLBACKS.inc(reason='error')
+        raise
+    parsed = _extract_json(content)
+    _log_llm(text, parsed, content, model_name, (tokens_before, tokens_after))
+    if not isinstance(parsed, dict) or not parsed.get('content'):
+        _LLM_FALLBACKS.inc(reason='unparsed')
+        raise ValueError("LLM answer has no article content")
+    article = {
+        "title": str(parsed.get('title') or "Support Article"),
+        "content": str(parsed['content'])
+    }
+    if _cache is not None:
+        _cache.set(key, article)
+    return article
+
+
+# ------------------ JOB QUEUE ------------------ #
+
+def enqueue(cluster_keys=None, limit=KB_JOB_MAX_ITEMS):
+    """
+    Queue a job for the given gap clusters (default: every cluster that has
+    no article and is not already queued, largest first; clusters still in
+    flight are skipped either way). Returns (job_id, items), job_id None
+    when there is nothing to do.
+    """
+    clusters, _, _ = gap_clusters(0, 10 ** 9)
+    if cluster_keys is not None:
+        wanted = set(cluster_keys)
+        clusters = [c for c in clusters if c['key'] in wanted and c['status'] not in ('pending', 'generated')]
+    else:
+        clusters = [c for c in clusters if c['status'] in (None, 'failed')]
+    items = [{'cluster_key': c['key'], 'excerpt': c['excerpt'], 'gap_count': c['count']}
+             for c in clusters[:limit]]
+    if not items:
+        return None, 0
+    job_id = storage.create_kb_job(items)
+    ensure_runner()
+    return job_id, len(items)
+
+
+def job_status(job_id):
+    jobs = storage.kb_jobs(job_id=job_id, limit=1)
+    if not jobs:
+        return None
+    job = {k: (0 if v is None and k in ('pending', 'generated', 'added', 'failed') else v)
+           for k, v in jobs[0].items()}
+    # Generated articles are only added to the KB at the end, in one batch.
+    job['progress'] = round(1 - job['pending'] / job['items'], 3) if job['items'] else 1.0
+    return job
+
+
+def _generate(item):
+    try:
+        article = generate_article(item['excerpt'])
+        _ARTICLES.inc(result='ok')
+        return dict(item, status='generated', title=article['title'], content=article['content'], error=None)
+    except Exception as e:
+        _ARTICLES.inc(result='error')
+        return dict(item, status='failed', error=str(e)[:500])
+
+
+def _run_job(job_id):
+    pending = storage.kb_job_items(job_id, status='pending')
+    if pending:
+        with ThreadPoolExecutor(max_workers=KB_JOB_CONCURRENCY, thread_name_prefix="kb-job") as pool:
+            for future in as_completed([pool.submit(_generate, item) for item in pending]):
+                # Persisted one by one: a restarted job does not pay for these again.
+                storage.update_kb_job_items([future.result()])
+                storage.kb_job_heartbeat(job_id, time())
+
+    generated = storage.kb_job_items(job_id, status='generated')
+    for item in generated:
+        # Derived from the item so a re-run after a crash replaces instead of duplicating.
+        item['article_id'] = f"KB-J{job_id}-{item['id']}"
+        item['status'] = 'added'
+    similarity.add_kb_articles([{
+        'article_id': item['article_id'],
+        'title': item['title'],
+        'content': item['content'],
+        'link': '#'
+    } for item in generated])
+    storage.update_kb_job_items(generated)
+    storage.finish_kb_job(job_id, 'done')
+    print(f"KB job {job_id}: {len(generated)} articles added")
+
+
+def _runner_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        job_id = None
+        try:
+            now = time()
+            job_id = storage.claim_kb_job(owner, now, now - KB_JOB_STALE_SECONDS)
+            if job_id is not None:
+                _run_job(job_id)
+                continue
+        except Exception as e:
+            print("KB job runner error:", e)
+            if job_id is not None:
+                try:
+                    storage.finish_kb_job(job_id, 'failed', str(e)[:500])
+                except Exception:
+                    pass
+        sleep(KB_JOB_POLL_SECONDS)
+
+
+def ensure_runner():
+    # Threads do not survive a gunicorn fork, so start one per pid; jobs are
+    # claimed atomically, so several workers can poll the same queue.
+    if _runner_state['pid'] == os.getpid():
+        return
+    with _runner_lock:
+        if _runner_state['pid'] == os.getpid():
+            return
+        _runner_state['pid'] = os.getpid()
+        threading.Thread(target=_runner_loop, name="kb-jobs", daemon=True).start()
@@ -0,0 +1,158 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from time import time
+from collections import OrderedDict
+
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, "data")
+CACHE_PATH = os.path.join(DATA_DIR, "llm_cache.sqlite3")
+
+# Tunables (override via environment)
+CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))          # seconds
+CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "50000"))        # on disk
+CACHE_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "1024"))   # in memory
+
+# Trim the disk tier back under CACHE_MAX_ENTRIES every this many writes
+_EVICT_EVERY = 100
+
+
+def normalize_text(text):
+    """
+    Case- and whitespace-insensitive form of a prompt, so resubmissions of
+    the same ticket share a cache entry.
+    """
+    return " ".join((text or "").lower().split())
+
+
+def cache_key(text, model_name, prompt_version):
+    raw = "\0".join([prompt_version, model_name, normalize_text(text)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for parsed LLM responses: an in-process LRU in front of a
+    SQLite table shared by all workers. Entries expire after `ttl` seconds;
+    the disk tier is trimmed to `max_entries` by least-recent access.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 memory_entries=CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._writes = 0
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self):
+        # Connections must not cross a fork (gunicorn workers), so reopen per pid.
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+            self._memory.clear()
+        return self._conn
+
+    def get(self, key):
+        now = time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return json.loads(value)
+                del self._memory[key]
+            try:
+                db = self._db()
+                row = db.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    db.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                db.commit()
+            except sqlite3.Error:
+                self.misses += 1
+                return None
+            self._remember(key, row[1], row[0])
+            self.hits += 1
+            self.disk_hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time()
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, encoded, now, now)
+                )
+                self._writes += 1
+                if self._writes % _EVICT_EVERY == 0:
+                    self._evict(db, now)
+                db.commit()
+            except sqlite3.Error:
+                pass
+            # After _db(): opening the connection (first use, or after fork) resets the memory tier.
+            self._remember(key, now, encoded)
+
+    def _remember(self, key, created_at, encoded):
+        self._memory[key] = (created_at, encoded)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, db, now):
+        cur = db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        self.evictions += cur.rowcount
+        count = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            cur = db.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            self.evictions += cur.rowcount
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'memory_entries': len(self._memory)
+        }
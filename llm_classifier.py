@@ -1,19 +1,32 @@
 import os
 import re
 import json
+from time import perf_counter
 from datetime import datetime
+from functools import lru_cache
 
-# OpenAI client (must be installed in venv)
-try:
-    import openai  # type: ignore
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
+import storage
+from append_log import AppendLog
+from llm_cache import LLMCache, CACHE_ENABLED, cache_key
+from llm_pool import chat_completion, LLMDeadlineExceeded
+import local_classifier
+import prompt_compact
+import metrics
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
-LLM_LOG_PATH = os.path.join(DATA_DIR, "llm_logs.jsonl")
+_llm_log = AppendLog(sink=storage.add_llm_logs)
+
+# Bump when the system/user prompt changes so cached answers are not reused.
+# Keys are built from the original ticket text, so prompt_compact changes
+# (or a reloaded index with other idf weights) keep existing entries valid.
+PROMPT_VERSION = "v3"
+_cache = LLMCache() if CACHE_ENABLED else None
+
+_LLM_SECONDS = metrics.histogram('llm_request_seconds', "LLM chat completion latency in seconds (incl. retries)")
+_LLM_FALLBACKS = metrics.counter('llm_fallback_total', "LLM calls that failed or could not be parsed, by reason")
+_LLM_CACHE_HITS = metrics.counter('llm_cache_requests_total', "LLM cache lookups by result")
 
 # keyword fallback maps
 KEYWORDS_MAP = {
@@ -51,52 +64,127 @@ def _extract_json(text):
     except Exception:
         return None
 
-def _rule_based(text):
-    txt = (text or "").lower()
+def _compile_keyword_matcher():
+    """
+    Compile every keyword of KEYWORDS_MAP and TAGS_MAP into one regex that
+    finds them all in a single scan of the lowercased text. Keywords match
+    on word boundaries (so 'add' no longer fires inside 'address'), allow a
+    plural 's'/'es', and tolerate any whitespace inside phrases. The pattern is a
+    lookahead so overlapping keywords starting at the same position are not
+    lost; `implied` maps a matched keyword to every keyword it contains
+    ('access denied' -> 'access').
+    """
+    keywords = sorted(
+        {kw for kws in list(KEYWORDS_MAP.values()) + list(TAGS_MAP.values()) for kw in kws},
+        key=len, reverse=True
+    )
+    alternation = "|".join(r'\s+'.join(map(re.escape, kw.split())) for kw in keywords)
+    pattern = re.compile(r'(?=\b(' + alternation + r')(?:e?s)?\b)')
+    implied = {
+        kw: frozenset(k for k in keywords if re.search(r'\b' + re.escape(k) + r'\b', kw))
+        for kw in keywords
+    }
+    return pattern, implied
+
+_KEYWORD_RE, _KEYWORD_IMPLIES = _compile_keyword_matcher()
+
+def _matched_keywords(matches):
+    found = set()
+    for m in set(matches):
+        found |= _KEYWORD_IMPLIES[" ".join(m.split())]
+    return frozenset(found)
+
+@lru_cache(maxsize=4096)
+def _rules_for(found):
     best = ('general', 0)
     for cat, kws in KEYWORDS_MAP.items():
-        matches = sum(1 for kw in kws if kw in txt)
+        matches = sum(1 for kw in kws if kw in found)
         if matches > best[1]:
             best = (cat, matches)
     category = best[0]
-    tags = []
-    for tag, kws in TAGS_MAP.items():
-        for kw in kws:
-            if kw in txt:
-                tags.append(tag)
-                break
+    tags = tuple(tag for tag, kws in TAGS_MAP.items() if any(kw in found for kw in kws))
     sol, conf = SOLUTIONS_MAP.get(category, SOLUTIONS_MAP['general'])
     suggested_priority = 'High' if 'urgent' in tags else 'Medium'
+    return category, tags, suggested_priority, sol, conf
+
+def _rules_dict(found):
+    category, tags, suggested_priority, sol, conf = _rules_for(found)
     return {
         'category': category,
-        'tags': tags,
+        'tags': list(tags),
         'suggested_priority': suggested_priority,
         'solution': sol,
         'confidence': conf
     }
 
-def _log_llm(input_text, parsed_obj, raw_content, model_name):
+def _rule_based(text):
+    return _rules_dict(_matched_keywords(_KEYWORD_RE.findall((text or "").lower())))
+
+def classify_rules_batch(texts):
+    """
+    Rule-based classification of a pandas Series of texts (e.g. for bulk
+    relabeling of history). Returns a DataFrame with the _rule_based fields,
+    aligned to the input index.
+    """
+    import pandas as pd
+    found = texts.fillna('').astype(str).str.lower().str.findall(_KEYWORD_RE).map(_matched_keywords)
+    return pd.DataFrame.from_records([_rules_dict(f) for f in found], index=texts.index,
+                                     columns=['category', 'tags', 'suggested_priority', 'solution', 'confidence'])
+
+def _log_llm(input_text, parsed_obj, raw_content, model_name, tokens=(None, None)):
     try:
         entry = {
             'timestamp': datetime.now().isoformat(),
             'model': model_name,
             'input_snippet': (input_text or "")[:1000],
             'parsed': parsed_obj,
-            'raw_response': (raw_content or "")[:4000]
+            'raw_response': (raw_content or "")[:4000],
+            'tokens_before': tokens[0],
+            'tokens_after': tokens[1]
         }
-        with open(LLM_LOG_PATH, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        _llm_log.append(entry)
     except Exception:
         pass
 
-def classify_text(text, model_name="gpt-3.5-turbo"):
+def cache_stats():
+    return _cache.stats() if _cache is not None else {}
+
+metrics.gauge('llm_cache_hit_ratio', "Share of LLM cache lookups served from the cache",
+              lambda: cache_stats().get('hit_rate'))
+metrics.gauge('llm_cache_entries', "Entries held in the in-memory LLM cache",
+              lambda: cache_stats().get('memory_entries'))
+
+def classify_text(text, model_name="gpt-3.5-turbo", deadline_seconds=None):
     """
     Returns dict: category, tags, suggested_priority, solution, confidence.
-    Uses OpenAI if OPENAI_API_KEY env var present and openai installed; otherwise falls back to rule-based.
+    Uses OpenAI if OPENAI_API_KEY env var present; otherwise falls back to rule-based.
+    The call runs on the llm_pool executor under a deadline (LLM_DEADLINE_SECONDS);
+    when it passes, or the call fails, the rule-based result is returned.
+    Callers with their own latency budget pass what is left of it as
+    `deadline_seconds` (capped at LLM_DEADLINE_SECONDS).
+    Parsed LLM answers are cached by normalized text + model + PROMPT_VERSION.
+    The local classifier answers first; only tickets it is less than
+    LOCAL_CONFIDENCE sure about are escalated to the LLM, with the text cut
+    down to PROMPT_TOKEN_BUDGET tokens (prompt_compact; only for the prompt).
     """
+    start = perf_counter()
+    rules = _rule_based(text)
+    local = local_classifier.predict(text, rules)
+    if local is not None and local['confidence'] >= local_classifier.LOCAL_CONFIDENCE:
+        local_classifier.record('local', perf_counter() - start)
+        return local
+
     api_key = os.environ.get("OPENAI_API_KEY")
-    if OPENAI_AVAILABLE and api_key:
-        openai.api_key = api_key
+    if api_key:
+        key = cache_key(text, model_name, PROMPT_VERSION)
+        if _cache is not None:
+            cached = _cache.get(key)
+            _LLM_CACHE_HITS.inc(result='hit' if cached is not None else 'miss')
+            if cached is not None:
+                local_classifier.record('llm')
+                return cached
+        prompt_text, tokens_before, tokens_after = prompt_compact.compact(text)
+        tokens = (tokens_before, tokens_after)
         system_prompt = (
             "You are an assistant that MUST return only a single JSON object (no extra text) "
             "with these keys: category (string), tags (array of strings), "
@@ -104,18 +192,21 @@ def classify_text(text, model_name="gpt-3.5-turbo"):
             "If uncertain set confidence < 0.5. Use concise values and standard category names. "
             "Do NOT include explanations or extra text."
         )
-        user_prompt = f"Ticket text:\n\n'''{text}'''"
+        user_prompt = f"Ticket text:\n\n'''{prompt_text}'''"
         try:
-            resp = openai.ChatCompletion.create(
-                model=model_name,
-                messages=[
-                    {"role":"system", "content": system_prompt},
-                    {"role":"user", "content": user_prompt}
-                ],
-                temperature=0.0,
-                max_tokens=400
-            )
-            content = resp['choices'][0]['message']['content']
+            with _LLM_SECONDS.time(model=model_name):
+                content = chat_completion(
+                    [
+                        {"role":"system", "content": system_prompt},
+                        {"role":"user", "content": user_prompt}
+                    ],
+                    model_name,
+                    api_key,
+                    deadline_seconds=deadline_seconds,
+                    temperature=0.0,
+                    max_tokens=400
+                )
+            local_classifier.record('llm', perf_counter() - start)
             parsed = _extract_json(content)
             if parsed and isinstance(parsed, dict):
                 parsed.setdefault('category', 'general')
@@ -127,13 +218,24 @@ def classify_text(text, model_name="gpt-3.5-turbo"):
                     parsed['confidence'] = float(parsed['confidence'])
                 except Exception:
                     parsed['confidence'] = 0.0
-                _log_llm(text, parsed, content, model_name)
+                _log_llm(text, parsed, content, model_name, tokens)
+                if _cache is not None:
+                    _cache.set(key, parsed)
                 return parsed
-            parsed_fb = _rule_based(text)
-            _log_llm(text, parsed_fb, content, model_name)
+            _LLM_FALLBACKS.inc(reason='unparsed')
+            parsed_fb = rules
+            _log_llm(text, parsed_fb, content, model_name, tokens)
             return parsed_fb
+        except LLMDeadlineExceeded as e:
+            _LLM_FALLBACKS.inc(reason='deadline')
+            local_classifier.record('llm', perf_counter() - start)
+            _log_llm(text, {'error': f'deadline exceeded: {e}'}, None, model_name, tokens)
+            return rules
         except Exception as e:
-            _log_llm(text, {'error': str(e)}, None, model_name)
-            return _rule_based(text)
+            _LLM_FALLBACKS.inc(reason='error')
+            local_classifier.record('llm', perf_counter() - start)
+            _log_llm(text, {'error': str(e)}, None, model_name, tokens)
+            return rules
     else:
-        return _rule_based(text)
\ No newline at end of file
+        local_classifier.record('rules')
+        return rules
\ No newline at end of file
@@ -0,0 +1,150 @@
+import os
+import random
+import threading
+from time import monotonic, sleep
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# OpenAI-compatible endpoint; point OPENAI_BASE_URL at stub_llm_server.py for local testing.
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+# Tunables (override via environment)
+LLM_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", "8"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "20"))
+LLM_RATE_PER_SEC = float(os.environ.get("LLM_RATE_PER_SEC", "5"))
+LLM_RATE_BURST = int(os.environ.get("LLM_RATE_BURST", "10"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))   # seconds, doubled per retry
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMDeadlineExceeded(Exception):
+    pass
+
+
+class LLMRequestError(Exception):
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `burst` banked.
+    Shared by all pool threads of this process.
+    """
+
+    def __init__(self, rate=LLM_RATE_PER_SEC, burst=LLM_RATE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """
+        Take one token, waiting until one is available or `deadline`
+        (a monotonic() timestamp) passes. Returns False on timeout.
+        """
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            sleep(wait)
+
+
+_bucket = TokenBucket()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Created lazily and per pid: threads do not survive a gunicorn fork.
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _post_chat(payload, api_key, timeout):
+    import requests
+    try:
+        resp = requests.post(
+            f"{OPENAI_BASE_URL}/chat/completions",
+            json=payload,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout
+        )
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise LLMRequestError(f"LLM request failed: {e}", retryable=True)
+    if resp.status_code != 200:
+        retry_after = resp.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        raise LLMRequestError(
+            f"LLM endpoint returned HTTP {resp.status_code}: {resp.text[:200]}",
+            retryable=resp.status_code in RETRYABLE_STATUS,
+            retry_after=retry_after
+        )
+    return resp.json()['choices'][0]['message']['content']
+
+
+def _call_with_retries(payload, api_key, deadline):
+    attempt = 0
+    while True:
+        if not _bucket.acquire(deadline):
+            raise LLMDeadlineExceeded("rate limit wait exceeded the deadline")
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("deadline passed before the request was sent")
+        try:
+            return _post_chat(payload, api_key, timeout=remaining)
+        except LLMRequestError as e:
+            attempt += 1
+            if not e.retryable or attempt > LLM_MAX_RETRIES:
+                raise
+            backoff = e.retry_after or LLM_BACKOFF_BASE * (2 ** (attempt - 1))
+            backoff *= random.uniform(0.8, 1.2)
+            if monotonic() + backoff >= deadline:
+                raise LLMDeadlineExceeded(f"no time left to retry after: {e}")
+            sleep(backoff)
+
+
+def chat_completion(messages, model_name, api_key, deadline_seconds=None, **params):
+    """
+    Run one chat completion on the bounded LLM pool and return the message
+    content. Rate limiting, retries with exponential backoff and the HTTP
+    timeouts all share one per-call deadline (LLM_DEADLINE_SECONDS, or less
+    when the caller passes `deadline_seconds`); LLMDeadlineExceeded is raised
+    when it passes so callers can fall back.
+    """
+    if deadline_seconds is None:
+        deadline_seconds = LLM_DEADLINE_SECONDS
+    deadline_seconds = min(deadline_seconds, LLM_DEADLINE_SECONDS)
+    if deadline_seconds <= 0:
+        # The caller's budget is already spent: don't tie up a pool thread
+        raise LLMDeadlineExceeded("no time left for the LLM call")
+    deadline = monotonic() + deadline_seconds
+    payload = dict(params, model=model_name, messages=messages)
+    future = _get_executor().submit(_call_with_retries, payload, api_key, deadline)
+    try:
+        return future.result(timeout=max(0.0, deadline - monotonic()))
+    except FutureTimeout:
+        future.cancel()
+        raise LLMDeadlineExceeded(f"LLM call exceeded {deadline_seconds:.1f}s deadline")
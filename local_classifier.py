@@ -0,0 +1,457 @@
+import os
+import copy
+import json
+import pickle
+import argparse
+import threading
+from time import time, sleep, perf_counter
+from datetime import datetime
+from collections import Counter, deque
+
+import numpy as np
+
+import index_store
+import storage
+import metrics
+
+# File lock so only one worker trains the shared model file at a time.
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows: no cross-process training lock
+    fcntl = None
+
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, "data")
+MODEL_PATH = os.path.join(DATA_DIR, "models", "local_classifier.pkl")
+
+# Tunables (override via environment)
+LOCAL_MODEL_ENABLED = os.environ.get("LOCAL_MODEL_ENABLED", "1") != "0"
+LOCAL_CONFIDENCE = float(os.environ.get("LOCAL_CONFIDENCE", "0.8"))     # below: escalate to the LLM
+LOCAL_TRAIN_ROWS = int(os.environ.get("LOCAL_TRAIN_ROWS", "200000"))    # history rows for the initial fit
+LOCAL_EPOCHS = int(os.environ.get("LOCAL_EPOCHS", "3"))
+LOCAL_POLL_SECONDS = float(os.environ.get("LOCAL_POLL_SECONDS", "10"))  # feedback -> partial_fit
+LOCAL_RETRY_MAX_SECONDS = float(os.environ.get("LOCAL_RETRY_MAX_SECONDS", "600"))  # backoff cap after errors
+FEEDBACK_WEIGHT = float(os.environ.get("LOCAL_FEEDBACK_WEIGHT", "5"))   # agent labels vs history labels
+MIN_TRAIN_ROWS = 50
+
+# Hashed features in the index's n-gram space; no idf, so the model stays
+# valid when the similarity index is rebuilt. 2**18 keeps coef_ small.
+N_FEATURES = 2 ** 18
+GENERIC_SOLUTION = "Support will review this ticket."
+
+_model = None
+_state = {'pid': None}
+_lock = threading.Lock()
+
+# Routing stats for the escalation report (recent samples only)
+_decisions = Counter()
+_latency = {'local': deque(maxlen=2048), 'llm': deque(maxlen=2048)}
+
+_ROUTES = metrics.counter('classifier_route_total', "classify_text answers by route (local, llm, rules)")
+_PREDICT_SECONDS = metrics.histogram('local_classifier_seconds', "Local classifier prediction time in seconds")
+
+
+def _hasher():
+    params = index_store.VECTORIZER_PARAMS
+    return index_store._hasher(N_FEATURES, params['ngram_range'], params['stop_words'])
+
+
+def features(texts, hasher=None):
+    """
+    Sublinear tf, l2-normalised per row (by hand: sklearn's normalize()
+    validation costs more than the math for a single ticket).
+    """
+    X = (hasher or _hasher()).transform(texts)
+    np.log1p(X.data, out=X.data)
+    lengths = np.diff(X.indptr)
+    norms = np.sqrt(np.bincount(np.repeat(np.arange(X.shape[0]), lengths), weights=X.data ** 2,
+                                minlength=X.shape[0]))
+    norms[norms == 0] = 1
+    X.data /= np.repeat(norms, lengths).astype(X.data.dtype)
+    return X
+
+
+def _proba(model, X):
+    """
+    model.predict_proba for one sparse row (OvR sigmoids, normalised), but
+    only touching the coef_ columns of the row's features; sklearn's version
+    copies the whole coef_ matrix on every call.
+    """
+    scores = model.coef_[:, X.indices] @ X.data + model.intercept_
+    p = 1.0 / (1.0 + np.exp(-scores))
+    if len(p) == 1:
+        return np.array([1.0 - p[0], p[0]])
+    total = p.sum()
+    return p / total if total > 0 else np.full(len(p), 1.0 / len(p))
+
+
+def category_label(label):
+    """
+    The classify_text category a history or feedback label stands for
+    ('Payment' and 'Billing' -> 'payment'), or None for labels outside that
+    vocabulary ('cat0', 'high'): those are not trained on, so every local
+    answer is a category the rules and the LLM also use.
+    """
+    from llm_classifier import KEYWORDS_MAP, _rule_based   # llm_classifier imports this module
+    label = " ".join(str(label or '').lower().split())
+    if label in KEYWORDS_MAP:
+        return label
+    category = _rule_based(label)['category'] if label else 'general'
+    return category if category != 'general' else None
+
+
+def _known_categories(model):
+    from llm_classifier import KEYWORDS_MAP
+    return set(model.meta['classes']) <= set(KEYWORDS_MAP)
+
+
+def _new_sgd():
+    # log_loss gives predict_proba, which is the confidence we gate on
+    from sklearn.linear_model import SGDClassifier
+    return SGDClassifier(loss='log_loss', alpha=1e-5, random_state=0)
+
+
+class LocalClassifier:
+    """
+    Linear (SGD, log loss) models for category and, once feedback has at
+    least two priorities, suggested priority. learn() applies new feedback
+    with partial_fit; labels not seen at the last full train are skipped
+    until the next one. Category labels go through category_label().
+    """
+
+    def __init__(self, category_model, priority_model, meta):
+        self.category_model = category_model
+        self.priority_model = priority_model
+        self.meta = meta
+        self.hasher = _hasher()
+
+    def predict(self, text):
+        X = features([text], self.hasher)
+        proba = _proba(self.category_model, X)
+        best = int(np.argmax(proba))
+        category = str(self.category_model.classes_[best])
+        priority = None
+        if self.priority_model is not None:
+            p_proba = _proba(self.priority_model, X)
+            priority = str(self.priority_model.classes_[int(np.argmax(p_proba))])
+        return category, float(proba[best]), priority
+
+    def learn(self, rows):
+        """
+        partial_fit on feedback rows (original_text, final_category,
+        final_priority); returns the number of rows used.
+        """
+        used = 0
+        for model, field in ((self.category_model, 'final_category'), (self.priority_model, 'final_priority')):
+            if model is None:
+                continue
+            known = set(model.classes_)
+            texts, labels = [], []
+            for r in rows:
+                y = r.get(field) or ''
+                if field == 'final_category':
+                    y = category_label(y)
+                if y in known and (r.get('original_text') or '').strip():
+                    texts.append(r['original_text'])
+                    labels.append(y)
+            if texts:
+                model.partial_fit(features(texts, self.hasher), labels,
+                                  sample_weight=np.full(len(texts), FEEDBACK_WEIGHT))
+                used = max(used, len(texts))
+        if rows:
+            self.meta['feedback_upto'] = max(self.meta['feedback_upto'], max(r['id'] for r in rows))
+            self.meta['feedback_rows'] = self.meta.get('feedback_rows', 0) + used
+        return used
+
+
+def _all_feedback():
+    after, rows = 0, []
+    while True:
+        batch = storage.feedback_since(after, limit=5000)
+        if not batch:
+            return rows
+        rows.extend(batch)
+        after = batch[-1]['id']
+
+
+def _history_chunks(source, limit_rows):
+    for chunk in index_store.iter_chunks(source, limit_rows=limit_rows, text_only=False):
+        if 'Category' not in chunk.columns:
+            return
+        labels = chunk['Category'].fillna('').astype(str)
+        labels = labels.map({label: category_label(label) for label in labels.unique()})
+        chunk, labels = chunk[labels.notna()], labels[labels.notna()]
+        if len(chunk):
+            yield index_store._snippet_texts(chunk).tolist(), labels.tolist()
+
+
+def train(source=None, limit_rows=LOCAL_TRAIN_ROWS, epochs=LOCAL_EPOCHS):
+    """
+    Full fit from the history's Category column plus all feedback (weighted
+    FEEDBACK_WEIGHT), with labels mapped by category_label(). History is streamed in chunks with partial_fit, so
+    memory does not grow with limit_rows. Returns None without enough data.
+    """
+    started = time()
+    feedback = [r for r in _all_feedback() if (r.get('original_text') or '').strip()]
+    fb_categories = [dict(r, final_category=category_label(r.get('final_category'))) for r in feedback]
+    fb_categories = [r for r in fb_categories if r['final_category'] is not None]
+    hasher = _hasher()
+
+    classes = {r['final_category'] for r in fb_categories}
+    history_rows = 0
+    if source and os.path.exists(source):
+        for _, labels in _history_chunks(source, limit_rows):
+            classes.update(labels)
+            history_rows += len(labels)
+    if len(classes) < 2 or history_rows + len(fb_categories) < MIN_TRAIN_ROWS:
+        print("Local classifier: not enough labelled tickets to train")
+        return None
+    classes = np.array(sorted(classes))
+
+    category_model = _new_sgd()
+    for _ in range(max(1, epochs)):
+        if history_rows:
+            for texts, labels in _history_chunks(source, limit_rows):
+                category_model.partial_fit(features(texts, hasher), labels, classes=classes)
+        if fb_categories:
+            category_model.partial_fit(features([r['original_text'] for r in fb_categories], hasher),
+                                       [r['final_category'] for r in fb_categories], classes=classes,
+                                       sample_weight=np.full(len(fb_categories), FEEDBACK_WEIGHT))
+
+    priority_model = None
+    fb_priorities = [r for r in feedback if (r.get('final_priority') or '').strip()]
+    if len({r['final_priority'] for r in fb_priorities}) >= 2 and len(fb_priorities) >= MIN_TRAIN_ROWS:
+        priority_model = _new_sgd()
+        X = features([r['original_text'] for r in fb_priorities], hasher)
+        y = [r['final_priority'] for r in fb_priorities]
+        for _ in range(max(1, epochs)):
+            priority_model.partial_fit(X, y, classes=np.array(sorted(set(y))))
+
+    meta = {
+        'trained_at': datetime.now().isoformat(),
+        'history_rows': history_rows,
+        'feedback_rows': len(fb_categories),
+        'feedback_upto': max((r['id'] for r in feedback), default=0),
+        'classes': [str(c) for c in classes],
+        'priority_model': priority_model is not None
+    }
+    print(f"Trained local classifier on {history_rows} history + {len(fb_categories)} feedback tickets "
+          f"({len(classes)} categories) in {time() - started:.1f}s")
+    return LocalClassifier(category_model, priority_model, meta)
+
+
+def save(model, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'category': model.category_model, 'priority': model.priority_model, 'meta': model.meta}, f)
+    with open(tmp_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(model.meta, f)
+    os.replace(tmp_path, path)
+    os.replace(tmp_path + '.json', path + '.json')
+
+
+def load(path=MODEL_PATH):
+    with open(path, 'rb') as f:
+        saved = pickle.load(f)
+    return LocalClassifier(saved['category'], saved['priority'], saved['meta'])
+
+
+def _history_source():
+    import similarity   # same history file as the similarity index
+    return index_store.history_path(similarity.HIST_PATH, similarity.LEGACY_HIST_PATH)
+
+
+def _load_saved():
+    # Models saved before labels were mapped (classes like 'Payment' or
+    # 'cat0') are retrained instead of answering with those.
+    if not os.path.exists(MODEL_PATH):
+        return None
+    model = load(MODEL_PATH)
+    if _known_categories(model):
+        return model
+    print("Local classifier: saved model has unmapped categories, retraining")
+    return None
+
+
+def _load_or_train():
+    """
+    The saved model when there is one; otherwise train it (one worker at a
+    time, the others wait for the lock and then load its result).
+    """
+    model = _load_saved()
+    if model is not None:
+        return model
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    with open(f"{MODEL_PATH}.lock", 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            model = _load_saved()
+            if model is not None:
+                return model
+            model = train(_history_source())
+            if model is not None:
+                save(model)
+            return model
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _training_inputs():
+    # Changes when there is data a failed training attempt did not see.
+    source = _history_source()
+    history = index_store.source_fingerprint(source) if os.path.exists(source) else None
+    return history, storage.max_feedback_id()
+
+
+def _trainer_loop():
+    global _model
+    untrainable = None      # inputs the last attempt found too few labels in
+    delay = LOCAL_POLL_SECONDS
+    while True:
+        try:
+            if _model is None:
+                inputs = _training_inputs()
+                if inputs != untrainable:
+                    _model = _load_or_train()
+                    untrainable = None if _model is not None else inputs
+            else:
+                rows = storage.feedback_since(_model.meta['feedback_upto'], limit=5000)
+                if rows:
+                    # Update a copy and swap it in, so predict() never sees a half-applied step.
+                    updated = copy.deepcopy(_model)
+                    updated.learn(rows)
+                    _model = updated
+                    _save_if_newer(updated)
+            delay = LOCAL_POLL_SECONDS
+        except Exception as e:
+            print(f"Local classifier trainer error (retrying in {delay:.0f}s):", e)
+            sleep(delay)
+            delay = min(delay * 2, LOCAL_RETRY_MAX_SECONDS)
+            continue
+        sleep(LOCAL_POLL_SECONDS)
+
+
+def _save_if_newer(model):
+    # Every worker applies the same feedback in the same order; persisting the
+    # furthest one lets restarted workers skip what it already learned.
+    try:
+        with open(MODEL_PATH + '.json', 'r', encoding='utf-8') as f:
+            saved_upto = json.load(f)['feedback_upto']
+    except Exception:
+        saved_upto = -1
+    if model.meta['feedback_upto'] > saved_upto:
+        save(model)
+
+
+def _ensure_trainer():
+    # Threads do not survive a gunicorn fork, so start one per pid.
+    if _state['pid'] == os.getpid():
+        return
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        threading.Thread(target=_trainer_loop, name="local-classifier", daemon=True).start()
+
+
+def preload():
+    """
+    Load (or train) the model now, without starting the trainer. Called at
+    import with STARTUP_MODE=preload, i.e. once in the gunicorn master: the
+    forked workers share it until their trainer applies new feedback.
+    """
+    global _model
+    if not LOCAL_MODEL_ENABLED or _model is not None:
+        return
+    try:
+        _model = _load_or_train()
+    except Exception as e:
+        # The workers' trainers retry
+        print("Local classifier preload failed:", e)
+
+
+def predict(text, rules):
+    """
+    Local answer in classify_text's format, or None while no model is
+    loaded. `rules` is the rule-based result, reused for tags and, where the
+    model has no say, priority and solution.
+    """
+    if not LOCAL_MODEL_ENABLED:
+        return None
+    _ensure_trainer()
+    model = _model
+    if model is None:
+        return None
+    start = perf_counter()
+    category, confidence, priority = model.predict(text)
+    _PREDICT_SECONDS.observe(perf_counter() - start)
+    return {
+        'category': category,
+        'tags': rules['tags'],
+        'suggested_priority': priority or rules['suggested_priority'],
+        'solution': rules['solution'] if category == rules['category'] else GENERIC_SOLUTION,
+        'confidence': round(confidence, 4),
+        'source': 'local_model'
+    }
+
+
+def record(route, seconds=None):
+    """
+    Count one classify_text answer by route ('local', 'llm' or 'rules') and
+    keep its latency for the report.
+    """
+    _decisions[route] += 1
+    _ROUTES.inc(route=route)
+    if seconds is not None and route in _latency:
+        _latency[route].append(seconds)
+
+
+def _p50_ms(samples):
+    return round(float(np.percentile(list(samples), 50)) * 1000, 3) if samples else None
+
+
+def _escalation_rate():
+    # Only calls that could have gone to the LLM: without an API key
+    # classify_text answers 'rules', which is not an escalation.
+    answered = _decisions['local'] + _decisions['llm']
+    return round(_decisions['llm'] / answered, 4) if answered else None
+
+
+def report():
+    """
+    Escalation rate (share of local + LLM answers that went to the LLM),
+    rule-only answers, and p50 latency of local answers vs LLM calls in
+    this worker.
+    """
+    p50_local, p50_llm = _p50_ms(_latency['local']), _p50_ms(_latency['llm'])
+    model = _model
+    return {
+        'enabled': LOCAL_MODEL_ENABLED,
+        'confidence_threshold': LOCAL_CONFIDENCE,
+        'decisions': dict(_decisions),
+        'escalation_rate': _escalation_rate(),
+        'rules_answers': _decisions['rules'],
+        'p50_local_ms': p50_local,
+        'p50_llm_ms': p50_llm,
+        'p50_saved_ms': round(p50_llm - p50_local, 3) if p50_local is not None and p50_llm is not None else None,
+        'model': model.meta if model is not None else None
+    }
+
+
+metrics.gauge('local_classifier_escalation_ratio', "Share of classifications escalated to the LLM",
+              _escalation_rate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the local ticket classifier from history + feedback.")
+    parser.add_argument('--source', default=None, help="ticket history (default: the similarity index's)")
+    parser.add_argument('--rows', type=int, default=LOCAL_TRAIN_ROWS)
+    parser.add_argument('--out', default=MODEL_PATH)
+    args = parser.parse_args()
+    trained = train(args.source or _history_source(), limit_rows=args.rows)
+    if trained is not None:
+        save(trained, args.out)
+        print("Saved", args.out, json.dumps(trained.meta)[:300])
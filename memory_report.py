@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+
+# Memory accounting for the web server process tree from /proc (Linux).
+# Rss double-counts pages shared between gunicorn workers; Pss splits them
+# evenly, and Private_* is what a worker would free on exit, i.e. what each
+# extra worker really costs.
+
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'Anonymous', 'Swap')
+
+
+def smaps_rollup(pid='self'):
+    """
+    {field: kB} from /proc/<pid>/smaps_rollup, or None where unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    out = {}
+    for line in lines[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(':') in FIELDS:
+            out[parts[0].rstrip(':')] = int(parts[1])
+    return out
+
+
+def _cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            return f.read().replace(b'\0', b' ').decode('utf-8', errors='ignore').strip()
+    except OSError:
+        return ''
+
+
+def children(pid):
+    kids = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", 'r') as f:
+                kids.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return kids
+
+
+def report(root_pid):
+    """
+    Memory of root_pid and its direct children (a gunicorn master and its
+    workers), in MB, plus totals and the average private memory per child.
+    """
+    processes = []
+    for pid in [root_pid] + children(root_pid):
+        stats = smaps_rollup(pid)
+        if stats is None:
+            continue
+        row = {'pid': pid, 'role': 'master' if pid == root_pid else 'worker',
+               'cmd': _cmdline(pid)[:80]}
+        row.update({k.lower() + '_mb': round(v / 1024, 1) for k, v in stats.items()})
+        row['private_mb'] = round((stats.get('Private_Clean', 0) + stats.get('Private_Dirty', 0)) / 1024, 1)
+        processes.append(row)
+    workers = [p for p in processes if p['role'] == 'worker']
+    return {
+        'root_pid': root_pid,
+        'processes': processes,
+        'total_rss_mb': round(sum(p.get('rss_mb', 0) for p in processes), 1),
+        'total_pss_mb': round(sum(p.get('pss_mb', 0) for p in processes), 1),
+        'private_per_worker_mb': round(sum(p['private_mb'] for p in workers) / len(workers), 1) if workers else None
+    }
+
+
+def server_report():
+    """
+    report() for the gunicorn tree this process belongs to, or for this
+    process alone when it is not a gunicorn worker.
+    """
+    parent = os.getppid()
+    if 'gunicorn' in _cmdline(parent):
+        return report(parent)
+    return report(os.getpid())
+
+
+if __name__ == '__main__':
+    # python memory_report.py <gunicorn master pid>
+    pid = int(sys.argv[1]) if len(sys.argv) > 1 else os.getpid()
+    print(json.dumps(report(pid), indent=2))
@@ -0,0 +1,185 @@
+import os
+import threading
+from time import perf_counter
+from bisect import bisect_left
+
+# Set METRICS_ENABLED=0 to turn every timer/counter into a no-op.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+PREFIX = "ticket_"
+
+# Seconds; covers sub-millisecond rule matching up to slow LLM round trips
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+_gauges = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}   # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels) if METRICS_ENABLED else _NOOP_TIMER
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('hist', 'labels', 'start')
+
+    def __init__(self, hist, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def _get(cls, name, help_text, **kwargs):
+    name = PREFIX + name
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = _registry[name] = cls(name, help_text, **kwargs)
+    return metric
+
+
+def counter(name, help_text=""):
+    return _get(Counter, name, help_text)
+
+
+def histogram(name, help_text="", buckets=LATENCY_BUCKETS):
+    return _get(Histogram, name, help_text, buckets=buckets)
+
+
+def timer(name, help_text="", **labels):
+    """
+    `with metrics.timer('stage_seconds', stage='extract'):` records the block's
+    wall time (seconds) into a latency histogram.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_TIMER
+    return histogram(name, help_text).time(**labels)
+
+
+def gauge(name, help_text, fn):
+    """
+    Register a gauge whose value(s) are read at scrape time. `fn` returns a
+    number, a list of ({label: value}, number) pairs, or None to skip it.
+    """
+    _gauges[PREFIX + name] = (help_text, fn)
+
+
+def render_prometheus():
+    """
+    Current values in the Prometheus text exposition format (per process:
+    under gunicorn each worker reports its own counters).
+    """
+    out = []
+    for name, metric in sorted(_registry.items()):
+        lines = metric.render()
+        if not lines:
+            continue
+        out.append(f"# HELP {name} {metric.help}")
+        out.append(f"# TYPE {name} {metric.kind}")
+        out.extend(lines)
+    for name, (help_text, fn) in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        if value is None:
+            continue
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} gauge")
+        if isinstance(value, list):
+            for labels, v in value:
+                out.append(f"{name}{_format_labels(_label_key(labels))} {v}")
+        else:
+            out.append(f"{name} {value}")
+    return "\n".join(out) + "\n"
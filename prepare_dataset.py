@@ -1,43 +1,211 @@
 import os
 import re
-from datasets import load_dataset
+import glob
+import argparse
+from time import time
+from collections import deque
+from multiprocessing import Pool
+
 import pandas as pd
 
+# Parquet output needs pyarrow; without it the pipeline writes the old CSV.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
-OUT_PATH = os.path.join(DATA_DIR, "processed_tickets.csv")
+OUT_PATH = os.path.join(DATA_DIR, "processed_tickets.parquet")
+CSV_OUT_PATH = os.path.join(DATA_DIR, "processed_tickets.csv")
+
+DATASET_NAME = "Tobi-Bueck/customer-support-tickets"
+CHUNK_ROWS = int(os.environ.get("PREPARE_CHUNK_ROWS", "50000"))
+
+POSSIBLE_SUBJECTS = ['subject', 'title', 'title_text', 'ticket_subject']
+POSSIBLE_BODIES = ['text', 'body', 'description', 'ticket_body']
+OUTPUT_COLUMNS = ['subject', 'text', 'text_clean', 'Category']
+
+# simple_clean's passes, in order; the vectorized version runs each once per chunk.
+CLEAN_PATTERNS = [
+    (r'http\S+|\S+@\S+', ' '),
+    (r'\b\d{6,}\b', ' '),
+    (r'[^a-z0-9\s]', ' '),
+    (r'\s+', ' '),
+]
+_COMPILED = [(re.compile(p), r) for p, r in CLEAN_PATTERNS]
 
 def simple_clean(s):
     s = (s or "").lower()
-    s = re.sub(r'http\S+|\S+@\S+', ' ', s)
-    s = re.sub(r'\b\d{6,}\b', ' ', s)
-    s = re.sub(r'[^a-z0-9\s]', ' ', s)
-    s = re.sub(r'\s+', ' ', s).strip()
-    return s
-
-def prepare():
-    ds = load_dataset("Tobi-Bueck/customer-support-tickets", split="train")
-    df = ds.to_pandas()
-    possible_subjects = ['subject', 'title', 'title_text', 'ticket_subject']
-    possible_bodies = ['text', 'body', 'description', 'ticket_body']
-    subj = next((c for c in possible_subjects if c in df.columns), None)
-    body = next((c for c in possible_bodies if c in df.columns), None)
+    for pattern, repl in _COMPILED:
+        s = pattern.sub(repl, s)
+    return s.strip()
+
+def clean_series(texts):
+    """
+    simple_clean for a whole Series with vectorized string ops.
+    """
+    s = texts.fillna('').astype(str).str.lower()
+    for pattern, repl in CLEAN_PATTERNS:
+        s = s.str.replace(pattern, repl, regex=True)
+    return s.str.strip()
+
+def process_chunk(df):
+    """
+    Raw dataset rows -> subject, text, text_clean, Category (all strings).
+    """
+    subj = next((c for c in POSSIBLE_SUBJECTS if c in df.columns), None)
+    body = next((c for c in POSSIBLE_BODIES if c in df.columns), None)
+    out = pd.DataFrame(index=df.index)
+    out['subject'] = df[subj].fillna('').astype(str) if subj else ''
     if subj and body:
-        df['text'] = df[subj].fillna('') + ' ' + df[body].fillna('')
+        out['text'] = out['subject'] + ' ' + df[body].fillna('').astype(str)
     elif body:
-        df['text'] = df[body].fillna('')
+        out['text'] = df[body].fillna('').astype(str)
     else:
-        df['text'] = df.astype(str).apply(lambda r: " ".join(r.values), axis=1)
-    df['text_clean'] = df['text'].apply(simple_clean)
+        out['text'] = df.astype(str).agg(" ".join, axis=1)
+    out['text_clean'] = clean_series(out['text'])
     if 'category' in df.columns:
-        df['Category'] = df['category']
+        out['Category'] = df['category'].fillna('').astype(str)
     elif 'label' in df.columns:
-        df['Category'] = df['label']
+        out['Category'] = df['label'].fillna('').astype(str)
+    else:
+        out['Category'] = 'unlabeled'
+    return out[OUTPUT_COLUMNS].reset_index(drop=True)
+
+
+# ------------------ SOURCES ------------------ #
+
+def _iter_file(path, chunk_rows):
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif path.endswith('.csv'):
+        yield from pd.read_csv(path, dtype=str, chunksize=chunk_rows)
+    elif path.endswith(('.jsonl', '.json')):
+        yield from pd.read_json(path, lines=True, dtype=False, chunksize=chunk_rows)
     else:
-        df['Category'] = 'unlabeled'
-    df.to_csv(OUT_PATH, index=False)
-    print("Saved processed tickets to", OUT_PATH)
+        raise ValueError(f"Unsupported dataset file: {path}")
+
+def _iter_hf(dataset, chunk_rows):
+    for batch in dataset.iter(batch_size=chunk_rows):
+        yield pd.DataFrame(batch)
+
+def iter_source(source=None, chunk_rows=CHUNK_ROWS):
+    """
+    Yield the raw dataset as DataFrame chunks. `source` may be
+    - a .parquet/.csv/.jsonl file or a directory of them (e.g. a downloaded
+      hub snapshot; the train split is used when split files are present),
+    - a directory written by datasets' save_to_disk,
+    - None: the hub dataset via `datasets` (served from its local cache
+      when HF_DATASETS_OFFLINE=1).
+    """
+    if source and os.path.isfile(source):
+        yield from _iter_file(source, chunk_rows)
+        return
+    if source and os.path.isdir(source):
+        if os.path.exists(os.path.join(source, 'dataset_info.json')) or \
+                os.path.exists(os.path.join(source, 'dataset_dict.json')):
+            from datasets import load_from_disk
+            ds = load_from_disk(source)
+            yield from _iter_hf(ds['train'] if hasattr(ds, 'keys') else ds, chunk_rows)
+            return
+        files = sorted(f for ext in ('parquet', 'csv', 'jsonl', 'json')
+                       for f in glob.glob(os.path.join(source, '**', f'*.{ext}'), recursive=True))
+        train = [f for f in files if 'train' in os.path.basename(f)]
+        if not (train or files):
+            raise FileNotFoundError(f"No dataset files under {source}")
+        for path in train or files:
+            yield from _iter_file(path, chunk_rows)
+        return
+    from datasets import load_dataset
+    yield from _iter_hf(load_dataset(source or DATASET_NAME, split="train"), chunk_rows)
+
+
+# ------------------ OUTPUT ------------------ #
+
+class _ParquetOut:
+    def __init__(self, path):
+        self.path = path
+        self.schema = pa.schema([(c, pa.string()) for c in OUTPUT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, df):
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+class _CsvOut:
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode='w' if self.header else 'a', header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        pass
+
+def _bounded_map(pool, chunks, in_flight):
+    # Pool.imap would drain the source iterator up front (the whole dataset in
+    # memory); keep at most `in_flight` chunks queued and yield in order.
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(process_chunk, (chunk,)))
+        if len(pending) >= in_flight:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def prepare(source=None, out_path=None, workers=None, chunk_rows=CHUNK_ROWS, fmt='parquet'):
+    """
+    Stream the dataset in chunks, clean each chunk (on a process pool when
+    workers > 1) and append it to a Parquet file (or CSV). The output is
+    written to a temp file and renamed into place.
+    """
+    if fmt == 'parquet' and pq is None:
+        print("pyarrow is not installed; writing CSV instead of Parquet.")
+        fmt = 'csv'
+    out_path = out_path or (OUT_PATH if fmt == 'parquet' else CSV_OUT_PATH)
+    workers = workers or os.cpu_count() or 1
+    tmp_path = f"{out_path}.tmp-{os.getpid()}"
+    out = _ParquetOut(tmp_path) if fmt == 'parquet' else _CsvOut(tmp_path)
+
+    start = time()
+    rows = 0
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        chunks = iter_source(source, chunk_rows)
+        cleaned = _bounded_map(pool, chunks, workers * 2) if pool else map(process_chunk, chunks)
+        for df in cleaned:
+            out.write(df)
+            rows += len(df)
+            print(f"  {rows:,} rows ({rows / max(time() - start, 1e-9):,.0f} rows/s)", flush=True)
+        out.close()
+    except BaseException:
+        out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    os.replace(tmp_path, out_path)
+    print(f"Saved {rows} processed tickets to {out_path} in {time() - start:.1f}s")
+    return out_path
 
 if __name__ == '__main__':
-    prepare()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean the support ticket dataset for the similarity index.")
+    parser.add_argument('--source', default=None,
+                        help="local snapshot: dataset file or directory (default: the hub dataset)")
+    parser.add_argument('--out', default=None, help="output path")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--workers', type=int, default=None, help="cleaning processes (default: CPU count)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    prepare(args.source, args.out, args.workers, args.chunk_rows, args.format)
@@ -0,0 +1,207 @@
+import os
+import re
+import math
+import threading
+from collections import Counter
+
+import numpy as np
+
+import metrics
+
+# Shrinks ticket text before it goes into an LLM prompt: whitespace and
+# boilerplate (signatures, disclaimers, quoted replies, separators) are
+# dropped, repeated lines kept once, and when the rest is still over budget
+# the most informative sentences by TF-IDF weight are kept, in their original
+# order, with "[...]" where text was left out.
+
+# Tunables (override via environment)
+PROMPT_COMPACT_ENABLED = os.environ.get("PROMPT_COMPACT_ENABLED", "1") != "0"
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1000"))     # tokens of ticket text per prompt
+MAX_SENTENCE_WORDS = 60     # longer runs (CSV rows, unpunctuated dumps) are split
+
+ELLIPSIS = "[...]"
+
+_BOILERPLATE = re.compile(
+    r'^(?:'
+    r'>.*'                                                      # quoted reply
+    r'|on .{0,200} wrote:'                                      # reply header
+    r'|-{2,}\s*(?:original message|forwarded message)?\s*-*'    # separators, signature delimiter
+    r'|[=_*#~.\-\s]{3,}'
+    r'|(?:from|sent|to|cc|date):\s.*'                           # forwarded mail headers
+    r'|sent from my \w+.*'
+    r'|get outlook for \w+.*'
+    r'|page \d+(?: of \d+)?'
+    r'|(?:confidentiality notice|disclaimer)\b.*'
+    r'|this (?:e-?mail|message) and any (?:files|attachments) .*'
+    r'|to unsubscribe\b.*|unsubscribe\s*(?:\|.*|here\b.*)?'           # mailing-list footers only
+    r'|.*\bclick here to unsubscribe\b.*'
+    r'|(?:thanks|thank you|regards|best regards|kind regards|cheers|best)[,.!]?'
+    r')$',
+    flags=re.IGNORECASE
+)
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=\S)')
+_WORD = re.compile(r'\w+|[^\w\s]')
+_TERM = re.compile(r'[a-z][a-z0-9]+')     # words for scoring; bare numbers carry little meaning
+
+_TOKENS = metrics.counter('llm_prompt_tokens_total', "Ticket-text tokens of LLM prompts, before and after compaction")
+
+_encoder_state = {'loaded': False, 'encoder': None}
+_encoder_lock = threading.Lock()
+
+
+def _encoder():
+    # tiktoken gives exact counts where it is installed; it is not a requirement.
+    if not _encoder_state['loaded']:
+        with _encoder_lock:
+            if not _encoder_state['loaded']:
+                try:
+                    import tiktoken
+                    _encoder_state['encoder'] = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    _encoder_state['encoder'] = None
+                _encoder_state['loaded'] = True
+    return _encoder_state['encoder']
+
+
+def count_tokens(text):
+    """
+    Tokens of `text` for the model: exact with tiktoken, otherwise
+    estimated from words and punctuation (and never below chars / 4).
+    """
+    if not text:
+        return 0
+    encoder = _encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return max(len(_WORD.findall(text)), math.ceil(len(text) / 4))
+
+
+def clean_lines(text):
+    """
+    Non-empty lines with whitespace collapsed, boilerplate removed and
+    repeats (ignoring case and spacing) kept once.
+    """
+    seen = set()
+    lines = []
+    for line in (text or "").splitlines():
+        line = " ".join(line.split())
+        if not line or _BOILERPLATE.match(line):
+            continue
+        key = line.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return lines
+
+
+def _sentences(lines):
+    """
+    Sentences (or word runs of at most MAX_SENTENCE_WORDS) as (line_no, text).
+    """
+    out = []
+    for line_no, line in enumerate(lines):
+        for sentence in _SENTENCE_END.split(line):
+            words = sentence.split()
+            for i in range(0, len(words), MAX_SENTENCE_WORDS):
+                out.append((line_no, " ".join(words[i:i + MAX_SENTENCE_WORDS])))
+    return out
+
+
+def _corpus_idf(terms):
+    """
+    idf of each term in the ticket index (via its hashed vectorizer), or
+    None while that index is not loaded. Stop words get 0; terms the index
+    pruned or never saw get 1, the weight of the most common kept term.
+    """
+    import similarity
+    index = similarity._index
+    if index is None:
+        return None
+    vectorizer = index['vectorizer']
+    X = vectorizer.hasher.transform(terms)
+    idf = np.zeros(len(terms))
+    for i in range(len(terms)):
+        cols = X.indices[X.indptr[i]:X.indptr[i + 1]]
+        if len(cols):
+            idf[i] = vectorizer.idf_[cols[0]] or 1.0
+    return dict(zip(terms, idf))
+
+
+def _scores(texts):
+    """
+    Informativeness of each sentence: summed term weights over the square
+    root of its length. A term weighs its rarity within this text (so rows
+    and phrases repeated all over a dump count for little) times its idf
+    in the ticket history where that index is loaded.
+    """
+    docs = [set(_TERM.findall(t.lower())) for t in texts]
+    df = Counter(w for words in docs for w in words)
+    n = len(texts)
+    weight = {w: math.log((1 + n) / (1 + c)) for w, c in df.items()}
+    idf = _corpus_idf(list(weight)) if weight else None
+    if idf is not None:
+        weight = {w: v * idf[w] for w, v in weight.items()}
+    lengths = np.array([max(len(t.split()), 1) for t in texts], dtype=np.float64)
+    return np.array([sum(weight[w] for w in words) for words in docs]) / np.sqrt(lengths)
+
+
+def compact(text, budget=None):
+    """
+    Returns (compacted_text, tokens_before, tokens_after). Text within
+    `budget` tokens (default PROMPT_TOKEN_BUDGET) after cleaning is only
+    cleaned; longer text is cut down to its best sentences. The first
+    sentence, usually the subject or the problem statement, is always kept.
+    Text that is nothing but boilerplate (a bare "Thanks") is kept as it is,
+    with whitespace collapsed, rather than sent empty.
+    """
+    text = text or ""
+    before = count_tokens(text)
+    if not PROMPT_COMPACT_ENABLED:
+        return text, before, before
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    lines = clean_lines(text)
+    if not lines:
+        lines = [" ".join(line.split()) for line in text.splitlines() if line.strip()]
+    cleaned = "\n".join(lines)
+    cleaned_tokens = count_tokens(cleaned)
+    if cleaned_tokens <= budget or not lines:
+        _TOKENS.inc(before, stage='before')
+        _TOKENS.inc(cleaned_tokens, stage='after')
+        return cleaned, before, cleaned_tokens
+
+    sentences = _sentences(lines)
+    costs = [count_tokens(s) + 1 for _, s in sentences]
+    scores = _scores([s for _, s in sentences])
+    keep = {0}
+    used = costs[0] + count_tokens(ELLIPSIS)
+    for i in np.argsort(-scores, kind='stable'):
+        i = int(i)
+        if i not in keep and used + costs[i] <= budget:
+            keep.add(i)
+            used += costs[i]
+    out = _join(sentences, keep)
+    after = count_tokens(out)
+    # Each gap adds an ellipsis; drop the weakest sentences until it fits.
+    while after > budget and len(keep) > 1:
+        keep.discard(min(keep - {0}, key=lambda i: scores[i]))
+        out = _join(sentences, keep)
+        after = count_tokens(out)
+    _TOKENS.inc(before, stage='before')
+    _TOKENS.inc(after, stage='after')
+    return out, before, after
+
+
+def _join(sentences, keep):
+    parts, prev = [], None
+    for i in sorted(keep):
+        line_no, sentence = sentences[i]
+        if prev is not None and i != prev + 1:
+            parts.append("\n" + ELLIPSIS + "\n")
+        elif prev is not None:
+            parts.append("\n" if line_no != sentences[prev][0] else " ")
+        parts.append(sentence)
+        prev = i
+    if prev != len(sentences) - 1:
+        parts.append("\n" + ELLIPSIS)
+    return "".join(parts)
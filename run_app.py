@@ -1,5 +1,9 @@
-from app import app
+import os
+from app import app, warm_up, STARTUP_MODE
 
 if __name__ == '__main__':
+    # With the debug reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if STARTUP_MODE == 'warm' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
     # Run on 127.0.0.1:5001 as requested
     app.run(host="127.0.0.1", port=5001, debug=True)
@@ -29,67 +29,39 @@ document.addEventListener('DOMContentLoaded', function(){
       fd.append('file', file);
 
       try {
-        const res = await fetch('/analyze', { method: 'POST', body: fd });
-        const data = await res.json();
-        if(res.status !== 200){ status.textContent = data.error || 'Analysis failed'; return; }
-
-        status.textContent = 'Analysis complete';
-        result.classList.remove('hidden');
-
-        const uploaded = data.uploaded_ticket || data.llm_result?.text || '';
-        preview.textContent = uploaded;
-
-        categoryEl.textContent = data.category || data.llm_result?.category || '—';
-        const tags = data.tags || data.llm_result?.tags || [];
-        if(Array.isArray(tags) && tags.length){
-          tagsEl.innerHTML = tags.map(t => `<span class="tags">${t}</span>`).join(' ');
-        } else { tagsEl.textContent = '—'; }
-        priorityEl.textContent = data.suggested_priority || data.llm_result?.suggested_priority || '—';
-        confidenceEl.textContent = (data.confidence || data.llm_result?.confidence || '—');
-        solutionEl.textContent = data.solution || data.llm_result?.solution || '—';
-
-        if(data.similar_tickets && data.similar_tickets.length){
-          similarContainer.style.display = 'block';
-          similarList.innerHTML = data.similar_tickets.map(s=>{
-            return `<div style="margin-bottom:8px">
-                      <div class="small">score: ${s.similarity.toFixed(3)}</div>
-                      <pre>${escapeHtml(s.snippet)}</pre>
-                    </div>`;
-          }).join('');
-        } else {
-          similarContainer.style.display = 'none';
-          similarList.innerHTML = '';
+        const res = await fetch('/analyze/stream', { method: 'POST', body: fd });
+        if(res.status !== 200){
+          const data = await res.json().catch(() => ({}));
+          status.textContent = data.error || 'Analysis failed';
+          return;
         }
-        // --- Recommended Articles UI ---
-       const articleContainer = document.getElementById('articleContainer');
-       const articleList = document.getElementById('articleList');
-       articleList.innerHTML = ""; // clear previous
-
-    if (data.recommended_articles && data.recommended_articles.length > 0) {
-      articleContainer.style.display = 'block';
-
-      data.recommended_articles.forEach(a => {
-      const div = document.createElement('div');
-      div.style.border = "1px solid #ccc";
-      div.style.padding = "8px";
-      div.style.margin = "6px 0";
-      div.style.borderRadius = "6px";
-
-      div.innerHTML = `
-        <strong>${a.title}</strong> (${a.article_id})<br>
-        <small>${a.summary}</small><br>
-        <a href="${a.link}" target="_blank">View Full Article</a>`;
-
-      articleList.appendChild(div);
-     });
-
-    } else {
-       articleContainer.style.display = 'block';
-       articleList.innerHTML = `<em>No matching knowledge base articles found.</em>`;
-   }
-
-
-        orig_text_input.value = uploaded;
+        // Render each SSE event as it arrives instead of waiting for the slowest stage
+        await readEvents(res, (event, data) => {
+          if(event === 'extracting'){
+            status.textContent = `Reading file… ${data.chars} characters so far`;
+          } else if(event === 'extracted'){
+            result.classList.remove('hidden');
+            preview.textContent = data.uploaded_ticket || '';
+            orig_text_input.value = data.uploaded_ticket || '';
+            similarContainer.style.display = 'none';
+            similarList.innerHTML = '';
+            document.getElementById('articleList').innerHTML = '';
+            status.textContent = 'Classifying…';
+          } else if(event === 'rule_based'){
+            renderClassification(data);
+            status.textContent = 'Quick result shown, waiting for AI classification…';
+          } else if(event === 'llm_result'){
+            if(!data.error) renderClassification(data);
+          } else if(event === 'similar_tickets'){
+            renderSimilar(data);
+          } else if(event === 'recommended_articles'){
+            renderArticles(data);
+          } else if(event === 'done'){
+            status.textContent = (data.partial && data.partial.length)
+              ? `Analysis complete (timed out: ${data.partial.join(', ')})`
+              : 'Analysis complete';
+          }
+        });
       } catch(err){
         console.error(err);
         status.textContent = 'Error contacting server';
@@ -97,6 +69,80 @@ document.addEventListener('DOMContentLoaded', function(){
     });
   }
 
+  async function readEvents(res, onEvent){
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while(true){
+      const { value, done } = await reader.read();
+      if(done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while((sep = buffer.indexOf('\n\n')) !== -1){
+        const chunk = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message', data = '';
+        chunk.split('\n').forEach(line => {
+          if(line.startsWith('event: ')) event = line.slice(7);
+          else if(line.startsWith('data: ')) data += line.slice(6);
+        });
+        onEvent(event, data ? JSON.parse(data) : {});
+      }
+    }
+  }
+
+  function renderClassification(data){
+    categoryEl.textContent = data.category || '—';
+    const tags = data.tags || [];
+    if(Array.isArray(tags) && tags.length){
+      tagsEl.innerHTML = tags.map(t => `<span class="tags">${escapeHtml(t)}</span>`).join(' ');
+    } else { tagsEl.textContent = '—'; }
+    priorityEl.textContent = data.suggested_priority || '—';
+    confidenceEl.textContent = (data.confidence || '—');
+    solutionEl.textContent = data.solution || '—';
+  }
+
+  function renderSimilar(list){
+    if(list && list.length){
+      similarContainer.style.display = 'block';
+      similarList.innerHTML = list.map(s=>{
+        return `<div style="margin-bottom:8px">
+                  <div class="small">score: ${s.similarity.toFixed(3)}</div>
+                  <pre>${escapeHtml(s.snippet)}</pre>
+                </div>`;
+      }).join('');
+    } else {
+      similarContainer.style.display = 'none';
+      similarList.innerHTML = '';
+    }
+  }
+
+  function renderArticles(list){
+    const articleContainer = document.getElementById('articleContainer');
+    const articleList = document.getElementById('articleList');
+    articleList.innerHTML = ""; // clear previous
+    articleContainer.style.display = 'block';
+
+    if (list && list.length > 0) {
+      list.forEach(a => {
+        const div = document.createElement('div');
+        div.style.border = "1px solid #ccc";
+        div.style.padding = "8px";
+        div.style.margin = "6px 0";
+        div.style.borderRadius = "6px";
+
+        div.innerHTML = `
+          <strong>${a.title}</strong> (${a.article_id})<br>
+          <small>${a.summary}</small><br>
+          <a href="${a.link}" target="_blank">View Full Article</a>`;
+
+        articleList.appendChild(div);
+      });
+    } else {
+      articleList.innerHTML = `<em>No matching knowledge base articles found.</em>`;
+    }
+  }
+
   if (fbForm) {
     fbForm.addEventListener('submit', async (e) => {
       e.preventDefault();
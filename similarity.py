@@ -1,122 +1,499 @@
 import os
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+from contextlib import contextmanager
+from time import sleep
+from datetime import datetime
+import numpy as np
+
+import index_store
+import ann_index
+import storage
+import metrics
+from append_log import AppendLog
+
+# File lock so only one worker at a time rebuilds the shared artifact.
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows: no cross-process rebuild lock
+    fcntl = None
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
-HIST_PATH = os.path.join(DATA_DIR, "processed_tickets.csv")
-KB_PATH   = os.path.join(DATA_DIR, "knowledge_base.csv")
+HIST_PATH = index_store.HIST_PATH
+LEGACY_HIST_PATH = index_store.LEGACY_HIST_PATH
+INDEX_DIR = index_store.INDEX_DIR
+
+# "exact": brute-force cosine over every row. "ann": IVF over LSA embeddings
+# (ann_index.py) with an exact re-rank of the candidates; knobs ANN_NPROBE
+# and ANN_RERANK trade recall for speed.
+SIMILARITY_MODE = os.environ.get("SIMILARITY_MODE", "exact").lower()
+
+# Online ingestion (override via environment): analyzed/corrected tickets are
+# stored in SQLite, picked up into a delta index within INDEX_POLL_SECONDS and
+# merged into the main artifact by a background rebuild.
+INDEX_INGEST = os.environ.get("INDEX_INGEST", "1") != "0"
+INDEX_POLL_SECONDS = float(os.environ.get("INDEX_POLL_SECONDS", "2"))
+INDEX_REBUILD_SECONDS = float(os.environ.get("INDEX_REBUILD_SECONDS", "3600"))
+INDEX_DELTA_MAX_ROWS = int(os.environ.get("INDEX_DELTA_MAX_ROWS", "5000"))
+
+# {'vectorizer', 'matrix', 'snippets', 'meta', 'ann', 'delta'}; swapped as a
+# whole so a query always sees one consistent main index + delta.
+# delta: {'matrix' (None while empty), 'snippets', 'last_id'}.
+_index = None
+_index_lock = threading.Lock()
+_indexer_state = {'pid': None, 'thread': None}
+
+_ingest_log = AppendLog(sink=storage.add_ingested_tickets)
+
+_SEARCH_SECONDS = metrics.histogram('similarity_seconds', "Similarity search time in seconds by index and step")
+_REBUILDS = metrics.counter('index_rebuilds_total', "Background rebuilds of the ticket index by result")
+
+@contextmanager
+def _build_lock(blocking=True):
+    """
+    Cross-process lock around building the shared artifacts; yields False
+    when blocking=False and another worker holds it.
+    """
+    os.makedirs(os.path.dirname(INDEX_DIR), exist_ok=True)
+    with open(f"{INDEX_DIR}.lock", 'w') as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _ann_dir():
+    # Lives next to the TF-IDF artifact it was built from.
+    return os.path.join(os.path.dirname(INDEX_DIR), os.path.basename(ann_index.ANN_DIR))
+
+def _load_ann(matrix, tfidf_meta):
+    """
+    Load (building when stale) the ANN artifact for the loaded TF-IDF index.
+    Returns None, i.e. exact search, when it is unavailable.
+    """
+    ann_dir = _ann_dir()
+    try:
+        if not ann_index.is_fresh(ann_index.read_meta(ann_dir), tfidf_meta):
+            with _build_lock():
+                # Another worker may have built it while this one waited.
+                if not ann_index.is_fresh(ann_index.read_meta(ann_dir), tfidf_meta):
+                    with _SEARCH_SECONDS.time(index='tickets', op='ann_build'):
+                        if ann_index.build(matrix, tfidf_meta, ann_dir) is None:
+                            return None
+        ann = ann_index.load(ann_dir)
+        print(f"Loaded ANN index ({ann.meta['lists']} lists, {ann.meta['dim']} dims) from {ann_dir}.")
+        return ann
+    except Exception as e:
+        print("Could not load ANN index, using exact search:", e)
+        return None
 
-_vectorizer = None
-_matrix = None
-_history_df = None
+def _load_main():
+    """
+    Map the artifact in INDEX_DIR into a new index holder (empty delta,
+    caught up by _refresh_delta).
+    """
+    with _SEARCH_SECONDS.time(index='tickets', op='load'):
+        vectorizer, matrix, snippets, meta = index_store.load_index(INDEX_DIR)
+    print(f"Loaded TF-IDF index for {matrix.shape[0]} historical tickets from {INDEX_DIR}.")
+    ann = _load_ann(matrix, meta) if SIMILARITY_MODE == 'ann' else None
+    delta = {'matrix': None, 'snippets': [], 'last_id': meta.get('ingested_upto', 0)}
+    return {'vectorizer': vectorizer, 'matrix': matrix, 'snippets': snippets, 'meta': meta,
+            'ann': ann, 'delta': delta}
 
-def _build_index(limit_rows: int = 15000):
+def _build_index(limit_rows=None):
     """
-    Lazily build TF-IDF index on first use.
-    limit_rows: cap rows for speed; increase later if you want.
+    Lazily load the TF-IDF index on first use.
+    Uses the on-disk artifact from index_store when it matches the history
+    (HIST_PATH, or LEGACY_HIST_PATH when only the CSV exists), otherwise
+    streams a fresh artifact from it first.
+    limit_rows: optional cap on indexed rows (None = full history).
     """
-    global _vectorizer, _matrix, _history_df
-    if not os.path.exists(HIST_PATH):
-        print("No historical tickets file found:", HIST_PATH)
+    global _index
+    source = index_store.history_path(HIST_PATH, LEGACY_HIST_PATH)
+    if not os.path.exists(source):
+        print("No historical tickets file found:", source)
         return
 
     try:
-        # Limit rows for faster startup; tune this number to your machine
-        df = pd.read_csv(HIST_PATH, nrows=limit_rows)
-        _history_df = df.reset_index(drop=True)
-
-        if 'text_clean' in df.columns:
-            texts = df['text_clean'].fillna('').astype(str)
-        elif 'text' in df.columns:
-            texts = df['text'].fillna('').astype(str)
-        else:
-            texts = _history_df.astype(str).apply(lambda r: " ".join(r.values), axis=1)
-
-        # Faster, lighter TF-IDF config for large corpora
-        _vectorizer = TfidfVectorizer(
-            max_features=20000,
-            ngram_range=(1, 2),
-            stop_words='english',
-            min_df=2,          # drop singletons
-            max_df=0.95        # drop super-common terms
-        )
-        _matrix = _vectorizer.fit_transform(texts)
-        print(f"Built TF-IDF index for {_matrix.shape[0]} historical tickets (limited).")
+        if not index_store.is_fresh(index_store.read_meta(INDEX_DIR), source, limit_rows):
+            with _build_lock():
+                # Another worker may have built it while this one waited.
+                if not index_store.is_fresh(index_store.read_meta(INDEX_DIR), source, limit_rows):
+                    index_store.build_index(source, INDEX_DIR, limit_rows=limit_rows)
+        _index = _refresh_delta(_load_main())
     except KeyboardInterrupt:
         # If you stop it mid-way, leave things unset
-        _vectorizer = None
-        _matrix = None
-        _history_df = None
+        _index = None
         print("TF-IDF build interrupted; index not ready.")
     except Exception as e:
-        _vectorizer = None
-        _matrix = None
-        _history_df = None
+        _index = None
         print("Could not build TF-IDF index:", e)
 
+def _get_index():
+    # Lazy build if not ready (once, even when several request threads race here)
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _build_index()
+    if _index is not None:
+        _ensure_indexer()
+    return _index
+
+def preload():
+    """
+    Load the ticket and KB indexes now, without starting the background
+    indexer. Called at import with STARTUP_MODE=preload, i.e. once in the
+    gunicorn master: the forked workers inherit the memory-mapped artifact
+    and share its pages instead of each loading (or building) a copy.
+    """
+    with _index_lock:
+        if _index is None:
+            _build_index()
+    _get_kb_index()
+
+
+# ------------------ ONLINE INGESTION ------------------ #
+
+def ingest_ticket(text, category='', source='analyze'):
+    """
+    Queue a ticket for the similarity index. It is stored (batched) in
+    SQLite and becomes searchable in every worker once the indexer polls.
+    """
+    text = (text or '').strip()
+    if not INDEX_INGEST or not text:
+        return
+    _ingest_log.append({
+        'timestamp': datetime.now().isoformat(),
+        'text': text,
+        'category': category or '',
+        'source': source
+    })
+
+def _ingested_chunks(upto_id, chunk_rows=index_store.CHUNK_ROWS):
+    """
+    Stored tickets with id <= upto_id as DataFrame chunks for build_index.
+    """
+    import pandas as pd
+    after = 0
+    while True:
+        rows = storage.ingested_tickets(after_id=after, upto_id=upto_id, limit=chunk_rows)
+        if not rows:
+            return
+        after = rows[-1]['id']
+        yield pd.DataFrame({'text': [r['text'] or '' for r in rows]})
+
+def _refresh_delta(index):
+    """
+    Return `index` with tickets stored since its delta's last id appended
+    to the delta (transformed with the main index's vectorizer, whose
+    hashing + fixed idf needs no refit). Same object when nothing is new.
+    """
+    delta = index['delta']
+    rows = storage.ingested_tickets(after_id=delta['last_id'], limit=INDEX_DELTA_MAX_ROWS)
+    if not rows:
+        return index
+    from scipy.sparse import vstack
+    texts = [r['text'] or '' for r in rows]
+    new_rows = index['vectorizer'].transform(texts)
+    matrix = new_rows if delta['matrix'] is None else vstack([delta['matrix'], new_rows]).tocsr()
+    return dict(index, delta={
+        'matrix': matrix,
+        'snippets': delta['snippets'] + [t[:index_store.SNIPPET_CHARS] for t in texts],
+        'last_id': rows[-1]['id']
+    })
+
+def _rebuild_due(index, source):
+    meta = index['meta']
+    if not index_store.is_fresh(meta, source, meta.get('limit_rows')):
+        return True     # history file replaced (e.g. prepare_dataset ran)
+    delta_rows = len(index['delta']['snippets'])
+    if delta_rows >= INDEX_DELTA_MAX_ROWS:
+        return True
+    age = (datetime.now() - datetime.fromisoformat(meta['built_at'])).total_seconds()
+    return delta_rows > 0 and age >= INDEX_REBUILD_SECONDS
+
+def _rebuild(index, source):
+    """
+    Rebuild the artifact from the history plus all stored tickets, unless
+    another worker holds the rebuild lock. Readers keep using the old
+    (still mapped) artifact until the poll that follows swaps in the new one.
+    """
+    with _build_lock(blocking=False) as locked:
+        if not locked:
+            return False
+        if (index_store.read_meta(INDEX_DIR) or {}).get('built_at') != index['meta'].get('built_at'):
+            return False    # someone else just rebuilt it
+        upto = storage.max_ingested_id()
+        with _SEARCH_SECONDS.time(index='tickets', op='rebuild'):
+            index_store.build_index(source, INDEX_DIR, limit_rows=index['meta'].get('limit_rows'),
+                                    extra=lambda: _ingested_chunks(upto),
+                                    extra_meta={'ingested_upto': upto})
+        _REBUILDS.inc(result='ok')
+        return True
+
+def _indexer_step():
+    global _index
+    index = _index
+    if index is None:
+        return
+    disk_meta = index_store.read_meta(INDEX_DIR)
+    if disk_meta and disk_meta.get('built_at') != index['meta'].get('built_at'):
+        # A rebuilt artifact (by this or another worker): load it off the request path, then swap.
+        new_index = _refresh_delta(_load_main())
+        with _index_lock:
+            _index = new_index
+        return
+    new_index = _refresh_delta(index)
+    if new_index is not index:
+        with _index_lock:
+            if _index is index:
+                _index = new_index
+    source = index_store.history_path(HIST_PATH, LEGACY_HIST_PATH)
+    if os.path.exists(source) and _rebuild_due(new_index, source):
+        _rebuild(new_index, source)
+
+def _indexer_loop():
+    while True:
+        sleep(INDEX_POLL_SECONDS)
+        try:
+            _indexer_step()
+        except Exception as e:
+            _REBUILDS.inc(result='error')
+            print("Background indexer error:", e)
+
+def _ensure_indexer():
+    # Threads do not survive a gunicorn fork, so start one per pid.
+    if not INDEX_INGEST or _indexer_state['pid'] == os.getpid():
+        return
+    with _index_lock:
+        if _indexer_state['pid'] == os.getpid():
+            return
+        _indexer_state['pid'] = os.getpid()
+        _indexer_state['thread'] = threading.Thread(target=_indexer_loop, name="indexer", daemon=True)
+        _indexer_state['thread'].start()
+
 
 # ------------------ FIND SIMILAR TICKETS ------------------ #
 
-def find_similar_tickets(text, top_k=3):
-    global _vectorizer, _matrix, _history_df
+# Upper bound on dense (documents x queries) score cells held at once.
+SCORE_BLOCK_CELLS = 20_000_000
 
-    # Lazy build if not ready
-    if _vectorizer is None or _matrix is None or _history_df is None:
-        _build_index(limit_rows=15000)  # tweak this number if needed
+def _top_k_batch(matrix, queries, top_k):
+    """
+    Score l2-normalised query rows against l2-normalised matrix rows (dot
+    product == cosine) and return (indices, scores) of the top_k per query,
+    best first. Uses argpartition instead of sorting the whole corpus, and
+    scores queries in blocks so the dense score block stays bounded.
+    """
+    n_docs = matrix.shape[0]
+    k = min(top_k, n_docs)
+    out_idx, out_sims = [], []
+    if k <= 0:
+        return [[] for _ in range(queries.shape[0])], [[] for _ in range(queries.shape[0])]
+    block = max(1, SCORE_BLOCK_CELLS // max(n_docs, 1))
+    for start in range(0, queries.shape[0], block):
+        # matrix @ q.T keeps the (large) matrix in CSR; only the queries get transposed.
+        sims = (matrix @ queries[start:start + block].T).toarray().T
+        if k < n_docs:
+            part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(n_docs), (sims.shape[0], 1))
+        part_sims = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_sims, axis=1, kind='stable')
+        out_idx.extend(np.take_along_axis(part, order, axis=1).tolist())
+        out_sims.extend(np.take_along_axis(part_sims, order, axis=1).tolist())
+    return out_idx, out_sims
 
-    if _vectorizer is None or _matrix is None or _history_df is None:
-        return []
+def find_similar_tickets_batch(texts, top_k=3):
+    """
+    find_similar_tickets for many texts: one transform and one sparse
+    product per block of queries, against the main index and the delta of
+    recently ingested tickets (ids continue after the main rows). Returns
+    one result list per text.
+    """
+    index = _get_index()
+    if index is None:
+        return [[] for _ in texts]
 
     try:
-        vec = _vectorizer.transform([text])
-        sims = cosine_similarity(vec, _matrix)[0]
-        idxs = sims.argsort()[::-1][:top_k]
-        results = []
-        for i in idxs:
-            if 'text' in _history_df.columns:
-                snippet = str(_history_df['text'].iloc[i])[:400]
-            elif 'text_clean' in _history_df.columns:
-                snippet = str(_history_df['text_clean'].iloc[i])[:400]
-            else:
-                snippet = " ".join(map(str, _history_df.iloc[i].values))[:400]
-            results.append({
-                'id': int(i),
-                'similarity': float(sims[i]),
-                'snippet': snippet
-            })
+        matrix, snippets, ann, delta = index['matrix'], index['snippets'], index['ann'], index['delta']
+        with _SEARCH_SECONDS.time(index='tickets', op='transform'):
+            queries = index['vectorizer'].transform(list(texts))
+        if ann is not None:
+            with _SEARCH_SECONDS.time(index='tickets', op='ann_search'):
+                idxs, sims = ann.search(queries, matrix, top_k)
+        else:
+            with _SEARCH_SECONDS.time(index='tickets', op='score'):
+                idxs, sims = _top_k_batch(matrix, queries, top_k)
+        results = [
+            [{'id': int(i), 'similarity': float(sim), 'snippet': snippets[i]}
+             for i, sim in zip(row_idx, row_sims)]
+            for row_idx, row_sims in zip(idxs, sims)
+        ]
+        if delta['matrix'] is not None:
+            with _SEARCH_SECONDS.time(index='tickets', op='delta'):
+                d_idxs, d_sims = _top_k_batch(delta['matrix'], queries, top_k)
+            n_main = matrix.shape[0]
+            for found, row_idx, row_sims in zip(results, d_idxs, d_sims):
+                found.extend({'id': n_main + int(i), 'similarity': float(sim), 'snippet': delta['snippets'][i]}
+                             for i, sim in zip(row_idx, row_sims))
+                found.sort(key=lambda r: -r['similarity'])
+                del found[top_k:]
         return results
     except Exception:
-        return []
+        return [[] for _ in texts]
+
+def find_similar_tickets(text, top_k=3):
+    return find_similar_tickets_batch([text], top_k=top_k)[0]
 
 
 # ------------------ RECOMMEND KNOWLEDGE BASE ARTICLES ------------------ #
 
-def recommend_articles(text, top_k=3):
-    if not os.path.exists(KB_PATH):
-        return []
+# In-place additions keep the original vocabulary/IDF; refit after this many.
+KB_REFIT_EVERY = 50
 
-    df = pd.read_csv(KB_PATH)
-    if df.empty:
-        return []
+# {'vectorizer', 'matrix', 'columns', 'version', 'pending'}; swapped as a whole
+# so readers always see a consistent snapshot.
+_kb_index = None
+_kb_lock = threading.Lock()
 
-    kb_texts = df['content'].fillna('').astype(str)
+def _kb_columns(articles):
+    """
+    Keep only what recommend_articles returns, as plain column lists.
+    """
+    return {
+        'article_id': [str(a) for a in articles['article_id']],
+        'title': list(articles['title']),
+        'link': list(articles['link']),
+        'summary': [c[:200] for c in articles['content']]
+    }
+
+def _build_kb_index(version):
+    global _kb_index
+    articles = storage.kb_articles()
+    if not articles['article_id']:
+        _kb_index = {'vectorizer': None, 'matrix': None, 'columns': None, 'version': version, 'pending': 0}
+        return _kb_index
+    from sklearn.feature_extraction.text import TfidfVectorizer
     kb_vectorizer = TfidfVectorizer(max_features=20000, ngram_range=(1, 2))
-    kb_matrix = kb_vectorizer.fit_transform(kb_texts)
-
-    vec = kb_vectorizer.transform([text])
-    sims = cosine_similarity(vec, kb_matrix)[0]
-    idxs = sims.argsort()[::-1][:top_k]
-
-    results = []
-    for i in idxs:
-        results.append({
-            "article_id": df['article_id'].iloc[i],
-            "title": df['title'].iloc[i],
-            "link": df['link'].iloc[i],
-            "similarity": float(sims[i]),
-            "summary": df['content'].iloc[i][:200]
-        })
-    return results
+    with _SEARCH_SECONDS.time(index='kb', op='fit'):
+        kb_matrix = kb_vectorizer.fit_transform(articles['content'])
+    _kb_index = {
+        'vectorizer': kb_vectorizer,
+        'matrix': kb_matrix,
+        'columns': _kb_columns(articles),
+        'version': version,
+        'pending': 0
+    }
+    return _kb_index
+
+def _get_kb_index():
+    """
+    Return the cached KB index, rebuilding it when the kb_articles table
+    changed (checked with one indexed query per call).
+    """
+    version = storage.kb_fingerprint()
+    index = _kb_index
+    if index is not None and index['version'] == version:
+        return index
+    with _kb_lock:
+        index = _kb_index
+        if index is not None and index['version'] == version:
+            return index
+        return _build_kb_index(version)
+
+def add_kb_article(article):
+    """
+    Store a new KB article and fold it into the cached index without
+    refitting, as long as nobody else changed the KB meanwhile.
+    """
+    add_kb_articles([article])
+
+def add_kb_articles(articles):
+    """
+    add_kb_article for many articles: one transaction and one index update.
+    """
+    global _kb_index
+    if not articles:
+        return
+    with _kb_lock:
+        before = storage.kb_fingerprint()
+        storage.add_kb_articles(articles)
+        after = storage.kb_fingerprint()
+
+        index = _kb_index
+        if (index is None or index['vectorizer'] is None or index['version'] != before
+                or after[0] != before[0] + len(articles) or index['pending'] + len(articles) >= KB_REFIT_EVERY):
+            # Rebuilt from storage on the next lookup.
+            _kb_index = None
+            return
+        from scipy.sparse import vstack
+        new_rows = index['vectorizer'].transform([str(a.get('content', '')) for a in articles])
+        columns = {k: list(v) for k, v in index['columns'].items()}
+        for article in articles:
+            columns['article_id'].append(str(article.get('article_id', '')))
+            columns['title'].append(str(article.get('title', '')))
+            columns['link'].append(str(article.get('link', '')))
+            columns['summary'].append(str(article.get('content', ''))[:200])
+        _kb_index = {
+            'vectorizer': index['vectorizer'],
+            'matrix': vstack([index['matrix'], new_rows]).tocsr(),
+            'columns': columns,
+            'version': after,
+            'pending': index['pending'] + len(articles)
+        }
+
+def recommend_articles_batch(texts, top_k=3):
+    """
+    recommend_articles for many texts against one KB snapshot.
+    """
+    index = _get_kb_index()
+    if index is None or index['matrix'] is None:
+        return [[] for _ in texts]
+
+    with _SEARCH_SECONDS.time(index='kb', op='transform'):
+        queries = index['vectorizer'].transform(list(texts))
+    with _SEARCH_SECONDS.time(index='kb', op='score'):
+        idxs, sims = _top_k_batch(index['matrix'], queries, top_k)
+
+    cols = index['columns']
+    return [
+        [{
+            "article_id": cols['article_id'][i],
+            "title": cols['title'][i],
+            "link": cols['link'][i],
+            "similarity": float(sim),
+            "summary": cols['summary'][i]
+        } for i, sim in zip(row_idx, row_sims)]
+        for row_idx, row_sims in zip(idxs, sims)
+    ]
+
+def recommend_articles(text, top_k=3):
+    return recommend_articles_batch([text], top_k=top_k)[0]
+
+
+# ------------------ METRICS ------------------ #
+
+def _index_size():
+    index, kb = _index, _kb_index
+    sizes = []
+    if index is not None:
+        sizes += [({'index': 'tickets', 'unit': 'rows'}, index['matrix'].shape[0]),
+                  ({'index': 'tickets', 'unit': 'nnz'}, index['matrix'].nnz),
+                  ({'index': 'tickets_delta', 'unit': 'rows'}, len(index['delta']['snippets']))]
+        if index['ann'] is not None:
+            sizes += [({'index': 'tickets_ann', 'unit': 'rows'}, index['ann'].meta['rows']),
+                      ({'index': 'tickets_ann', 'unit': 'lists'}, index['ann'].meta['lists'])]
+    if kb is not None and kb['matrix'] is not None:
+        sizes += [({'index': 'kb', 'unit': 'rows'}, kb['matrix'].shape[0]),
+                  ({'index': 'kb', 'unit': 'nnz'}, kb['matrix'].nnz)]
+    return sizes or None
+
+metrics.gauge('index_size', "Rows and stored non-zeros of the loaded similarity indexes", _index_size)
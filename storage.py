@@ -0,0 +1,576 @@
+import os
+import io
+import csv
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, "data")
+DB_PATH = os.environ.get("SUPPORT_DB_PATH", os.path.join(DATA_DIR, "support.sqlite3"))
+
+# Legacy flat files, imported once by migrate_from_files()
+FEEDBACK_CSV = os.path.join(DATA_DIR, "feedback.csv")
+GAP_CSV = os.path.join(DATA_DIR, "content_gaps.csv")
+KB_CSV = os.path.join(DATA_DIR, "knowledge_base.csv")
+LLM_LOG_JSONL = os.path.join(DATA_DIR, "llm_logs.jsonl")
+
+FEEDBACK_FIELDS = ['timestamp', 'original_text', 'final_category', 'final_tags', 'final_priority', 'agent_note']
+GAP_FIELDS = ['timestamp', 'ticket_excerpt']
+KB_FIELDS = ['article_id', 'title', 'content', 'link']
+LLM_LOG_FIELDS = ['timestamp', 'model', 'input_snippet', 'parsed', 'raw_response', 'tokens_before', 'tokens_after']
+INGESTED_FIELDS = ['timestamp', 'text', 'category', 'source']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    original_text TEXT,
+    final_category TEXT,
+    final_tags TEXT,
+    final_priority TEXT,
+    agent_note TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback(timestamp);
+CREATE INDEX IF NOT EXISTS idx_feedback_category ON feedback(final_category);
+
+CREATE TABLE IF NOT EXISTS content_gaps (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    ticket_excerpt TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_content_gaps_timestamp ON content_gaps(timestamp);
+
+CREATE TABLE IF NOT EXISTS kb_articles (
+    id INTEGER PRIMARY KEY,
+    article_id TEXT NOT NULL,
+    title TEXT,
+    content TEXT,
+    link TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_kb_articles_article_id ON kb_articles(article_id);
+
+CREATE TABLE IF NOT EXISTS llm_logs (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    model TEXT,
+    input_snippet TEXT,
+    parsed TEXT,
+    raw_response TEXT,
+    tokens_before INTEGER,
+    tokens_after INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_llm_logs_timestamp ON llm_logs(timestamp);
+
+CREATE TABLE IF NOT EXISTS ingested_tickets (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    text TEXT,
+    category TEXT,
+    source TEXT
+);
+
+CREATE TABLE IF NOT EXISTS kb_jobs (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    heartbeat REAL,
+    finished_at TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_kb_jobs_status ON kb_jobs(status);
+
+CREATE TABLE IF NOT EXISTS kb_job_items (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL,
+    cluster_key TEXT NOT NULL,
+    excerpt TEXT,
+    gap_count INTEGER,
+    status TEXT NOT NULL,
+    title TEXT,
+    content TEXT,
+    article_id TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_kb_job_items_job ON kb_job_items(job_id);
+CREATE INDEX IF NOT EXISTS idx_kb_job_items_cluster ON kb_job_items(cluster_key);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added to existing tables since they were first created (CREATE
+# TABLE IF NOT EXISTS leaves those alone).
+ADDED_COLUMNS = {
+    'llm_logs': [('tokens_before', 'INTEGER'), ('tokens_after', 'INTEGER')],
+}
+
+# Identify a legacy row already in the database, so `migrate --force` only
+# adds what is missing instead of importing everything a second time.
+NATURAL_KEYS = {
+    'feedback': ('timestamp', 'original_text'),
+    'content_gaps': ('timestamp', 'ticket_excerpt'),
+    'llm_logs': ('timestamp', 'model', 'input_snippet'),
+}
+
+_local = threading.local()
+_migrated = {'pid': None}
+_migrate_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    # WAL: readers never block on the (single) writer and vice versa.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    conn.executescript(SCHEMA)
+    _add_columns(conn)
+    return conn
+
+
+def _add_columns(conn):
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {r['name'] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for name, kind in columns:
+            if name in existing:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+            except sqlite3.OperationalError as e:
+                # Another worker added it first.
+                if 'duplicate column' not in str(e):
+                    raise
+
+
+def get_db():
+    """
+    Per-thread connection, reopened after fork. The first connection of a
+    process also runs the one-shot migration from the legacy files.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        if _migrated['pid'] != os.getpid():
+            with _migrate_lock:
+                if _migrated['pid'] != os.getpid():
+                    migrate_from_files(conn)
+                    _migrated['pid'] = os.getpid()
+    return conn
+
+
+# ------------------ MIGRATION ------------------ #
+
+def _read_csv_rows(path, fields):
+    import pandas as pd
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    for f in fields:
+        if f not in df.columns:
+            df[f] = ''
+    return df[fields].to_dict(orient='records')
+
+
+def _read_jsonl_rows(path):
+    rows = []
+    with open(path, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                rows.append(json.loads(line))
+            except Exception:
+                continue
+    return rows
+
+
+def _key(values):
+    return tuple('' if v is None else str(v) for v in values)
+
+
+def _missing_rows(conn, table, rows):
+    # Rows whose NATURAL_KEYS columns match no row of `table` yet.
+    fields = NATURAL_KEYS[table]
+    existing = {_key(r) for r in conn.execute(f"SELECT {', '.join(fields)} FROM {table}")}
+    return [r for r in rows if _key(r.get(f) for f in fields) not in existing]
+
+
+def migrate_from_files(conn=None, force=False):
+    """
+    Import feedback.csv, content_gaps.csv, knowledge_base.csv and
+    llm_logs.jsonl into the database. Runs once per database (recorded in
+    the meta table) unless force=True; the files themselves are left alone.
+    Rows already in the database are skipped (KB articles are replaced by
+    article_id), so forcing it again does not duplicate anything.
+    """
+    conn = conn or get_db()
+    # BEGIN IMMEDIATE takes the write lock, so concurrent workers cannot both migrate.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_files'").fetchone()
+        if done and not force:
+            conn.execute("COMMIT")
+            return False
+        counts = {}
+        if os.path.exists(FEEDBACK_CSV):
+            counts['feedback'] = _insert_feedback(
+                conn, _missing_rows(conn, 'feedback', _read_csv_rows(FEEDBACK_CSV, FEEDBACK_FIELDS)))
+        if os.path.exists(GAP_CSV):
+            counts['content_gaps'] = _insert_gaps(
+                conn, _missing_rows(conn, 'content_gaps', _read_csv_rows(GAP_CSV, GAP_FIELDS)))
+        if os.path.exists(KB_CSV):
+            counts['kb_articles'] = _insert_articles(conn, _read_csv_rows(KB_CSV, KB_FIELDS))
+        if os.path.exists(LLM_LOG_JSONL):
+            counts['llm_logs'] = _insert_llm_logs(
+                conn, _missing_rows(conn, 'llm_logs', _read_jsonl_rows(LLM_LOG_JSONL)))
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_files', ?)",
+            (json.dumps({'at': datetime.now().isoformat(), 'rows': counts}),)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    print("Migrated flat files into", DB_PATH, counts)
+    return True
+
+
+# ------------------ WRITES ------------------ #
+
+def _insert_feedback(conn, rows):
+    conn.executemany(
+        "INSERT INTO feedback (timestamp, original_text, final_category, final_tags, final_priority, agent_note)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        [tuple(r.get(f, '') for f in FEEDBACK_FIELDS) for r in rows]
+    )
+    return len(rows)
+
+
+def _insert_gaps(conn, rows):
+    conn.executemany(
+        "INSERT INTO content_gaps (timestamp, ticket_excerpt) VALUES (?, ?)",
+        [tuple(r.get(f, '') for f in GAP_FIELDS) for r in rows]
+    )
+    return len(rows)
+
+
+def _insert_articles(conn, rows):
+    now = datetime.now().isoformat()
+    conn.executemany(
+        "INSERT OR REPLACE INTO kb_articles (article_id, title, content, link, created_at) VALUES (?, ?, ?, ?, ?)",
+        [tuple(str(r.get(f, '') or '') for f in KB_FIELDS) + (now,) for r in rows]
+    )
+    return len(rows)
+
+
+def _insert_llm_logs(conn, rows):
+    conn.executemany(
+        "INSERT INTO llm_logs (timestamp, model, input_snippet, parsed, raw_response, tokens_before, tokens_after)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(r.get('timestamp', ''), r.get('model', ''), r.get('input_snippet', ''),
+          json.dumps(r.get('parsed'), ensure_ascii=False), r.get('raw_response') or '',
+          r.get('tokens_before'), r.get('tokens_after')) for r in rows]
+    )
+    return len(rows)
+
+
+def _insert_ingested(conn, rows):
+    conn.executemany(
+        "INSERT INTO ingested_tickets (timestamp, text, category, source) VALUES (?, ?, ?, ?)",
+        [tuple(r.get(f, '') for f in INGESTED_FIELDS) for r in rows]
+    )
+    return len(rows)
+
+
+def _write(insert, rows):
+    conn = get_db()
+    with conn:
+        return insert(conn, rows)
+
+
+def add_feedback(rows):
+    return _write(_insert_feedback, rows)
+
+
+def add_content_gaps(rows):
+    return _write(_insert_gaps, rows)
+
+
+def add_kb_articles(rows):
+    return _write(_insert_articles, rows)
+
+
+def add_llm_logs(rows):
+    return _write(_insert_llm_logs, rows)
+
+
+def add_ingested_tickets(rows):
+    return _write(_insert_ingested, rows)
+
+
+# ------------------ READS ------------------ #
+
+def recent_feedback(limit=200):
+    rows = get_db().execute(
+        "SELECT timestamp, original_text, final_category, final_tags, final_priority, agent_note"
+        " FROM feedback ORDER BY timestamp DESC, id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [dict(r) for r in reversed(rows)]
+
+
+def feedback_since(after_id=0, limit=1000):
+    """
+    Feedback rows with id > after_id, oldest first, including their id (for
+    consumers that follow the table, e.g. the local classifier).
+    """
+    rows = get_db().execute(
+        "SELECT id, original_text, final_category, final_priority FROM feedback"
+        " WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def recent_llm_logs(limit=200):
+    rows = get_db().execute(
+        "SELECT timestamp, model, input_snippet, parsed, raw_response, tokens_before, tokens_after"
+        " FROM llm_logs ORDER BY timestamp DESC, id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    out = []
+    for r in rows:
+        entry = dict(r)
+        try:
+            entry['parsed'] = json.loads(entry['parsed']) if entry['parsed'] else None
+        except ValueError:
+            pass
+        out.append(entry)
+    return out
+
+
+def list_content_gaps(limit=None, offset=0):
+    sql = "SELECT timestamp, ticket_excerpt FROM content_gaps ORDER BY timestamp, id"
+    params = ()
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params = (limit, offset)
+    return [dict(r) for r in get_db().execute(sql, params).fetchall()]
+
+
+def count_content_gaps():
+    return get_db().execute("SELECT COUNT(*) FROM content_gaps").fetchone()[0]
+
+
+def content_gaps_since(after_id=0, limit=5000):
+    """
+    Content gaps with id > after_id, oldest first, including their id.
+    """
+    rows = get_db().execute(
+        "SELECT id, timestamp, ticket_excerpt FROM content_gaps WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def ingested_tickets(after_id=0, upto_id=None, limit=1000):
+    """
+    Tickets added for online indexing with after_id < id <= upto_id, oldest
+    first (keyset pagination: pass the last id back as after_id).
+    """
+    sql = "SELECT id, timestamp, text, category, source FROM ingested_tickets WHERE id > ?"
+    params = [after_id]
+    if upto_id is not None:
+        sql += " AND id <= ?"
+        params.append(upto_id)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit)
+    return [dict(r) for r in get_db().execute(sql, params).fetchall()]
+
+
+def max_feedback_id():
+    return get_db().execute("SELECT COALESCE(MAX(id), 0) FROM feedback").fetchone()[0]
+
+
+def max_ingested_id():
+    return get_db().execute("SELECT COALESCE(MAX(id), 0) FROM ingested_tickets").fetchone()[0]
+
+
+def kb_fingerprint():
+    """
+    Cheap change marker for the KB: (row count, max rowid). Articles are
+    only ever inserted/replaced, and REPLACE allocates a new rowid.
+    """
+    row = get_db().execute("SELECT COUNT(*), MAX(id) FROM kb_articles").fetchone()
+    return (row[0], row[1])
+
+
+def kb_articles():
+    """
+    All KB articles as column lists: {'article_id': [...], 'title': [...], ...}.
+    """
+    rows = get_db().execute("SELECT article_id, title, content, link FROM kb_articles ORDER BY id").fetchall()
+    return {f: [r[f] or '' for r in rows] for f in KB_FIELDS}
+
+
+# ------------------ KB JOBS ------------------ #
+# Job status: queued -> running -> done. Item status: pending -> generated
+# (article text stored) -> added (in the KB), or failed.
+
+KB_JOB_ITEM_FIELDS = ['cluster_key', 'excerpt', 'gap_count']
+
+
+def create_kb_job(items):
+    """
+    Queue a job with one item per gap cluster; returns the job id.
+    """
+    conn = get_db()
+    with conn:
+        job_id = conn.execute(
+            "INSERT INTO kb_jobs (created_at, status) VALUES (?, 'queued')", (datetime.now().isoformat(),)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO kb_job_items (job_id, cluster_key, excerpt, gap_count, status) VALUES (?, ?, ?, ?, 'pending')",
+            [(job_id,) + tuple(i.get(f) for f in KB_JOB_ITEM_FIELDS) for i in items]
+        )
+    return job_id
+
+
+def claim_kb_job(owner, now, stale_before):
+    """
+    Atomically take the oldest queued job, or a running one whose owner
+    stopped heartbeating before stale_before. Returns its id or None.
+    """
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id FROM kb_jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?)"
+            " ORDER BY id LIMIT 1", (stale_before,)
+        ).fetchone()
+        if row is not None:
+            conn.execute("UPDATE kb_jobs SET status = 'running', owner = ?, heartbeat = ? WHERE id = ?",
+                         (owner, now, row['id']))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row['id'] if row is not None else None
+
+
+def kb_job_heartbeat(job_id, now):
+    conn = get_db()
+    with conn:
+        conn.execute("UPDATE kb_jobs SET heartbeat = ? WHERE id = ?", (now, job_id))
+
+
+def finish_kb_job(job_id, status, error=None):
+    conn = get_db()
+    with conn:
+        conn.execute("UPDATE kb_jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                     (status, datetime.now().isoformat(), error, job_id))
+
+
+def kb_job_items(job_id, status=None):
+    sql = "SELECT * FROM kb_job_items WHERE job_id = ?"
+    params = [job_id]
+    if status is not None:
+        sql += " AND status = ?"
+        params.append(status)
+    return [dict(r) for r in get_db().execute(sql + " ORDER BY id", params).fetchall()]
+
+
+def update_kb_job_items(rows):
+    """
+    rows: [{'id', 'status', 'title', 'content', 'article_id', 'error'}, ...]
+    in one transaction.
+    """
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "UPDATE kb_job_items SET status = ?, title = ?, content = ?, article_id = ?, error = ? WHERE id = ?",
+            [(r['status'], r.get('title'), r.get('content'), r.get('article_id'), r.get('error'), r['id'])
+             for r in rows]
+        )
+
+
+def kb_jobs(job_id=None, limit=20):
+    """
+    Jobs (newest first) with their item counts per status.
+    """
+    sql = ("SELECT j.id, j.created_at, j.status, j.owner, j.finished_at, j.error,"
+           " COUNT(i.id) AS items,"
+           " SUM(i.status = 'pending') AS pending, SUM(i.status = 'generated') AS generated,"
+           " SUM(i.status = 'added') AS added, SUM(i.status = 'failed') AS failed"
+           " FROM kb_jobs j LEFT JOIN kb_job_items i ON i.job_id = j.id")
+    params = []
+    if job_id is not None:
+        sql += " WHERE j.id = ?"
+        params.append(job_id)
+    sql += " GROUP BY j.id ORDER BY j.id DESC LIMIT ?"
+    params.append(limit)
+    return [dict(r) for r in get_db().execute(sql, params).fetchall()]
+
+
+def gap_cluster_status():
+    """
+    {cluster_key: (status, article_id)} of the latest job item per gap
+    cluster, so clusters already queued or written are not queued again.
+    """
+    rows = get_db().execute(
+        "SELECT cluster_key, status, article_id FROM kb_job_items ORDER BY id"
+    ).fetchall()
+    return {r['cluster_key']: (r['status'], r['article_id']) for r in rows}
+
+
+# ------------------ EXPORTS ------------------ #
+
+EXPORTS = {
+    'feedback.csv': ("SELECT timestamp, original_text, final_category, final_tags, final_priority, agent_note"
+                     " FROM feedback ORDER BY id", FEEDBACK_FIELDS),
+    'content_gaps.csv': ("SELECT timestamp, ticket_excerpt FROM content_gaps ORDER BY id", GAP_FIELDS),
+    'knowledge_base.csv': ("SELECT article_id, title, content, link FROM kb_articles ORDER BY id", KB_FIELDS),
+    'ingested_tickets.csv': ("SELECT timestamp, text, category, source FROM ingested_tickets ORDER BY id",
+                             INGESTED_FIELDS),
+}
+
+
+def export(name):
+    """
+    Render one of the legacy download files (feedback.csv, content_gaps.csv,
+    knowledge_base.csv, llm_logs.jsonl) from the database. Returns None for
+    names that are not stored here.
+    """
+    buf = io.StringIO()
+    if name == 'llm_logs.jsonl':
+        rows = get_db().execute(
+            "SELECT timestamp, model, input_snippet, parsed, raw_response, tokens_before, tokens_after"
+            " FROM llm_logs ORDER BY id"
+        )
+        for r in rows:
+            entry = dict(r)
+            entry['parsed'] = json.loads(entry['parsed']) if entry['parsed'] else None
+            buf.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return buf.getvalue()
+    if name not in EXPORTS:
+        return None
+    sql, fields = EXPORTS[name]
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(fields)
+    writer.writerows(tuple(r) for r in get_db().execute(sql))
+    return buf.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Support data storage (SQLite).")
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--force', action='store_true', help="import the flat files again even if already migrated")
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        conn = _connect()
+        if not migrate_from_files(conn, force=args.force):
+            print("Already migrated; use --force to import the files again.")
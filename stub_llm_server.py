@@ -0,0 +1,112 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+    python stub_llm_server.py --port 8009 --latency 0.3 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8009/v1 OPENAI_API_KEY=stub python run_app.py
+
+Answers POST /v1/chat/completions with a JSON classification derived from the
+rule-based classifier, after an optional delay, and can inject HTTP 500/429
+errors to exercise retries and deadlines.
+"""
+import json
+import random
+import argparse
+import threading
+from time import sleep
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_classifier import _rule_based
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests = 0
+
+
+def _make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send(404, {'error': {'message': 'not found'}})
+                return
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send(400, {'error': {'message': 'invalid JSON'}})
+                return
+            config.requests += 1
+
+            delay = config.latency + random.uniform(0, config.jitter)
+            if delay > 0:
+                sleep(delay)
+            roll = random.random()
+            if roll < config.error_rate:
+                self._send(500, {'error': {'message': 'injected server error'}})
+                return
+            if roll < config.error_rate + config.rate_limit_rate:
+                self._send(429, {'error': {'message': 'injected rate limit'}}, {'Retry-After': '0.1'})
+                return
+
+            messages = body.get('messages') or []
+            prompt = messages[-1].get('content', '') if messages else ''
+            answer = _rule_based(prompt)
+            answer['title'] = 'Support Article'
+            answer['content'] = answer['solution']
+            self._send(200, {
+                'id': f"stub-{config.requests}",
+                'object': 'chat.completion',
+                'model': body.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': json.dumps(answer)},
+                    'finish_reason': 'stop'
+                }]
+            })
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(host='127.0.0.1', port=0, **config_kwargs):
+    """
+    Start the stub in a daemon thread. Returns (server, base_url); call
+    server.shutdown() to stop it. port=0 picks a free port.
+    """
+    config = StubConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub OpenAI chat completions server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8009)
+    parser.add_argument('--latency', type=float, default=0.0, help="base delay per request (seconds)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra uniform random delay (seconds)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction answered with HTTP 429")
+    args = parser.parse_args()
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(config))
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
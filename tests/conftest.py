@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+
+# Keep the suite away from the real database and caches; set before the app
+# modules are imported, since they read their tunables at import time.
+_TMP = tempfile.mkdtemp(prefix="support-tests-")
+os.environ.setdefault("SUPPORT_DB_PATH", os.path.join(_TMP, "support.sqlite3"))
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("DEDUP_ENABLED", "0")
+os.environ.setdefault("INDEX_INGEST", "0")
+os.environ.setdefault("LOCAL_MODEL_ENABLED", "0")
+os.environ.pop("OPENAI_API_KEY", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    A fresh, empty SQLite store for one test (no legacy-file migration).
+    """
+    import storage
+    import similarity
+    monkeypatch.setattr(storage, 'DB_PATH', str(tmp_path / "support.sqlite3"))
+    monkeypatch.setattr(storage, '_local', storage.threading.local())
+    monkeypatch.setattr(storage, '_migrated', {'pid': os.getpid()})
+    monkeypatch.setattr(similarity, '_kb_index', None)
+    return storage
+
+
+HISTORY = [
+    "Cannot login after password reset, the sign in page keeps reloading",
+    "Refund requested for a duplicate charge on my credit card",
+    "The app crashes with an error when I open the reports page",
+    "Please add a dark mode feature to the dashboard",
+    "Invoice shows the wrong billing address and amount",
+] * 8
+
+
+@pytest.fixture
+def history_index(tmp_path, monkeypatch):
+    """
+    A small ticket history (HISTORY) behind similarity's index, built on
+    first use in tmp_path.
+    """
+    import similarity
+    path = tmp_path / "processed_tickets.csv"
+    path.write_text("text\n" + "".join(f'"{t} #{i}"\n' for i, t in enumerate(HISTORY)), encoding="utf-8")
+    monkeypatch.setattr(similarity, 'HIST_PATH', str(path))
+    monkeypatch.setattr(similarity, 'LEGACY_HIST_PATH', str(path))
+    monkeypatch.setattr(similarity, 'INDEX_DIR', str(tmp_path / "index" / "tfidf"))
+    monkeypatch.setattr(similarity, '_index', None)
+    return str(path)
@@ -0,0 +1,54 @@
+from io import BytesIO
+from time import monotonic, sleep
+
+import pytest
+
+import app as app_module
+import llm_pool
+import similarity
+import stub_llm_server
+from llm_pool import TokenBucket
+
+
+@pytest.fixture
+def client(db, history_index):
+    return app_module.app.test_client()
+
+
+def _upload(client, text):
+    return client.post('/analyze', data={'file': (BytesIO(text.encode()), 'ticket.txt')},
+                       content_type='multipart/form-data')
+
+
+def test_the_llm_call_gets_only_the_remaining_budget(client, monkeypatch):
+    server, url = stub_llm_server.start_stub_server(latency=2.0)
+    monkeypatch.setattr(llm_pool, 'OPENAI_BASE_URL', url)
+    monkeypatch.setattr(llm_pool, '_bucket', TokenBucket(rate=0))
+    monkeypatch.setattr(llm_pool, 'LLM_DEADLINE_SECONDS', 20)
+    monkeypatch.setattr(app_module, 'ANALYZE_BUDGET_SECONDS', 0.3)
+    monkeypatch.setenv('OPENAI_API_KEY', 'key')
+    similarity.find_similar_tickets("warm the index", top_k=1)     # keep the other stages inside the budget
+    deadlines = []
+    classify_text = app_module.classify_text
+
+    def spy(text, deadline_seconds=None):
+        deadlines.append(deadline_seconds)
+        started = monotonic()
+        result = classify_text(text, deadline_seconds=deadline_seconds)
+        deadlines.append(monotonic() - started)
+        return result
+
+    monkeypatch.setattr(app_module, 'classify_text', spy)
+    try:
+        started = monotonic()
+        body = _upload(client, "I need a refund for a duplicate charge").get_json()
+        assert monotonic() - started < 1.5
+        assert body['category'] == 'payment'
+        # The stage thread is released at the budget, not at LLM_DEADLINE_SECONDS
+        while len(deadlines) < 2 and monotonic() - started < 2.0:
+            sleep(0.05)
+        given, spent = deadlines
+        assert 0 < given <= 0.3
+        assert spent < 1.0
+    finally:
+        server.shutdown()
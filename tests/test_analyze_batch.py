@@ -0,0 +1,64 @@
+from time import sleep
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(db, history_index):
+    return app_module.app.test_client()
+
+
+def test_batch_returns_one_result_per_ticket(client):
+    response = client.post('/analyze_batch', json={
+        'tickets': ["I need a refund for a duplicate charge", {'id': 'T-2', 'text': "App crashes with an error"}, "  "],
+        'top_k': 2
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 3
+    refund, crash, empty = body['results']
+    assert refund['id'] == 0 and crash['id'] == 'T-2'
+    assert refund['category'] == 'payment'
+    assert crash['category'] == 'technical'
+    assert empty == {'id': 2, 'error': 'Empty ticket text'}
+    for row in (refund, crash):
+        assert {'tags', 'suggested_priority', 'solution', 'recommended_articles'} <= set(row)
+        assert len(row['similar_tickets']) == 2
+    assert 'duplicate charge' in refund['similar_tickets'][0]['snippet']
+    assert 'crashes' in crash['similar_tickets'][0]['snippet']
+
+
+def test_a_bare_array_is_accepted(client):
+    body = client.post('/analyze_batch', json=["Invoice has the wrong billing address"]).get_json()
+    assert body['count'] == 1
+    assert body['results'][0]['id'] == 0
+
+
+@pytest.mark.parametrize('payload', [{}, [], "text", {'tickets': "not a list"}, {'tickets': ["a"], 'top_k': "many"}])
+def test_bad_payloads_are_rejected(client, payload):
+    assert client.post('/analyze_batch', json=payload).status_code == 400
+
+
+def test_too_many_tickets_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'MAX_BATCH_TICKETS', 2)
+    assert client.post('/analyze_batch', json=["a", "b", "c"]).status_code == 400
+
+
+def test_llm_classifications_fall_back_to_rules_after_the_budget(client, monkeypatch):
+    def classify_text(text, deadline_seconds=None):
+        assert deadline_seconds <= 0.3
+        if 'slow' in text:
+            sleep(1)
+        return {'category': 'from-llm', 'tags': [], 'suggested_priority': 'Low', 'solution': '', 'confidence': 0.9}
+
+    monkeypatch.setattr(app_module, 'classify_text', classify_text)
+    monkeypatch.setattr(app_module, 'BATCH_LLM_BUDGET_SECONDS', 0.3)
+    body = client.post('/analyze_batch', json={
+        'tickets': ["fast refund question", "slow refund question"], 'use_llm': True
+    }).get_json()
+    fast, slow = body['results']
+    assert fast['category'] == 'from-llm'
+    assert slow['category'] == 'payment'
+    assert slow['fallback'] == 'rule_based'
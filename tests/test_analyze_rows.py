@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(db, history_index):
+    return app_module.app.test_client()
+
+
+def _post(client, csv_text, **form):
+    data = dict(form, file=(io.BytesIO(csv_text.encode('utf-8')), 'tickets.csv'))
+    return client.post('/analyze_rows', data=data, content_type='multipart/form-data')
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_every_row_is_one_ndjson_line_across_chunks(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'ROWS_CHUNK_SIZE', 2)
+    response = _post(client, "subject,body,priority\n"
+                             "Refund,duplicate charge on my card,high\n"
+                             "Crash,app crashes with an error,low\n"
+                             ",,\n"
+                             "Dark mode,please add a dark mode feature,low\n", top_k='1')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = _lines(response)
+    assert [r['row'] for r in rows] == [0, 1, 2, 3]
+    assert rows[0]['category'] == 'payment'
+    assert rows[1]['category'] == 'technical'
+    assert rows[2] == {'row': 2, 'error': 'Empty ticket text'}
+    assert rows[3]['category'] == 'feature'
+    assert all(len(r['similar_tickets']) == 1 for r in rows if 'error' not in r)
+    # Subject + body only; the priority column is not part of the ticket text
+    assert 'dark mode' in rows[3]['similar_tickets'][0]['snippet'].lower()
+
+
+def test_non_csv_uploads_and_bad_top_k_are_rejected(client):
+    txt = client.post('/analyze_rows', data={'file': (io.BytesIO(b"x"), 'ticket.txt')},
+                      content_type='multipart/form-data')
+    assert txt.status_code == 400
+    assert _post(client, "text\nhello\n", top_k='lots').status_code == 400
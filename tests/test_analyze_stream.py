@@ -0,0 +1,113 @@
+import json
+from io import BytesIO
+from time import sleep
+
+import pytest
+
+import app as app_module
+import dedup
+
+TICKET = "I was charged twice for my subscription and need a refund of the duplicate charge"
+LLM_RESULT = {'category': 'billing-llm', 'tags': ['refund'], 'suggested_priority': 'High',
+              'solution': 'Refund the duplicate charge', 'confidence': 0.9}
+
+
+@pytest.fixture
+def client(db, history_index, monkeypatch):
+    ingested = []
+    monkeypatch.setattr(app_module, 'ingest_ticket', lambda text, category='': ingested.append(category))
+    client = app_module.app.test_client()
+    client.ingested = ingested
+    return client
+
+
+@pytest.fixture
+def recent(monkeypatch):
+    monkeypatch.setattr(dedup, 'DEDUP_ENABLED', True)
+    monkeypatch.setattr(dedup, 'DEDUP_HISTORY_ROWS', 0)
+    monkeypatch.setattr(dedup, '_recent', dedup.MinHashLSH(100))
+
+
+def _events(response):
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        if block.strip():
+            event, data = block.split("\n")
+            assert event.startswith("event: ") and data.startswith("data: ")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def _stream(client, text):
+    return client.post('/analyze/stream', data={'file': (BytesIO(text.encode()), 'ticket.txt')},
+                       content_type='multipart/form-data')
+
+
+def test_events_arrive_in_order(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'classify_text', lambda text, deadline_seconds=None: dict(LLM_RESULT))
+    response = _stream(client, TICKET)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response)
+    names = [name for name, _ in events]
+    assert names[:2] == ['extracted', 'rule_based']
+    assert sorted(names[2:5]) == ['llm_result', 'recommended_articles', 'similar_tickets']
+    assert names[5:] == ['done']
+    data = dict(events)
+    assert data['extracted']['uploaded_ticket'] == TICKET
+    assert data['rule_based']['category'] == 'payment'
+    assert data['llm_result']['category'] == 'billing-llm'
+    assert data['done']['partial'] == []
+    assert {'extract', 'rule_based', 'llm_result'} <= set(data['done']['timings_ms'])
+
+
+def test_the_final_category_is_ingested(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'classify_text', lambda text, deadline_seconds=None: dict(LLM_RESULT))
+    _events(_stream(client, TICKET))
+    assert client.ingested == ['billing-llm']
+
+
+def test_a_slow_classification_falls_back_to_rules(client, monkeypatch):
+    def classify_text(text, deadline_seconds=None):
+        sleep(1)
+        return dict(LLM_RESULT)
+
+    monkeypatch.setattr(app_module, 'classify_text', classify_text)
+    monkeypatch.setattr(app_module, 'ANALYZE_BUDGET_SECONDS', 0.5)
+    data = dict(_events(_stream(client, TICKET)))
+    assert data['llm_result'] == dict(data['rule_based'], fallback='rule_based')
+    assert data['done']['partial'] == ['llm_result']
+    assert client.ingested == ['payment']
+
+
+def test_unreadable_files_get_a_400(client):
+    assert _stream(client, "   \n  ").status_code == 400
+
+
+def test_a_recent_duplicate_replays_the_stored_analysis(client, recent, monkeypatch):
+    calls = []
+
+    def classify_text(text, deadline_seconds=None):
+        calls.append(text)
+        return dict(LLM_RESULT)
+
+    monkeypatch.setattr(app_module, 'classify_text', classify_text)
+    first = dict(_events(_stream(client, TICKET)))
+    events = _events(_stream(client, TICKET + "."))
+    assert [name for name, _ in events] == ['extracted', 'llm_result', 'similar_tickets',
+                                            'recommended_articles', 'done']
+    second = dict(events)
+    assert len(calls) == 1
+    assert client.ingested == ['billing-llm']
+    assert second['llm_result'] == first['llm_result']
+    assert second['similar_tickets'] == first['similar_tickets']
+    assert second['done']['dedup']['hit'] is True
+
+
+def test_stream_and_analyze_share_stored_analyses(client, recent, monkeypatch):
+    monkeypatch.setattr(app_module, 'classify_text', lambda text, deadline_seconds=None: dict(LLM_RESULT))
+    _events(_stream(client, TICKET))
+    body = client.post('/analyze', data={'file': (BytesIO(TICKET.encode()), 'ticket.txt')},
+                       content_type='multipart/form-data').get_json()
+    assert body['dedup']['hit'] is True
+    assert body['category'] == 'billing-llm'
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+import ann_index
+
+
+def _matrix(rows=1500, cols=400, seed=0):
+    X = sp.random(rows, cols, density=0.03, format='csr', dtype=np.float32, random_state=seed)
+    return normalize(X).astype(np.float32)
+
+
+def test_vectors_are_written_in_list_order(tmp_path):
+    matrix = _matrix()
+    ann_dir = str(tmp_path / "lsa")
+    meta = ann_index.build(matrix, {'built_at': 'x', 'shape': list(matrix.shape), 'nnz': matrix.nnz},
+                           ann_dir, dim=16, n_lists=8)
+    ann = ann_index.load(ann_dir)
+    assert meta['rows'] == matrix.shape[0]
+    assert sorted(ann.list_ids) == list(range(matrix.shape[0]))
+    expected = ann.embed(matrix[np.asarray(ann.list_ids)])
+    np.testing.assert_allclose(np.asarray(ann.vectors), expected, atol=1e-5)
+    offsets = np.asarray(ann.list_offsets)
+    assigned = np.argmax(expected @ np.asarray(ann.centroids).T, axis=1)
+    for l in range(len(offsets) - 1):
+        assert (assigned[offsets[l]:offsets[l + 1]] == l).all()
+
+
+def test_rebuild_swaps_the_artifact_atomically(tmp_path):
+    matrix = _matrix()
+    ann_dir = str(tmp_path / "lsa")
+    tfidf_meta = {'built_at': 'x', 'shape': list(matrix.shape), 'nnz': matrix.nnz}
+    ann_index.build(matrix, tfidf_meta, ann_dir, dim=16, n_lists=8)
+    first = os.path.realpath(ann_dir)
+    for _ in range(2):
+        ann_index.build(matrix, tfidf_meta, ann_dir, dim=16, n_lists=8)
+    assert os.path.islink(ann_dir)
+    assert os.path.realpath(ann_dir) != first
+    # The current generation and the one it replaced; older ones are removed.
+    assert len([p for p in os.listdir(tmp_path) if p.startswith("lsa.gen-")]) == 2
+    assert ann_index.is_fresh(ann_index.read_meta(ann_dir), tfidf_meta)
@@ -0,0 +1,40 @@
+import append_log
+from append_log import AppendLog
+
+
+def _dropped(name):
+    return append_log._DROPPED._values.get((('log', name),), 0)
+
+
+def test_failed_write_is_retried(monkeypatch):
+    monkeypatch.setattr(append_log, 'RETRY_BACKOFF', 0)
+    written, calls = [], []
+
+    def flaky_sink(batch):
+        calls.append(len(batch))
+        if len(calls) < 3:
+            raise OSError("database is locked")
+        written.extend(batch)
+
+    log = AppendLog(sink=flaky_sink)
+    log._pending = [{'n': 1}, {'n': 2}]
+    log.flush()
+    assert calls == [2, 2, 2]
+    assert written == [{'n': 1}, {'n': 2}]
+    assert _dropped('flaky_sink') == 0
+
+
+def test_batch_is_dropped_and_counted_after_last_attempt(monkeypatch):
+    monkeypatch.setattr(append_log, 'RETRY_BACKOFF', 0)
+    calls = []
+
+    def broken_sink(batch):
+        calls.append(len(batch))
+        raise OSError("disk full")
+
+    log = AppendLog(sink=broken_sink)
+    log._pending = [{'n': 1}, {'n': 2}, {'n': 3}]
+    log.flush()
+    assert len(calls) == append_log.WRITE_ATTEMPTS
+    assert _dropped('broken_sink') == 3
+    assert log._pending == []
@@ -0,0 +1,53 @@
+import functools
+
+import pytest
+
+import dedup
+import index_store
+
+WORDS = ["printer", "invoice", "login", "refund", "laptop", "network", "password", "shipping",
+         "battery", "screen", "upgrade", "account", "delivery", "warranty", "license"]
+
+
+def _ticket(i):
+    return " ".join(f"{WORDS[(i + k) % len(WORDS)]}{i}" for k in range(8))
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    path = tmp_path / "processed_tickets.csv"
+    path.write_text("text\n" + "".join(_ticket(i) + "\n" for i in range(30)), encoding="utf-8")
+    # Small chunks, so the oldest rows to skip end in the middle of one.
+    monkeypatch.setattr(index_store, 'iter_chunks', functools.partial(index_store.iter_chunks, chunk_rows=7))
+    monkeypatch.setattr(dedup, '_history', dedup.MinHashLSH(100))
+    monkeypatch.setattr(dedup, '_history_state', {'pid': None, 'loaded': False, 'shared': False})
+    return str(path)
+
+
+def test_history_keeps_the_most_recent_rows(history):
+    dedup._load_history(history, 10)
+    assert dedup._history_state['loaded']
+    assert len(dedup._history) == 10
+    for i in (20, 24, 29):
+        assert dedup._history.query(dedup.signature(_ticket(i)))[1] == i
+    assert dedup._history.query(dedup.signature(_ticket(3))) is None
+
+
+def test_history_shorter_than_limit_is_loaded_whole(history):
+    dedup._load_history(history, 1000)
+    assert len(dedup._history) == 30
+    assert dedup._history.query(dedup.signature(_ticket(0)))[1] == 0
+
+
+def test_preloaded_history_is_kept_after_fork(history, monkeypatch):
+    import similarity
+    monkeypatch.setattr(similarity, 'HIST_PATH', history)
+    monkeypatch.setattr(dedup, 'DEDUP_ENABLED', True)
+    monkeypatch.setattr(dedup, 'DEDUP_HISTORY_ROWS', 100)
+    dedup.preload()
+    assert dedup._history_state['loaded'] and len(dedup._history) == 30
+    # A forked worker has another pid: it must not clear and reload the shared copy
+    monkeypatch.setitem(dedup._history_state, 'pid', -1)
+    dedup._ensure_history()
+    assert dedup._history_state['pid'] == -1
+    assert dedup._history.query(dedup.signature(_ticket(5)))[1] == 5
@@ -0,0 +1,53 @@
+import os
+import threading
+from time import sleep
+
+import pytest
+
+import index_store
+import similarity
+
+
+@pytest.fixture
+def history(tmp_path):
+    path = tmp_path / "processed_tickets.csv"
+    rows = [f"printer {i} offline after driver update" if i % 2 else f"refund {i} for duplicate invoice"
+            for i in range(40)]
+    path.write_text("text\n" + "\n".join(rows) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_rebuild_publishes_a_new_generation(history, tmp_path):
+    index_dir = str(tmp_path / "index" / "tfidf")
+    first = index_store.build_index(history, index_dir)
+    first_dir = os.path.realpath(index_dir)
+    second = index_store.build_index(history, index_dir)
+    assert os.path.islink(index_dir)
+    assert os.path.realpath(index_dir) != first_dir
+    assert index_store.read_meta(index_dir)['built_at'] == second['built_at'] != first['built_at']
+    _, matrix, snippets, meta = index_store.load_index(index_dir)
+    assert matrix.shape[0] == len(snippets) == 40
+    assert index_store.is_fresh(meta, history)
+
+
+def test_workers_racing_to_build_wait_and_reuse_one_build(history, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "index" / "tfidf")
+    monkeypatch.setattr(similarity, 'INDEX_DIR', index_dir)
+    monkeypatch.setattr(similarity, 'HIST_PATH', history)
+    monkeypatch.setattr(similarity, '_index', None)
+    builds = []
+    build_index = index_store.build_index
+
+    def slow_build(*args, **kwargs):
+        builds.append(args)
+        sleep(0.3)
+        return build_index(*args, **kwargs)
+
+    monkeypatch.setattr(index_store, 'build_index', slow_build)
+    threads = [threading.Thread(target=similarity._build_index) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(builds) == 1
+    assert similarity._index['matrix'].shape[0] == 40
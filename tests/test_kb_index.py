@@ -0,0 +1,43 @@
+import similarity
+
+
+def _article(i, content):
+    return {'article_id': f"KB{i}", 'title': f"Article {i}", 'content': content, 'link': '#'}
+
+
+ARTICLES = [
+    _article(1, "Reset your password from the sign in page and follow the email link"),
+    _article(2, "Refunds are issued to the original card within five business days"),
+    _article(3, "Clear the browser cache when the dashboard does not load"),
+]
+
+
+def test_recommendations_come_from_the_cached_index(db):
+    db.add_kb_articles(ARTICLES)
+    best = similarity.recommend_articles("how do I reset my password", top_k=1)[0]
+    assert best['article_id'] == 'KB1'
+    index = similarity._kb_index
+    similarity.recommend_articles("refund to my card", top_k=1)
+    assert similarity._kb_index is index
+
+
+def test_added_article_is_folded_in_without_refit(db):
+    db.add_kb_articles(ARTICLES)
+    similarity.recommend_articles("password", top_k=1)
+    vectorizer = similarity._kb_index['vectorizer']
+    # Folded in with the existing vocabulary, so only known terms count for it.
+    similarity.add_kb_article(_article(4, "Clear the cache, then reset the password"))
+    index = similarity._kb_index
+    assert index['vectorizer'] is vectorizer
+    assert index['pending'] == 1
+    assert index['matrix'].shape[0] == 4
+    assert index['version'] == db.kb_fingerprint()
+    assert similarity.recommend_articles("clear the cache, then reset the password", top_k=1)[0]['article_id'] == 'KB4'
+
+
+def test_articles_written_elsewhere_trigger_a_rebuild(db):
+    db.add_kb_articles(ARTICLES)
+    similarity.recommend_articles("password", top_k=1)
+    db.add_kb_articles([_article(5, "Export invoices as PDF from the billing page")])     # another worker
+    assert similarity.recommend_articles("export invoices pdf", top_k=1)[0]['article_id'] == 'KB5'
+    assert similarity._kb_index['pending'] == 0
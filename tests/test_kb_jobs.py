@@ -0,0 +1,133 @@
+import os
+import json
+import base64
+
+import pytest
+
+import app as app_module
+import kb_jobs
+import local_classifier
+from llm_classifier import classify_text
+
+AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'admin:changeme').decode()}
+ARTICLE = {'title': 'Reset a forgotten password', 'content': 'Open the sign-in page and choose "Forgot password".'}
+
+
+class _ConfidentModel:
+    meta = {'feedback_upto': 0}
+
+    def predict(self, text):
+        return 'account', 0.99, 'Medium'
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    def fake_chat_completion(messages, model_name, api_key, **kwargs):
+        calls.append(messages)
+        return json.dumps(ARTICLE)
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(kb_jobs, 'chat_completion', fake_chat_completion)
+    return calls
+
+
+@pytest.fixture
+def confident_local_model(monkeypatch):
+    monkeypatch.setattr(local_classifier, 'LOCAL_MODEL_ENABLED', True)
+    monkeypatch.setattr(local_classifier, '_model', _ConfidentModel())
+    monkeypatch.setattr(local_classifier, '_state', {'pid': os.getpid()})     # no trainer thread
+
+
+def test_generate_kb_uses_the_llm_even_with_a_confident_local_model(llm, confident_local_model, monkeypatch):
+    text = "I forgot my password and cannot log in to my account"
+    assert classify_text(text)['source'] == 'local_model'
+    added = []
+    monkeypatch.setattr(app_module, 'add_kb_article', added.append)
+
+    response = app_module.app.test_client().post('/admin/generate_kb', json={'ticket_excerpt': text}, headers=AUTH)
+    assert response.status_code == 200
+    assert len(llm) == 1
+    assert added[0]['title'] == ARTICLE['title']
+    assert added[0]['content'] == ARTICLE['content']
+
+
+def _count(counter, **labels):
+    return counter._values.get(tuple(sorted(labels.items())), 0)
+
+
+def test_generated_articles_are_cached_and_measured(llm, tmp_path, monkeypatch):
+    from llm_cache import LLMCache
+    monkeypatch.setattr(kb_jobs, '_cache', LLMCache(path=str(tmp_path / "llm_cache.sqlite3")))
+    hits, misses = _count(kb_jobs._LLM_CACHE_HITS, result='hit'), _count(kb_jobs._LLM_CACHE_HITS, result='miss')
+    timed = kb_jobs._LLM_SECONDS._series.get((('model', 'kb-test'),), [0, 0])[-1]
+
+    text = "Printer shows paper jam error although the tray is empty"
+    first = kb_jobs.generate_article(text, model_name='kb-test')
+    second = kb_jobs.generate_article(text, model_name='kb-test')
+    assert first == second == ARTICLE
+    assert len(llm) == 1
+    assert _count(kb_jobs._LLM_CACHE_HITS, result='hit') == hits + 1
+    assert _count(kb_jobs._LLM_CACHE_HITS, result='miss') == misses + 1
+    assert kb_jobs._LLM_SECONDS._series[(('model', 'kb-test'),)][-1] == timed + 1
+
+
+def test_unparsed_article_counts_as_fallback(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(kb_jobs, '_cache', None)
+    monkeypatch.setattr(kb_jobs, 'chat_completion', lambda *args, **kwargs: "no json here")
+    before = _count(kb_jobs._LLM_FALLBACKS, reason='unparsed')
+    with pytest.raises(ValueError):
+        kb_jobs.generate_article("VPN disconnects every few minutes on the office network")
+    assert _count(kb_jobs._LLM_FALLBACKS, reason='unparsed') == before + 1
+
+
+def test_gap_page_escapes_cluster_keys(monkeypatch):
+    key = "x'],alert(1),['\"><script>"
+    cluster = {'key': key, 'excerpt': 'cannot export report', 'count': 3, 'variants': 1,
+               'first_seen': '2024-01-01T00:00:00', 'last_seen': '2024-01-02T00:00:00',
+               'status': None, 'article_id': None}
+    monkeypatch.setattr(kb_jobs, 'gap_clusters', lambda offset, limit: ([cluster], 1, 3))
+    monkeypatch.setattr(kb_jobs, 'ensure_runner', lambda: None)
+    page = app_module.app.test_client().get('/admin/gaps', headers=AUTH).get_data(as_text=True)
+    assert key not in page
+    assert 'data-key="x&#x27;],alert(1),[&#x27;&quot;&gt;&lt;script&gt;"' in page
+    assert 'onclick="generateKB([this.dataset.key])"' in page
+
+
+@pytest.mark.parametrize('body', [{'limit': 'many'}, {'limit': None}, {'clusters': 'abc'}, {'clusters': [1, 2]}])
+def test_bad_job_requests_are_rejected(db, body):
+    response = app_module.app.test_client().post('/admin/kb_jobs', json=body, headers=AUTH)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('limit, expected', [(10 ** 6, 5), ("3", 3), (0, 1), (-4, 1)])
+def test_job_limit_is_clamped(db, monkeypatch, limit, expected):
+    queued = []
+    monkeypatch.setattr(kb_jobs, 'KB_JOB_MAX_ITEMS', 5)
+    monkeypatch.setattr(kb_jobs, 'enqueue', lambda clusters, limit: queued.append(limit) or (7, limit))
+    response = app_module.app.test_client().post('/admin/kb_jobs', json={'limit': limit}, headers=AUTH)
+    assert response.status_code == 202
+    assert queued == [expected]
+
+
+def _fresh_clusters(monkeypatch):
+    monkeypatch.setattr(kb_jobs, '_clusters', {'last_id': 0, 'clusters': {}, 'by_text': {},
+                                               'lsh': kb_jobs.dedup.MinHashLSH(1000, threshold=kb_jobs.KB_GAP_THRESHOLD)})
+
+
+def test_every_worker_derives_the_same_clusters(db, monkeypatch):
+    gaps = ["Printer driver fails to install on the office laptop after the update",
+            "Printer driver fails to install on the office laptop after the latest update",
+            "printer driver FAILS to install on the office laptop after the update!",
+            "Export to CSV drops the last column of the monthly sales report"]
+    db.add_content_gaps([{'timestamp': f"2026-01-0{i + 1}T00:00:00", 'ticket_excerpt': t}
+                         for i, t in enumerate(gaps)])
+    _fresh_clusters(monkeypatch)
+    first, total_clusters, total_gaps = kb_jobs.gap_clusters()
+    assert (total_clusters, total_gaps) == (2, 4)
+    assert [(c['count'], c['variants']) for c in first] == [(3, 2), (1, 1)]
+    _fresh_clusters(monkeypatch)      # another worker, starting from the same table
+    second, _, _ = kb_jobs.gap_clusters()
+    assert [c['key'] for c in second] == [c['key'] for c in first]
@@ -0,0 +1,97 @@
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache, cache_key
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache, 'time', clock)
+    return clock
+
+
+def _cache(tmp_path, **kwargs):
+    return LLMCache(path=str(tmp_path / "llm_cache.sqlite3"), **kwargs)
+
+
+def test_key_ignores_case_and_spacing_but_not_model_or_prompt_version():
+    key = cache_key("Cannot  LOGIN\n", "gpt", "v1")
+    assert key == cache_key("cannot login", "gpt", "v1")
+    assert key != cache_key("cannot login", "other-model", "v1")
+    assert key != cache_key("cannot login", "gpt", "v2")
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path, clock):
+    _cache(tmp_path).set("k", {'category': 'payment'})
+    other = _cache(tmp_path)
+    assert other.get("k") == {'category': 'payment'}
+    assert other.stats()['disk_hits'] == 1
+    assert other.get("k") == {'category': 'payment'}
+    assert other.stats()['memory_hits'] == 1
+
+
+def test_entries_expire_after_ttl_in_both_tiers(tmp_path, clock):
+    cache = _cache(tmp_path, ttl=60)
+    cache.set("k", {'category': 'payment'})
+    clock.now += 59
+    assert cache.get("k") is not None
+    clock.now += 2
+    assert cache.get("k") is None
+    assert _cache(tmp_path, ttl=60).get("k") is None      # removed from disk as well
+
+
+def test_memory_tier_keeps_the_most_recently_used(tmp_path, clock):
+    cache = _cache(tmp_path, memory_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.get("b") == 2      # still on disk
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_disk_tier_evicts_expired_then_least_recently_accessed(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(llm_cache, '_EVICT_EVERY', 1)
+    cache = _cache(tmp_path, ttl=100, max_entries=2, memory_entries=0)
+    cache.set("old", 0)
+    clock.now += 101
+    cache.set("a", 1)
+    assert cache.evictions == 1     # "old" expired
+    clock.now += 1
+    cache.set("b", 2)
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.set("c", 3)
+    assert cache.evictions == 2     # "b": least recently accessed
+    assert [cache.get(k) for k in ("a", "b", "c")] == [1, None, 3]
+
+
+def test_classify_text_answers_repeats_from_the_cache(tmp_path, monkeypatch):
+    import json
+    import llm_classifier
+    calls = []
+
+    def fake_chat_completion(messages, model_name, api_key, **kwargs):
+        calls.append(messages)
+        return json.dumps({'category': 'payment', 'tags': ['billing'], 'suggested_priority': 'High',
+                           'solution': 'Refund the duplicate charge.', 'confidence': 0.9})
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(llm_classifier, 'chat_completion', fake_chat_completion)
+    monkeypatch.setattr(llm_classifier, '_cache', _cache(tmp_path))
+    first = llm_classifier.classify_text("I was charged twice, please refund one payment")
+    second = llm_classifier.classify_text("I was charged  twice, please REFUND one payment")
+    assert first == second
+    assert first['category'] == 'payment'
+    assert len(calls) == 1
@@ -0,0 +1,125 @@
+import json
+import threading
+from time import monotonic
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import llm_pool
+import stub_llm_server
+from llm_pool import TokenBucket, LLMDeadlineExceeded, LLMRequestError, chat_completion
+
+MESSAGES = [{"role": "user", "content": "Please refund my last payment"}]
+
+
+class _FlakyConfig(stub_llm_server.StubConfig):
+    """
+    Answers the first `failures` requests with HTTP 500, then succeeds.
+    """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    @property
+    def error_rate(self):
+        return 1.0 if self.requests <= self.failures else 0.0
+
+    @error_rate.setter
+    def error_rate(self, value):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    servers = []
+
+    def start(config=None, **config_kwargs):
+        if config is None:
+            server, url = stub_llm_server.start_stub_server(**config_kwargs)
+        else:
+            server = ThreadingHTTPServer(('127.0.0.1', 0), stub_llm_server._make_handler(config))
+            server.daemon_threads = True
+            server.config = config
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        servers.append(server)
+        monkeypatch.setattr(llm_pool, 'OPENAI_BASE_URL', url)
+        return server.config
+
+    monkeypatch.setattr(llm_pool, '_bucket', TokenBucket(rate=0))
+    monkeypatch.setattr(llm_pool, 'LLM_BACKOFF_BASE', 0.01)
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_answer_is_the_message_content(stub):
+    config = stub()
+    answer = json.loads(chat_completion(MESSAGES, "stub-model", "key"))
+    assert answer['category'] == 'payment'
+    assert config.requests == 1
+
+
+def test_server_errors_are_retried(stub, monkeypatch):
+    monkeypatch.setattr(llm_pool, 'LLM_MAX_RETRIES', 3)
+    config = stub(_FlakyConfig(failures=2))
+    assert json.loads(chat_completion(MESSAGES, "stub-model", "key"))['category'] == 'payment'
+    assert config.requests == 3
+
+
+def test_retries_stop_after_max_retries(stub, monkeypatch):
+    monkeypatch.setattr(llm_pool, 'LLM_MAX_RETRIES', 2)
+    config = stub(rate_limit_rate=1.0)      # HTTP 429 with Retry-After: 0.1
+    with pytest.raises(LLMRequestError, match="429"):
+        chat_completion(MESSAGES, "stub-model", "key")
+    assert config.requests == 3
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    calls = []
+
+    def post_chat(payload, api_key, timeout):
+        calls.append(payload)
+        raise LLMRequestError("LLM endpoint returned HTTP 400", retryable=False)
+
+    monkeypatch.setattr(llm_pool, '_post_chat', post_chat)
+    with pytest.raises(LLMRequestError, match="400"):
+        chat_completion(MESSAGES, "stub-model", "key")
+    assert len(calls) == 1
+
+
+def test_slow_answers_raise_at_the_deadline(stub):
+    stub(latency=2.0)
+    started = monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        chat_completion(MESSAGES, "stub-model", "key", deadline_seconds=0.3)
+    assert monotonic() - started < 1.0
+
+
+def test_a_spent_budget_skips_the_call(stub):
+    config = stub()
+    with pytest.raises(LLMDeadlineExceeded):
+        chat_completion(MESSAGES, "stub-model", "key", deadline_seconds=0)
+    assert config.requests == 0
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = monotonic()
+    assert bucket.acquire(now + 0.01)
+    assert bucket.acquire(now + 0.01)
+    assert not bucket.acquire(monotonic() + 0.01)      # empty, next token in ~0.1s
+    started = monotonic()
+    assert bucket.acquire(started + 1.0)
+    assert 0.05 < monotonic() - started < 0.5
+
+
+def test_rate_limit_wait_counts_against_the_deadline(stub, monkeypatch):
+    config = stub()
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.acquire(monotonic() + 1)
+    monkeypatch.setattr(llm_pool, '_bucket', bucket)
+    with pytest.raises(LLMDeadlineExceeded):
+        chat_completion(MESSAGES, "stub-model", "key", deadline_seconds=0.2)
+    assert config.requests == 0
@@ -0,0 +1,118 @@
+import pytest
+
+import local_classifier
+
+
+class _Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def trainer(monkeypatch):
+    """
+    Runs _trainer_loop for a fixed number of sleeps; returns the attempts
+    and the sleep durations.
+    """
+    attempts, sleeps = [], []
+
+    def run(load_or_train, inputs, iterations=6):
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) >= iterations:
+                raise _Stop()
+
+        def fake_load_or_train():
+            attempts.append(1)
+            return load_or_train()
+
+        monkeypatch.setattr(local_classifier, '_model', None)
+        monkeypatch.setattr(local_classifier, 'sleep', fake_sleep)
+        monkeypatch.setattr(local_classifier, '_load_or_train', fake_load_or_train)
+        monkeypatch.setattr(local_classifier, '_training_inputs', lambda: inputs[min(len(sleeps), len(inputs) - 1)])
+        with pytest.raises(_Stop):
+            local_classifier._trainer_loop()
+        return attempts, sleeps
+
+    return run
+
+
+def test_no_retraining_until_new_data_arrives(trainer):
+    inputs = [('history', 7)] * 3 + [('history', 8)]
+    attempts, _ = trainer(lambda: None, inputs)
+    assert len(attempts) == 2
+
+
+def test_errors_back_off_exponentially(trainer, monkeypatch):
+    monkeypatch.setattr(local_classifier, 'LOCAL_POLL_SECONDS', 1)
+    monkeypatch.setattr(local_classifier, 'LOCAL_RETRY_MAX_SECONDS', 8)
+
+    def broken():
+        raise OSError("database is locked")
+
+    _, sleeps = trainer(broken, [('history', 7)])
+    assert sleeps == [1, 2, 4, 8, 8, 8]
+
+
+def test_preload_loads_the_model_without_a_trainer(monkeypatch):
+    model = object()
+    monkeypatch.setattr(local_classifier, 'LOCAL_MODEL_ENABLED', True)
+    monkeypatch.setattr(local_classifier, '_model', None)
+    monkeypatch.setattr(local_classifier, '_load_or_train', lambda: model)
+    monkeypatch.setattr(local_classifier, '_state', {'pid': None})
+    local_classifier.preload()
+    assert local_classifier._model is model
+    assert local_classifier._state['pid'] is None
+
+
+@pytest.mark.parametrize('label, category', [
+    ('Payment', 'payment'), (' refund ', 'refund'), ('Billing', 'payment'), ('Account', 'authentication'),
+    ('General', 'general'), ('cat0', None), ('high', None), ('', None), (None, None),
+])
+def test_labels_map_to_rule_categories(label, category):
+    assert local_classifier.category_label(label) == category
+
+
+def test_model_answers_only_in_rule_categories(db, tmp_path, monkeypatch):
+    import llm_classifier
+    rows = [("Refund the duplicate charge on my card", 'Payment'),
+            ("App crashes with an error on start", 'Technical'),
+            ("Cannot login, password reset fails", 'cat3'),
+            ("Printer queue is slow today", 'high')] * 30
+    source = tmp_path / "history.csv"
+    source.write_text("text,Category\n" + "".join(f'"{t} #{i}",{c}\n' for i, (t, c) in enumerate(rows)),
+                      encoding="utf-8")
+    model = local_classifier.train(str(source))
+    assert model.meta['classes'] == ['payment', 'technical']
+    assert model.meta['history_rows'] == 60
+    monkeypatch.setattr(local_classifier, 'LOCAL_MODEL_ENABLED', True)
+    monkeypatch.setattr(local_classifier, '_model', model)
+    monkeypatch.setattr(local_classifier, '_ensure_trainer', lambda: None)
+    text = "I need a refund of the duplicate charge"
+    rules = llm_classifier._rule_based(text)
+    answer = local_classifier.predict(text, rules)
+    assert answer['category'] == rules['category'] == 'payment'
+    assert answer['solution'] == rules['solution']
+
+
+def test_saved_models_with_unmapped_labels_are_retrained(tmp_path, monkeypatch):
+    saved = {'classes': ['Payment', 'cat0']}
+    monkeypatch.setattr(local_classifier, 'MODEL_PATH', str(tmp_path / "model.pkl"))
+    (tmp_path / "model.pkl").write_bytes(b"")
+    monkeypatch.setattr(local_classifier, 'load', lambda path: type('Saved', (), {'meta': saved})())
+    retrained = []
+    monkeypatch.setattr(local_classifier, 'train', lambda source: retrained.append(source))
+    monkeypatch.setattr(local_classifier, '_history_source', lambda: "history.csv")
+    assert local_classifier._load_or_train() is None
+    assert retrained == ["history.csv"]
+    saved['classes'] = ['payment', 'technical']
+    assert local_classifier._load_or_train().meta is saved
+
+
+def test_rule_answers_are_not_escalations(monkeypatch):
+    monkeypatch.setattr(local_classifier, '_decisions', local_classifier.Counter())
+    for route in ['local'] * 3 + ['llm'] + ['rules'] * 6:
+        local_classifier.record(route)
+    report = local_classifier.report()
+    assert report['escalation_rate'] == 0.25
+    assert report['rules_answers'] == 6
+    assert 'ticket_local_classifier_escalation_ratio 0.25' in local_classifier.metrics.render_prometheus()
@@ -0,0 +1,91 @@
+import base64
+from io import BytesIO
+
+import pytest
+
+import app as app_module
+import metrics
+
+AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'admin:changeme').decode()}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, '_registry', {})
+    monkeypatch.setattr(metrics, '_gauges', {})
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', True)
+
+
+def test_counter_lines_per_label_set(registry):
+    hits = metrics.counter('cache_total', "Cache lookups")
+    hits.inc(result='hit')
+    hits.inc(2, result='hit')
+    hits.inc(result='miss')
+    assert metrics.counter('cache_total') is hits
+    text = metrics.render_prometheus()
+    assert "# HELP ticket_cache_total Cache lookups\n# TYPE ticket_cache_total counter" in text
+    assert 'ticket_cache_total{result="hit"} 3' in text
+    assert 'ticket_cache_total{result="miss"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    hist = metrics.histogram('work_seconds', "Work", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        hist.observe(value, stage='x')
+    lines = metrics.render_prometheus().splitlines()
+    assert 'ticket_work_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'ticket_work_seconds_bucket{stage="x",le="1.0"} 3' in lines
+    assert 'ticket_work_seconds_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 'ticket_work_seconds_sum{stage="x"} 6.05' in lines
+    assert 'ticket_work_seconds_count{stage="x"} 4' in lines
+
+
+def test_timer_observes_the_block(registry):
+    with metrics.timer('block_seconds', "Block", stage='extract'):
+        pass
+    assert metrics.histogram('block_seconds')._series[(('stage', 'extract'),)][-1] == 1
+
+
+def test_label_values_are_escaped(registry):
+    metrics.counter('odd_total').inc(path='a"b\\c\nd')
+    assert 'ticket_odd_total{path="a\\"b\\\\c\\nd"} 1' in metrics.render_prometheus()
+
+
+def test_gauges_are_read_at_scrape_time(registry):
+    size = [3]
+    metrics.gauge('index_rows', "Rows", lambda: size[0])
+    metrics.gauge('by_kind', "Per kind", lambda: [({'kind': 'a'}, 1)])
+    metrics.gauge('skipped', "Not ready", lambda: None)
+    metrics.gauge('broken', "Raises", lambda: 1 / 0)
+    size[0] = 7
+    text = metrics.render_prometheus()
+    assert "ticket_index_rows 7" in text
+    assert 'ticket_by_kind{kind="a"} 1' in text
+    assert "skipped" not in text and "broken" not in text
+
+
+def test_disabled_metrics_record_nothing(registry, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+    metrics.counter('off_total').inc()
+    with metrics.timer('off_seconds'):
+        pass
+    assert metrics.render_prometheus() == "\n"
+
+
+def test_endpoint_requires_auth(db):
+    assert app_module.app.test_client().get('/admin/metrics').status_code == 401
+
+
+def test_analyze_records_stage_and_request_latency(db, history_index):
+    client = app_module.app.test_client()
+    response = client.post('/analyze', data={'file': (BytesIO(b"App crashes with an error on login"), 'ticket.txt')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    response = client.get('/admin/metrics', headers=AUTH)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    for stage in ('extract_txt', 'classify', 'similar', 'articles'):
+        assert f'ticket_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'ticket_http_request_seconds_count{endpoint="analyze_file",status="200"}' in text
+    assert "# TYPE ticket_http_request_seconds histogram" in text
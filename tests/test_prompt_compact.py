@@ -0,0 +1,86 @@
+import pytest
+
+import prompt_compact
+from prompt_compact import compact
+
+
+@pytest.mark.parametrize('text', [
+    "I cannot unsubscribe from your marketing emails, please help",
+    "The unsubscribe link in your newsletter returns a 404",
+])
+def test_tickets_about_unsubscribing_are_kept(text):
+    assert compact(text)[0] == text
+
+
+@pytest.mark.parametrize('text', ["Best", "Thanks!", "  Kind regards,  "])
+def test_text_that_is_only_boilerplate_is_not_emptied(text):
+    compacted, before, after = compact(text)
+    assert compacted == " ".join(text.split())
+    assert after > 0
+
+
+def test_mailing_list_footers_are_dropped():
+    text = ("My invoice total is wrong\n"
+            "Thanks\n"
+            "To unsubscribe, click here\n"
+            "Unsubscribe | Manage preferences\n"
+            "Please click here to unsubscribe from this list")
+    assert compact(text)[0] == "My invoice total is wrong"
+
+
+def test_long_text_keeps_first_sentence_within_budget():
+    text = "Checkout fails with error 502. " + " ".join(
+        f"Log line {i} shows retry {i} for order {i * 7}." for i in range(400))
+    compacted, before, after = compact(text, budget=120)
+    assert compacted.startswith("Checkout fails with error 502.")
+    assert after <= 120 < before
+    assert prompt_compact.ELLIPSIS in compacted
+
+
+@pytest.fixture
+def compact_changes(tmp_path, monkeypatch):
+    """
+    A fresh LLM cache and a compact() whose output differs on every call,
+    like after the index (and its idf weights) was reloaded.
+    """
+    from llm_cache import LLMCache
+    import kb_jobs
+    import llm_classifier
+    cache = LLMCache(path=str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_classifier, '_cache', cache)
+    monkeypatch.setattr(kb_jobs, '_cache', cache)
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    calls = []
+
+    def changing_compact(text):
+        calls.append(text)
+        return f"{text} #{len(calls)}", 10, 10
+
+    monkeypatch.setattr(prompt_compact, 'compact', changing_compact)
+    return calls
+
+
+def test_classification_cache_key_ignores_the_compacted_prompt(compact_changes, monkeypatch):
+    import llm_classifier
+    prompts = []
+
+    def fake_chat_completion(messages, model_name, api_key, **kwargs):
+        prompts.append(messages[-1]['content'])
+        return '{"category": "payment", "confidence": 0.9}'
+
+    monkeypatch.setattr(llm_classifier, 'chat_completion', fake_chat_completion)
+    text = "I was charged twice for my subscription"
+    first = llm_classifier.classify_text(text)
+    assert llm_classifier.classify_text("  i was CHARGED twice for my subscription ") == first
+    assert len(prompts) == 1 and "#1" in prompts[0]
+    assert compact_changes == [text]        # a cache hit does not compact at all
+
+
+def test_article_cache_key_ignores_the_compacted_prompt(compact_changes, monkeypatch):
+    import kb_jobs
+    answers = []
+    monkeypatch.setattr(kb_jobs, 'chat_completion', lambda *args, **kwargs: answers.append(1) or
+                        '{"title": "Duplicate charges", "content": "Refund the second charge."}')
+    text = "I was charged twice for my subscription"
+    assert kb_jobs.generate_article(text) == kb_jobs.generate_article(text)
+    assert len(answers) == 1
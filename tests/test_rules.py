@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from llm_classifier import _rule_based, classify_rules_batch
+
+
+def _tags(text):
+    return set(_rule_based(text)['tags'])
+
+
+def test_keywords_match_whole_words_only():
+    assert 'feature-request' not in _tags("Please update my address")
+    assert 'feature-request' in _tags("Please add my address")
+    assert 'documentation' not in _tags("The guidelines page is down")
+
+
+@pytest.mark.parametrize('text, tag', [
+    ("Two errors on checkout", 'bug'),
+    ("The app crashes", 'bug'),
+    ("Refunds are late", 'billing'),
+    ("Product adds a new field", 'feature-request'),
+])
+def test_plurals_match(text, tag):
+    assert tag in _tags(text)
+
+
+def test_plural_forms_give_the_same_answer_as_singulars():
+    assert _rule_based("the app crashes") == _rule_based("the app crash")
+    assert _rule_based("several errors") == _rule_based("an error")
+
+
+def test_phrases_tolerate_any_whitespace_and_case():
+    assert _rule_based("Cannot SIGN \n  IN today")['category'] == 'authentication'
+    assert 'login' in _tags("I get ACCESS    DENIED")
+
+
+def test_a_phrase_implies_the_keywords_inside_it():
+    # 'access denied' also counts as 'access' for the authentication category
+    assert _rule_based("access denied")['category'] == 'authentication'
+
+
+def test_urgent_tickets_get_high_priority():
+    assert _rule_based("URGENT: payment failed")['suggested_priority'] == 'High'
+    assert _rule_based("payment failed")['suggested_priority'] == 'Medium'
+
+
+def test_unmatched_text_is_general():
+    result = _rule_based("Hello there")
+    assert result['category'] == 'general'
+    assert result['tags'] == []
+
+
+def test_batch_matches_single_texts():
+    texts = ["Please add my address", "Refunds are late, urgent!", None, "The app crashes after login"]
+    batch = classify_rules_batch(pd.Series(texts, index=[10, 11, 12, 13]))
+    assert list(batch.index) == [10, 11, 12, 13]
+    for text, (_, row) in zip(texts, batch.iterrows()):
+        assert row.to_dict() == _rule_based(text)
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def legacy_files(tmp_path, monkeypatch):
+    feedback = tmp_path / "feedback.csv"
+    feedback.write_text(
+        "timestamp,original_text,final_category,final_tags,final_priority,agent_note\n"
+        "2024-01-01T10:00:00,printer offline,technical,printer,High,\n"
+        "2024-01-02T11:00:00,refund please,billing,,Medium,\n",
+        encoding="utf-8"
+    )
+    gaps = tmp_path / "content_gaps.csv"
+    gaps.write_text("timestamp,ticket_excerpt\n2024-01-03T09:00:00,vpn drops every hour\n", encoding="utf-8")
+    logs = tmp_path / "llm_logs.jsonl"
+    logs.write_text(json.dumps({'timestamp': '2024-01-04T08:00:00', 'model': 'm', 'input_snippet': 'x',
+                                'parsed': {'category': 'technical'}, 'raw_response': '{}'}) + "\n",
+                    encoding="utf-8")
+    monkeypatch.setattr(storage, 'DB_PATH', str(tmp_path / "support.sqlite3"))
+    monkeypatch.setattr(storage, 'FEEDBACK_CSV', str(feedback))
+    monkeypatch.setattr(storage, 'GAP_CSV', str(gaps))
+    monkeypatch.setattr(storage, 'KB_CSV', str(tmp_path / "missing.csv"))
+    monkeypatch.setattr(storage, 'LLM_LOG_JSONL', str(logs))
+    return tmp_path
+
+
+def _count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_forced_migration_does_not_duplicate_rows(legacy_files):
+    conn = storage._connect()
+    assert storage.migrate_from_files(conn)
+    storage._insert_feedback(conn, [{'timestamp': '2024-02-01T00:00:00', 'original_text': 'new from app'}])
+    conn.commit()
+    assert not storage.migrate_from_files(conn)
+    assert storage.migrate_from_files(conn, force=True)
+    assert _count(conn, 'feedback') == 3
+    assert _count(conn, 'content_gaps') == 1
+    assert _count(conn, 'llm_logs') == 1
+
+
+def test_migration_runs_once_per_process(legacy_files, monkeypatch):
+    calls = []
+    monkeypatch.setattr(storage, 'migrate_from_files', lambda conn: calls.append(conn))
+    monkeypatch.setattr(storage, '_migrated', {'pid': None})
+    monkeypatch.setattr(storage, '_local', storage.threading.local())
+    storage.get_db()
+    monkeypatch.setattr(storage, '_local', storage.threading.local())
+    storage.get_db()
+    assert len(calls) == 1
@@ -0,0 +1,101 @@
+from io import BytesIO
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import text_extract
+
+
+def _upload(data, filename):
+    return FileStorage(stream=BytesIO(data), filename=filename)
+
+
+def _pdf(pages):
+    """
+    A minimal PDF whose page i shows the text "Page i".
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for i in range(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td (Page {i}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+    out, offsets = b"%PDF-1.4\n", []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def test_capped_truncates_and_closes_the_source():
+    read = []
+
+    def pieces():
+        for piece in ["abc", "", "defg", "hij", "klm"]:
+            read.append(piece)
+            yield piece
+
+    source = pieces()
+    assert list(text_extract._capped(source, 6)) == ["abc", "def"]
+    assert read == ["abc", "", "defg"]
+    assert source.gi_frame is None      # closed, not just abandoned
+
+
+def test_capped_passes_short_text_through():
+    assert "".join(text_extract._capped(iter(["ab", "cd"]), 10)) == "abcd"
+
+
+def test_txt_is_cut_at_max_chars(monkeypatch):
+    monkeypatch.setattr(text_extract, 'READ_BYTES', 4)
+    upload = _upload(("ticket text é" * 100).encode(), 'a.txt')     # é split across reads
+    text = text_extract.extract_text(upload, 'txt', max_chars=30)
+    assert text == ("ticket text é" * 3)[:30]
+
+
+def test_txt_stops_reading_after_the_cap(monkeypatch):
+    monkeypatch.setattr(text_extract, 'READ_BYTES', 10)
+    upload = _upload(b"x" * 1000, 'a.txt')
+    assert len(text_extract.extract_text(upload, 'txt', max_chars=25)) == 25
+    assert upload.stream.tell() == 30
+
+
+def test_csv_cells_are_joined():
+    text = text_extract.extract_text(_upload(b"subject,body\nLogin,fails\nRefund,please\n", 'a.csv'), 'csv')
+    assert text == "Login fails Refund please"
+
+
+def test_unparseable_csv_falls_back_to_raw_text():
+    data = b'a,b\n1,"unterminated\n'
+    assert text_extract.extract_text(_upload(data, 'a.csv'), 'csv') == data.decode()
+
+
+def test_unsupported_extension():
+    assert text_extract.iter_text(_upload(b"x", 'a.doc'), 'doc') is None
+
+
+def test_pdf_pages_are_capped(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(_pdf(5))
+    assert [t.strip() for t in text_extract.iter_pdf_pages(str(path), max_pages=3)] == ["Page 0", "Page 1", "Page 2"]
+
+
+def test_pdf_text_is_cut_at_max_chars():
+    text = text_extract.extract_text(_upload(_pdf(4), 'a.pdf'), 'pdf', max_chars=12)
+    assert text == "Page 0 Page 1"[:12]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_long_pdfs_keep_page_order(monkeypatch, workers):
+    monkeypatch.setattr(text_extract, 'PDF_WORKERS', workers)
+    monkeypatch.setattr(text_extract, 'PDF_PAGES_PER_TASK', 2)
+    monkeypatch.setattr(text_extract, 'PDF_PARALLEL_MIN_PAGES', 3)
+    text = text_extract.extract_text(_upload(_pdf(7), 'a.pdf'), 'pdf')
+    assert text.split() == [w for i in range(7) for w in ("Page", str(i))]
@@ -0,0 +1,225 @@
+import os
+import codecs
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Caps (override via environment). Text past EXTRACT_MAX_CHARS is never read,
+# so huge uploads cost neither extraction time nor keyword/LLM work downstream.
+EXTRACT_MAX_CHARS = int(os.environ.get("EXTRACT_MAX_CHARS", "50000"))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", "50"))
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "4"))
+# Smaller PDFs are read on the request thread; a pool round trip costs more.
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "8"))
+
+READ_BYTES = 64 * 1024
+CSV_CHUNK_ROWS = 1000
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    # Never fork the (threaded) web worker itself: pool workers come from a
+    # forkserver that has this module preloaded, or are spawned where
+    # forkserver is unavailable.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+
+def _get_pool():
+    # Created lazily and per pid, like llm_pool's executor.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=_mp_context())
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _capped(pieces, max_chars):
+    """
+    Pass pieces through until max_chars characters were yielded; the last
+    piece is truncated and the source generator closed (which stops it).
+    """
+    remaining = max_chars
+    try:
+        for piece in pieces:
+            if not piece:
+                continue
+            if len(piece) >= remaining:
+                yield piece[:remaining]
+                return
+            remaining -= len(piece)
+            yield piece
+    finally:
+        close = getattr(pieces, 'close', None)
+        if close is not None:
+            close()
+
+
+# ------------------ PDF ------------------ #
+
+def _read_pages(path, start, stop, max_chars):
+    """
+    Pool task: text of pages [start, stop) of the PDF at `path`, stopping
+    early once max_chars characters were collected.
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    texts, total = [], 0
+    for i in range(start, stop):
+        t = reader.pages[i].extract_text() or ''
+        texts.append(t)
+        total += len(t)
+        if total >= max_chars:
+            break
+    return texts
+
+
+def _iter_pages_parallel(path, page_count, max_chars):
+    pool = _get_pool()
+    batches = [(s, min(s + PDF_PAGES_PER_TASK, page_count)) for s in range(0, page_count, PDF_PAGES_PER_TASK)]
+    window = max(1, PDF_WORKERS * 2)
+    pending = []
+    try:
+        # Keep a bounded window of batches in flight and yield in page order,
+        # so an early stop leaves most of a long document unread.
+        for start, stop in batches[:window]:
+            pending.append(pool.submit(_read_pages, path, start, stop, max_chars))
+        next_batch = window
+        while pending:
+            texts = pending.pop(0).result()
+            if next_batch < len(batches):
+                start, stop = batches[next_batch]
+                pending.append(pool.submit(_read_pages, path, start, stop, max_chars))
+                next_batch += 1
+            for t in texts:
+                yield t
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_pdf_pages(path, max_pages=PDF_MAX_PAGES, max_chars=EXTRACT_MAX_CHARS):
+    """
+    Yield the text of each page (first max_pages only). Long documents are
+    split into batches of PDF_PAGES_PER_TASK pages on a process pool; the
+    consumer stopping early stops the remaining batches.
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    page_count = min(len(reader.pages), max_pages)
+    done = 0
+    if page_count >= PDF_PARALLEL_MIN_PAGES and PDF_WORKERS > 1:
+        try:
+            for t in _iter_pages_parallel(path, page_count, max_chars):
+                done += 1
+                yield t
+            return
+        except BrokenProcessPool as e:
+            # A worker died; start a fresh pool next time and finish this one serially.
+            _discard_pool(_pool)
+            print("PDF worker pool broke, reading serially:", e)
+        except Exception as e:
+            # Pool unavailable (e.g. no process support): finish serially.
+            print("Parallel PDF extraction failed, reading serially:", e)
+    for i in range(done, page_count):
+        yield reader.pages[i].extract_text() or ''
+
+
+def _iter_pdf(file, max_chars):
+    # Pool workers read the document from a temp file, not a pickled copy per task.
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(file.stream, out)
+        first = True
+        for t in iter_pdf_pages(path, max_chars=max_chars):
+            if t:
+                yield t if first else " " + t
+                first = False
+    finally:
+        os.remove(path)
+
+
+# ------------------ TXT / CSV ------------------ #
+
+def _iter_raw(file):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    while True:
+        data = file.stream.read(READ_BYTES)
+        if not data:
+            break
+        yield decoder.decode(data)
+    yield decoder.decode(b'', final=True)
+
+
+def _iter_csv(file):
+    import pandas as pd
+    first = True
+    for chunk in pd.read_csv(file, chunksize=CSV_CHUNK_ROWS):
+        values = chunk.astype(str).values.flatten()
+        if len(values):
+            yield ("" if first else " ") + " ".join(map(str, values))
+            first = False
+
+
+def _with_raw_fallback(file, pieces):
+    """
+    Yield from a parser; if it fails before producing anything, decode the
+    upload as plain text instead (the old behaviour for unreadable files).
+    """
+    produced = False
+    try:
+        for piece in pieces:
+            produced = True
+            yield piece
+    except Exception:
+        if produced:
+            return
+        file.stream.seek(0)
+        yield from _iter_raw(file)
+    finally:
+        pieces.close()
+
+
+def iter_text(file, ext, max_chars=EXTRACT_MAX_CHARS):
+    """
+    Stream the text of an uploaded txt/csv/pdf file in pieces ("".join them
+    for the full text), stopping after max_chars characters. Returns None
+    for unsupported extensions.
+    """
+    file.stream.seek(0)
+    if ext == 'txt':
+        pieces = _iter_raw(file)
+    elif ext == 'csv':
+        pieces = _with_raw_fallback(file, _iter_csv(file))
+    elif ext == 'pdf':
+        pieces = _with_raw_fallback(file, _iter_pdf(file, max_chars))
+    else:
+        return None
+    return _capped(pieces, max_chars)
+
+
+def extract_text(file, ext, max_chars=EXTRACT_MAX_CHARS):
+    pieces = iter_text(file, ext, max_chars)
+    return "".join(pieces) if pieces is not None else None